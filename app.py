@@ -1,65 +1,780 @@
-from flask import Flask, render_template
-from dataservice import fetch_transaction_balances
-from filter import filter_trades_by_addresses
-from processing import calculate_stats, process_builder_trades
+from flask import Flask, Response, g, jsonify, render_template, request, url_for
+from archive import TradeArchive, WINDOWS
+from cache_backends import make_backend
+from events import EventBroker, builder_deltas, format_event
+import builders as builder_registry
+import jsonapi
+import metrics
+from dataservice import (
+    fetch_sharded,
+    fetch_trade_details,
+    merge_block_keys,
+    splice_trades,
+    plan_shards,
+    stream_transaction_balances,
+    window_start_block,
+)
+from models import normalize_trades
+from pipeline import IngestPass
+from processing import StatsAccumulator, calculate_stats
+import subscription
+import dataservice
+from singleflight import SingleFlight
+from snapshot import Snapshot
+from contextlib import contextmanager
+import os
+import random
+import threading
 import time
+import zlib
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows; every process then fetches for itself
+    fcntl = None
 
 app = Flask(__name__)
 
 # Cache for API data
-_data_cache = None
-_cache_timestamp = None
 CACHE_TTL = 300  # Cache for 5 minutes (300 seconds)
+REFRESH_AHEAD = 60  # Start a background refresh this many seconds before the cache expires
+REFRESH_CHECK_INTERVAL = 5  # How often the background refresher checks the cache age
+FETCH_LIMIT = 20000  # Number of latest trades the dashboard covers
+INCREMENTAL_REFRESH = True  # Only fetch blocks newer than the cached snapshot on refresh
+# Filter by builder address in the GraphQL query instead of only after download.
+# Smaller payloads, but the API then returns only the builders' balance rows, so
+# the address and reason-code tables no longer include counterparties.
+SERVER_SIDE_FILTER = False
+# Split each fetch into this many concurrent queries (see dataservice.plan_shards).
+# "blocks" shards need the previous snapshot's block range, so the first fetch
+# is a single query; "builders" shards need SERVER_SIDE_FILTER.
+FETCH_SHARDS = int(os.environ.get("FETCH_SHARDS", "1"))
+FETCH_SHARD_BY = os.environ.get("FETCH_SHARD_BY", "blocks")
+# Snapshot persisted after every successful fetch and loaded on startup; empty disables it
+SNAPSHOT_PATH = os.environ.get("SNAPSHOT_PATH", "snapshot.bin")
+# Share SNAPSHOT_PATH between the worker processes of a host (e.g. gunicorn -w 4):
+# fetches take a lock file so only one worker calls the API per refresh, and
+# the others adopt the snapshot file it writes instead of fetching themselves
+SHARED_CACHE = os.environ.get("SHARED_CACHE", "1") != "0"
+# Cache shared between hosts: "redis://host:6379/0", "file:/shared/dir", "memory"
+# or "fakeredis" (see cache_backends.make_backend). Every fetch is published
+# there, and hosts adopt a newer snapshot from it instead of fetching. Empty disables it.
+CACHE_BACKEND = os.environ.get("CACHE_BACKEND", "")
+CACHE_BACKEND_TTL = 3600  # Seconds a published snapshot stays in the shared cache
+BUILDER_PAGE_SIZE = 50  # Trades per page of the builder drill-down
+MAX_BUILDER_PAGE_SIZE = 500
+# Transactions whose drill-down details (the fields the dashboard's query
+# leaves out, fetched a builder page at a time on demand) are kept in memory
+TRADE_DETAILS_CACHE_SIZE = 5000
+# calculate_stats() fields left out of /api/stats unless asked for with
+# fields=, since they list every address or block in the snapshot
+API_STATS_EXCLUDED = ("unique_addresses", "unique_blocks", "balance_change_by_address")
+# "poll" refreshes with HTTP queries only. "subscription" also keeps a
+# WebSocket subscription open and merges trades as blocks are indexed (needs
+# the websockets package); polling remains the fallback if the stream stalls.
+INGESTION_MODE = os.environ.get("INGESTION_MODE", "poll")
+SUBSCRIPTION_URL = os.environ.get("SUBSCRIPTION_URL", subscription.BITQUERY_WS_URL)
+# Streamed updates arrive every second or so; write the snapshot file and
+# publish to the cache backend at most this often (seconds)
+SUBSCRIPTION_PERSIST_INTERVAL = 30
+# SQLite archive of every fetched trade, for the 1h/24h/7d views; empty disables it
+ARCHIVE_PATH = os.environ.get("ARCHIVE_PATH", "archive.sqlite3")
+ARCHIVE_RETENTION = 8 * 86400  # Drop archived trades older than this (seconds)
 
+_snapshot = None  # Current Snapshot; replaced wholesale, never mutated
+_snapshot_version = 0
+_snapshot_lock = threading.Lock()
+_refresh_wakeup = threading.Event()
+_refresh_in_progress = threading.Event()
+_refresher_thread = None
+_refresher_lock = threading.Lock()
+_fetch_flight = SingleFlight()  # Coalesces concurrent API fetches into one
+_warm_start_done = False
+_warm_start_lock = threading.Lock()
+_archive = None
+_archive_lock = threading.Lock()
+_shared_file_state = None  # (inode, mtime, size) of the snapshot file last written or adopted
+_cache_backend = None
+_cache_backend_lock = threading.Lock()
+_ingest_lock = threading.Lock()
+_last_persisted_at = 0.0
+_subscription = None
+_subscription_lock = threading.Lock()
+_events = EventBroker()  # Live dashboard updates (/events)
+_trade_details = {}  # Lower-cased tx hash -> process_trade_details() rows, oldest first
+_trade_details_lock = threading.Lock()
+_details_flight = SingleFlight()
 
-def load_data(force_refresh=False, use_cache_only=False):
+_cache_requests = metrics.counter(
+    "cache_requests_total",
+    "Snapshot lookups by result: hit, stale (served while a refresh runs) or miss (fetched, or nothing cached)",
+)
+_http_duration = metrics.histogram("http_request_duration_seconds", "Request latency by endpoint and status")
+_trades_fetched = metrics.counter("trades_fetched_total", "Trades received by polled fetches, before filtering")
+_trades_kept = metrics.counter("trades_kept_total", "Fetched trades that passed the builder filter")
+
+
+def get_snapshot():
+    """Return the current cache snapshot, or None if nothing has been fetched yet."""
+    return _snapshot
+
+
+def _warm_start():
+    """Load the snapshot persisted by a previous run, once per process."""
+    global _snapshot, _snapshot_version, _warm_start_done, _shared_file_state
+
+    if _warm_start_done:
+        return
+    with _warm_start_lock:
+        if _warm_start_done:
+            return
+        _warm_start_done = True
+        if not SNAPSHOT_PATH or _snapshot is not None:
+            return
+        started = time.perf_counter()
+        state = _snapshot_file_state()
+        # Shared workers map the file and decode trades only when a request needs them
+        snapshot = Snapshot.load(SNAPSHOT_PATH, lazy=_shared_cache_enabled())
+        if snapshot is None:
+            return
+        _shared_file_state = state
+        with _snapshot_lock:
+            if _snapshot is None:
+                _snapshot_version = max(_snapshot_version, snapshot.version)
+                _snapshot = snapshot
+        print(
+            f"Loaded snapshot version {snapshot.version} from {SNAPSHOT_PATH} "
+            f"in {(time.perf_counter() - started) * 1000:.1f}ms (age: {snapshot.age:.1f}s)"
+        )
+
+
+def _persist(snapshot):
+    """Write snapshot to SNAPSHOT_PATH; failures only cost the next warm start."""
+    global _shared_file_state, _last_persisted_at
+
+    _last_persisted_at = time.time()
+    if not SNAPSHOT_PATH:
+        return
+    try:
+        with metrics.span("persist"):
+            snapshot.save(SNAPSHOT_PATH)
+        # Our own write; nothing for this process to adopt
+        _shared_file_state = _snapshot_file_state()
+    except Exception as e:
+        print(f"Could not persist snapshot to {SNAPSHOT_PATH}: {e}")
+
+
+def get_cache_backend():
+    """Return the CACHE_BACKEND backend, creating it on first use, or None if there is none."""
+    global _cache_backend
+
+    if not CACHE_BACKEND:
+        return None
+    if _cache_backend is None:
+        with _cache_backend_lock:
+            if _cache_backend is None:
+                _cache_backend = make_backend(CACHE_BACKEND, ttl=CACHE_BACKEND_TTL)
+    return _cache_backend
+
+
+def _publish(snapshot):
+    """Put snapshot in the shared cache backend, if one is configured."""
+    try:
+        backend = get_cache_backend()
+        if backend is None:
+            return
+        with metrics.span("publish"):
+            backend.set_snapshot(snapshot)
+    except Exception as e:
+        print(f"Could not publish snapshot to cache backend {CACHE_BACKEND}: {e}")
+
+
+def _adopt_backend_snapshot():
     """
-    Fetch data directly from the API and filter by addresses. Uses caching to avoid repeated API calls.
+    Swap in the snapshot another host published to the cache backend, if it is newer than ours.
+
+    Returns the adopted Snapshot, or None if there was nothing newer.
+    """
+    try:
+        backend = get_cache_backend()
+        if backend is None:
+            return None
+        stored = backend.freshness()
+        current = _snapshot
+        if stored is None or (current is not None and stored <= current.freshness):
+            return None
+        snapshot = backend.get_snapshot()
+    except Exception as e:
+        print(f"Could not read cache backend {CACHE_BACKEND}: {e}")
+        return None
+    if snapshot is None:
+        return None
+    return _swap_in(snapshot, "the cache backend")
+
+
+def _swap_in(snapshot, source):
+    """Publish a snapshot fetched elsewhere unless ours is at least as recent."""
+    global _snapshot, _snapshot_version
+
+    with _snapshot_lock:
+        # Later fetches here must not reuse a version number another process issued
+        _snapshot_version = max(_snapshot_version, snapshot.version)
+        if _snapshot is not None and snapshot.freshness <= _snapshot.freshness:
+            return None
+        previous, _snapshot = _snapshot, snapshot
+    print(f"Adopted snapshot version {snapshot.version} from {source} (age: {snapshot.age:.1f}s)")
+    _announce(previous, snapshot)
+    return snapshot
+
+
+def _shared_cache_enabled():
+    return SHARED_CACHE and bool(SNAPSHOT_PATH) and fcntl is not None
+
+
+def _snapshot_file_state():
+    """Identity of the current snapshot file, to notice when another process replaced it."""
+    try:
+        stat = os.stat(SNAPSHOT_PATH)
+    except OSError:
+        return None
+    return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+
+@contextmanager
+def _host_fetch_lock(wait):
+    """
+    Hold the host-wide fetch lock (an flock on SNAPSHOT_PATH.lock).
+
+    Yields True once the lock is held, or False straight away if wait is False
+    and another process holds it. The lock is released if the process dies.
+    """
+    with open(f"{SNAPSHOT_PATH}.lock", "a") as lock_file:
+        flags = fcntl.LOCK_EX if wait else fcntl.LOCK_EX | fcntl.LOCK_NB
+        try:
+            fcntl.flock(lock_file.fileno(), flags)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+def _adopt_shared_snapshot():
+    """
+    Swap in the snapshot file another worker wrote, if it is newer than ours.
+
+    Only stats are decoded up front; the file stays mapped read-only and the
+    trades are decoded on demand, so followers don't each hold a full copy.
+
+    Returns the adopted Snapshot, or None if there was nothing newer.
+    """
+    global _shared_file_state
+
+    state = _snapshot_file_state()
+    if state is None or state == _shared_file_state:
+        return None
+    snapshot = Snapshot.load(SNAPSHOT_PATH, lazy=True)
+    if snapshot is None:
+        return None
+    _shared_file_state = state
+    return _swap_in(snapshot, "another worker")
+
+
+def get_archive():
+    """Return the TradeArchive, opening it on first use, or None if archiving is disabled."""
+    global _archive
+
+    if not ARCHIVE_PATH:
+        return None
+    if _archive is None:
+        with _archive_lock:
+            if _archive is None:
+                try:
+                    _archive = TradeArchive(ARCHIVE_PATH)
+                except Exception as e:
+                    print(f"Could not open trade archive {ARCHIVE_PATH}: {e}")
+                    return None
+    return _archive
+
+
+def _archive_trades(trades):
+    """Append newly fetched trades to the archive; failures only cost window history."""
+    archive = get_archive()
+    if archive is None:
+        return
+    try:
+        with metrics.span("archive"):
+            added = archive.add_trades(trades)
+            archive.prune(ARCHIVE_RETENTION)
+        print(f"Archived {added} new trades")
+    except Exception as e:
+        print(f"Could not archive trades to {ARCHIVE_PATH}: {e}")
+
+
+def _needs_refresh(snapshot):
+    """
+    True once a snapshot is close enough to expiry that it should be re-fetched,
+    or if it was built with a builder registry that has since been reloaded.
+    """
+    return (
+        snapshot is None or snapshot.age >= CACHE_TTL - REFRESH_AHEAD
+        or snapshot.registry_version != builder_registry.get_registry().version
+    )
+
+
+def _fetch_and_store(full=False, fresh_after=None):
+    """
+    Fetch fresh data from the API, filter it and publish it as the new snapshot.
+
+    Concurrent callers (cold-cache visitors, /refresh clicks, the background
+    refresher) share a single in-flight fetch and all receive its result. With
+    SHARED_CACHE, so do the other worker processes on the host.
+
+    Args:
+        full: If True, re-fetch the whole window instead of only newer blocks,
+            waiting for another worker's fetch to finish rather than skipping
+        fresh_after: Accept a snapshot another worker fetched after this time
+            instead of fetching again (default: one that isn't due a refresh)
+
+    Returns the new Snapshot, or None if the API returned nothing.
+    """
+    snapshot, shared = _fetch_flight.do("snapshot", lambda: _do_fetch_and_store(full, fresh_after))
+    if shared:
+        print(f"Joined in-flight fetch ({_fetch_flight.coalesced} callers coalesced so far)")
+    return snapshot
+
+
+def _do_fetch_and_store(full, fresh_after):
+    if not _shared_cache_enabled():
+        return _fetch_unless_fresh(full, fresh_after)
+
+    with _host_fetch_lock(wait=full) as acquired:
+        if not acquired:
+            print("Another worker is fetching; will adopt its snapshot")
+            return _snapshot
+        # Whoever held the lock before us may have just written what we need
+        _adopt_shared_snapshot()
+        return _fetch_unless_fresh(full, fresh_after)
+
+
+def _fetch_unless_fresh(full, fresh_after):
+    """Fetch from the API, unless another host has already published a fresh enough snapshot."""
+    _adopt_backend_snapshot()
+    snapshot = _snapshot
+    if snapshot is not None:
+        if fresh_after is not None:
+            fresh = snapshot.fetched_at >= fresh_after
+        else:
+            fresh = not _needs_refresh(snapshot)
+        if fresh:
+            return snapshot
+    return _fetch_from_api(full)
+
+
+def _fetch_from_api(full):
+    _refresh_in_progress.set()
+    try:
+        previous = _snapshot
+        # One registry for the whole fetch, even if the file is reloaded meanwhile
+        registry = builder_registry.get_registry()
+        incremental = (
+            INCREMENTAL_REFRESH and not full
+            and previous is not None and previous.block_cursor is not None
+        )
+        if incremental and previous.registry_version != registry.version:
+            # Trades of newly added builders were filtered out of the window
+            print("Builder registry changed; re-fetching the whole window")
+            incremental = False
+        addresses = registry.addresses if SERVER_SIDE_FILTER else None
+        # The cursor block is fetched again, as it may have been indexed only
+        # in part last time; the trades already held are deduplicated
+        since_block = previous.block_cursor - 1 if incremental else None
+        shards = _plan_fetch(previous, since_block, addresses)
+        if len(shards) > 1:
+            print(f"Fetching {'trades from block ' + str(previous.block_cursor) if incremental else 'fresh data'} "
+                  f"from API in {len(shards)} shards...")
+            stream = iter(fetch_sharded(shards, limit=FETCH_LIMIT)["data"]["EVM"]["DEXTrades"])
+        elif incremental:
+            print(f"Fetching trades from block {previous.block_cursor} on from API...")
+            stream = stream_transaction_balances(
+                limit=FETCH_LIMIT, since_block=since_block, addresses=addresses
+            )
+        else:
+            print("Fetching fresh data from API...")
+            stream = stream_transaction_balances(limit=FETCH_LIMIT, addresses=addresses)
+
+        # Trades are decoded one at a time as the response arrives and go
+        # through a single pass that filters them and, for a full fetch, also
+        # aggregates and indexes the ones kept. Still filtered locally when
+        # SERVER_SIDE_FILTER is on, as a verification pass.
+        kind = "incremental" if incremental else "full"
+        with metrics.span("fetch", kind=kind):
+            upstream = metrics.IterationTimer(stream, None)
+            start = time.perf_counter()
+            ingest = IngestPass(registry, aggregate=not incremental).feed(upstream)
+            metrics.observe_span("ingest_pass", time.perf_counter() - start - upstream.seconds, kind=kind)
+        _trades_fetched.inc(sum(ingest.block_counts.values()))
+        _trades_kept.inc(len(ingest.trades))
+        return _ingest(
+            ingest.trades, ingest.block_keys, incremental, registry=registry,
+            accumulator=ingest.accumulator, builder_index=ingest.builder_index,
+        )
+    finally:
+        _refresh_in_progress.clear()
+
+
+def _plan_fetch(previous, since_block, addresses):
+    """The shards of the next fetch, per FETCH_SHARDS and FETCH_SHARD_BY; empty for a single query."""
+    if FETCH_SHARDS <= 1:
+        return []
+    by = FETCH_SHARD_BY
+    if by == "builders" and not addresses:
+        print("Sharding by builder needs SERVER_SIDE_FILTER; sharding by block range instead")
+        by = "blocks"
+    return plan_shards(
+        FETCH_SHARDS, by=by,
+        since_block=since_block,
+        addresses=addresses,
+        block_counts=previous.block_counts if previous is not None else None,
+        limit=FETCH_LIMIT,
+    )
+
+
+def _ingest(trades, block_keys, incremental, persist=True, registry=None, accumulator=None, builder_index=None):
+    """
+    Publish newly received trades as the next snapshot.
+
+    Args:
+        trades: The filtered trades
+        block_keys: trade_key()s of every trade of the response they came
+            from, kept or not, per block (see pipeline.IngestPass)
+        incremental: If True, merge them into the current snapshot; otherwise
+            they replace it as the whole window
+        persist: If False, only write the snapshot file and publish to the cache
+            backend when the last write is SUBSCRIPTION_PERSIST_INTERVAL old
+        registry: BuilderRegistry the trades were filtered with, for a full
+            ingest (the current one if None); merges keep the previous snapshot's
+        accumulator, builder_index: Aggregates and address index of trades
+            already built while they were filtered (see pipeline.IngestPass),
+            for a full ingest; computed here if None
+
+    Returns the new Snapshot.
+    """
+    global _snapshot, _snapshot_version
+
+    # Polled fetches and subscription batches both fold into the previous
+    # snapshot's accumulator, so merges must not interleave
+    with _ingest_lock:
+        previous = _snapshot
+        received = trades
+        block_counts = {number: len(keys) for number, keys in block_keys.items()}
+        fetched_count = sum(block_counts.values())
+        block_cursor = max(block_counts, default=None)
+
+        # A delta that fills the whole limit already is a complete window on its own
+        if incremental and previous is not None and fetched_count < FETCH_LIMIT:
+            if block_cursor is None or (
+                previous.block_cursor is not None and block_cursor < previous.block_cursor
+            ):
+                block_cursor = previous.block_cursor
+            # Trades delivered again (overlapping batches, a block fetched
+            # again because it had arrived in part) are counted once
+            merged_counts, merged_keys = merge_block_keys(previous.block_counts, previous.block_keys, block_keys)
+            start_block = window_start_block(merged_counts, FETCH_LIMIT)
+            in_window = lambda number: start_block is None or number >= start_block
+            block_counts = {number: count for number, count in merged_counts.items() if in_window(number)}
+            block_keys = {number: keys for number, keys in merged_keys.items() if in_window(number)}
+            # Fold only the difference into a copy-on-write copy of the running
+            # stats and address index; the previous snapshot's stay as they
+            # are in case publishing fails
+            with metrics.span("merge"):
+                accumulator = previous.accumulator.copy()
+                added, evicted = accumulator.merge(trades, start_block)
+                trades = splice_trades(previous.trades, added, evicted)
+            builder_index = accumulator.index
+            print(f"Merged {len(added)} new trades from {fetched_count} fetched, evicted {len(evicted)}")
+        else:
+            if accumulator is None:
+                builder_index = None
+                with metrics.span("accumulate", kind="full"):
+                    accumulator = StatsAccumulator(registry).update(trades)
+
+        # Archived before publishing, so window views of the new snapshot see
+        # these trades. Already archived trades are skipped, so a full refresh
+        # can pass them all, and a merge its whole delta, trades already in
+        # the window or too old for it included
+        _archive_trades(received)
+
+        data = {"data": {"EVM": {"DEXTrades": trades}}}
+        with _snapshot_lock:
+            _snapshot_version += 1
+            # Builds the published stats; the address index comes with the accumulator
+            with metrics.span("snapshot_build"):
+                _snapshot = Snapshot(
+                    data, _snapshot_version, block_cursor=block_cursor, block_counts=block_counts,
+                    block_keys=block_keys, accumulator=accumulator, builder_index=builder_index,
+                )
+        snapshot = _snapshot
+    print(f"Data cached successfully (version {snapshot.version})")
+    _announce(previous, snapshot)
+    if persist or time.time() - _last_persisted_at >= SUBSCRIPTION_PERSIST_INTERVAL:
+        _persist(snapshot)
+        _publish(snapshot)
+    return snapshot
+
+
+def _builders_event(previous, snapshot):
+    """
+    Payload of a "builders" event: what changed in the builder summary from previous to snapshot.
+
+    "addresses" lists every builder in the new summary, so a page can tell
+    that builders were added or dropped and reload its table.
+    """
+    stats = snapshot.stats or {}
+    return {
+        "version": snapshot.version,
+        "fetched_at": snapshot.fetched_at_iso,
+        "latest": stats.get("date_range", {}).get("latest"),
+        "addresses": [row["address"].lower() for row in stats.get("builder_summary", [])],
+        "builders": builder_deltas(previous.stats if previous is not None else None, stats),
+    }
+
+
+def _announce(previous, snapshot):
+    """Push the builder rows that changed with a newly published snapshot to live dashboards."""
+    if not _events.subscriber_count:
+        return
+    try:
+        _events.publish("builders", _builders_event(previous, snapshot), event_id=snapshot.version)
+    except Exception as e:
+        print(f"Could not publish dashboard update: {e}")
+
+
+def _ingest_subscription_trades(raw_trades):
+    """SubscriptionIngestor callback: merge a batch of pushed trades into the snapshot."""
+    if _snapshot is None:
+        # Raised rather than dropped, so the subscription backfills these blocks later
+        raise RuntimeError("No snapshot to merge subscription trades into yet")
+    ingest = IngestPass(aggregate=False).feed(raw_trades)
+    if not ingest.block_keys:
+        return
+    _ingest(ingest.trades, ingest.block_keys, incremental=True, persist=False)
+
+
+def _start_subscription():
+    """Start the SubscriptionIngestor once the first snapshot exists; returns it, or None."""
+    global _subscription
+
+    snapshot = _snapshot
+    if INGESTION_MODE != "subscription" or snapshot is None:
+        return None
+    with _subscription_lock:
+        if _subscription is None:
+            if not subscription.available():
+                print("INGESTION_MODE=subscription needs websockets (pip install websockets); polling instead")
+                return None
+            addresses = builder_registry.get_registry().addresses if SERVER_SIDE_FILTER else None
+            _subscription = subscription.SubscriptionIngestor(
+                _ingest_subscription_trades,
+                backfill=lambda since_block: stream_transaction_balances(
+                    limit=FETCH_LIMIT, since_block=since_block, addresses=addresses
+                ),
+                url=SUBSCRIPTION_URL,
+                addresses=addresses,
+                since_block=snapshot.block_cursor,
+            )
+        _subscription.start()
+    return _subscription
+
+
+def _refresh_retry_delay(failures):
+    """
+    Seconds before retrying after failures consecutive failed refreshes:
+    REFRESH_CHECK_INTERVAL doubled per further failure, jittered, and capped
+    at the refresh interval.
+    """
+    delay = min(REFRESH_CHECK_INTERVAL * 2 ** (failures - 1), CACHE_TTL - REFRESH_AHEAD)
+    # Jitter so hosts that failed together don't retry in lockstep
+    return delay * random.uniform(0.5, 1.0)
+
+
+def _refresher_loop():
+    """Keep the cache warm so that requests never wait on the API."""
+    failures = 0
+    retry_at = 0.0
+    while True:
+        _refresh_wakeup.wait(REFRESH_CHECK_INTERVAL)
+        _refresh_wakeup.clear()
+        if _shared_cache_enabled():
+            try:
+                _adopt_shared_snapshot()
+            except Exception as e:
+                print(f"Could not adopt shared snapshot: {e}")
+        _adopt_backend_snapshot()
+        if _subscription is None:
+            _start_subscription()
+        # A stale snapshot nudges the refresher on every request; while the
+        # API is failing, only the backoff decides when to try again
+        if not _needs_refresh(_snapshot) or time.monotonic() < retry_at:
+            continue
+        try:
+            _fetch_and_store()
+        except Exception as e:
+            # Keep serving the previous snapshot and back off
+            failures += 1
+            delay = _refresh_retry_delay(failures)
+            retry_at = time.monotonic() + delay
+            print(f"Background refresh failed: {e}; retrying in {delay:.0f}s")
+        else:
+            failures = 0
+            retry_at = 0.0
+
+
+def start_background_refresher():
+    """Start the background refresher thread once per process."""
+    global _refresher_thread
+
+    with _refresher_lock:
+        if _refresher_thread is not None and _refresher_thread.is_alive():
+            return
+        _refresher_thread = threading.Thread(
+            target=_refresher_loop, name="cache-refresher", daemon=True
+        )
+        _refresher_thread.start()
+
+
+def load_snapshot(force_refresh=False, use_cache_only=False):
+    """
+    Return the current cache Snapshot, fetching from the API if needed.
+
+    Once the cache is populated, requests are always answered from the current
+    snapshot; a background thread re-fetches shortly before the snapshot expires
+    and swaps the new one in, so a stale snapshot keeps being served while the
+    refresh is in flight.
     
     Args:
         force_refresh: If True, always fetch fresh data from API
         use_cache_only: If True, only return cached data, never call API (for filtering operations)
     
     Returns:
-        Cached data if available, or fresh data from API
+        The cached Snapshot if available, a freshly fetched one, or None
     """
-    global _data_cache, _cache_timestamp
+    _warm_start()
+    snapshot = _snapshot
     
     # If use_cache_only is True, only return cached data (never call API)
     if use_cache_only:
-        if _data_cache is not None:
-            age = time.time() - _cache_timestamp if _cache_timestamp else 0
-            print(f"Using cached data for filtering (age: {age:.1f}s)")
-            return _data_cache
+        if snapshot is not None:
+            _cache_requests.inc(result="stale" if _needs_refresh(snapshot) else "hit")
+            print(f"Using cached data for filtering (age: {snapshot.age:.1f}s)")
         else:
+            _cache_requests.inc(result="miss")
             print("No cached data available for filtering")
-            return None
+        return snapshot
+    
+    start_background_refresher()
     
-    # Check if we have valid cached data
-    if not force_refresh and _data_cache is not None and _cache_timestamp is not None:
-        age = time.time() - _cache_timestamp
-        if age < CACHE_TTL:
-            print(f"Using cached data (age: {age:.1f}s)")
-            return _data_cache
+    # Serve whatever we have, nudging the refresher if the snapshot is getting old
+    if not force_refresh and snapshot is not None:
+        if _needs_refresh(snapshot):
+            _refresh_wakeup.set()
+            _cache_requests.inc(result="stale")
+            print(f"Using stale cached data while refreshing (age: {snapshot.age:.1f}s)")
+        else:
+            _cache_requests.inc(result="hit")
+            print(f"Using cached data (age: {snapshot.age:.1f}s)")
+        return snapshot
     
-    # Fetch fresh data
+    _cache_requests.inc(result="miss")
+    # Cold cache or forced refresh: fetch the whole window synchronously
     try:
-        print("Fetching fresh data from API...")
-        data = fetch_transaction_balances()
-        if data:
-            data = filter_trades_by_addresses(data)
-            # Update cache
-            _data_cache = data
-            _cache_timestamp = time.time()
-            print("Data cached successfully")
-        return data
+        return _fetch_and_store(full=True, fresh_after=time.time() if force_refresh else None)
     except Exception as e:
         print(f"Error fetching data: {e}")
         # If we have stale cache, use it as fallback
-        if _data_cache is not None:
+        if snapshot is not None:
             print("Using stale cache as fallback")
-            return _data_cache
+        return snapshot
+
+
+def load_data(force_refresh=False, use_cache_only=False):
+    """
+    Fetch data directly from the API and filter by addresses. Uses caching to avoid repeated API calls.
+
+    See load_snapshot() for the caching behaviour and arguments.
+    
+    Returns:
+        Cached data if available, or fresh data from API
+    """
+    snapshot = load_snapshot(force_refresh=force_refresh, use_cache_only=use_cache_only)
+    return snapshot.data if snapshot is not None else None
+
+
+def get_trade_details(tx_hashes):
+    """
+    Drill-down details of the trades of the given transactions, from memory
+    or from one query for the transactions not looked up before.
+
+    Returns:
+        {lower-cased tx hash: process_trade_details() rows}, with [] for
+        transactions the API has no trades for, or None if the query failed
+    """
+    wanted = list(dict.fromkeys(tx_hash.lower() for tx_hash in tx_hashes))
+    with _trade_details_lock:
+        details = {tx_hash: _trade_details[tx_hash] for tx_hash in wanted if tx_hash in _trade_details}
+    missing = tuple(tx_hash for tx_hash in wanted if tx_hash not in details)
+    if not missing:
+        return details
+
+    try:
+        fetched, _ = _details_flight.do(missing, lambda: fetch_trade_details(missing))
+    except Exception as e:
+        print(f"Error fetching trade details: {e}")
         return None
+    if fetched is None:
+        return None
+
+    with _trade_details_lock:
+        for tx_hash in missing:
+            details[tx_hash] = _trade_details[tx_hash] = fetched.get(tx_hash, [])
+        while len(_trade_details) > TRADE_DETAILS_CACHE_SIZE:
+            del _trade_details[next(iter(_trade_details))]
+    return details
+
+
+def _with_cache_headers(body, snapshot=None, etag=None):
+    """
+    Attach the age of the served snapshot to a response.
+
+    When the response was rendered from snapshot, it is also given the
+    snapshot's ETag (or etag, for one of several representations of it) and
+    Last-Modified and turned into a 304 if the client already has that version.
+    """
+    response = app.make_response(body)
+    current = _snapshot
+    if current is not None:
+        response.headers["X-Cache-Age"] = f"{current.age:.0f}"
+        response.headers["X-Cache-Version"] = str(current.version)
+    response.headers["X-Cache-Refreshing"] = "1" if _refresh_in_progress.is_set() else "0"
+    if snapshot is not None:
+        response.set_etag(etag or snapshot.etag)
+        response.last_modified = snapshot.last_modified
+        response.cache_control.no_cache = True
+        response = response.make_conditional(request)
+    return response
+
+
+def _window_stats(window):
+    with metrics.span("calculate_stats", window=window):
+        return calculate_stats(None, window=window, archive=get_archive())
+
+
+def _render(template, **context):
+    """render_template(), timed as a render span."""
+    with metrics.span("render", template=template):
+        return render_template(template, **context)
 
 
 def get_builder_trades(data, builder_address):
@@ -75,83 +790,368 @@ def get_builder_trades(data, builder_address):
         return []
     
     builder_address_lower = builder_address.lower()
-    builder_trades = []
-    
-    for trade in trades:
-        if not isinstance(trade, dict):
-            continue
-        
-        # Check if this trade involves the builder
-        raw_balances = trade.get("joinTransactionBalances")
-        balance_joins = []
-        
-        if raw_balances is not None:
-            if isinstance(raw_balances, list):
-                balance_joins = raw_balances
-            elif isinstance(raw_balances, dict):
-                if "TokenBalance" in raw_balances:
-                    balance_joins = [raw_balances]
-                else:
-                    balance_joins = [v for v in raw_balances.values() if isinstance(v, dict)]
-        
-        # Check if builder is involved in this trade
-        builder_involved = False
-        for balance_join in balance_joins:
-            if not isinstance(balance_join, dict):
-                continue
-            token_balance = balance_join.get("TokenBalance", {})
-            if not token_balance or not isinstance(token_balance, dict):
-                continue
-            address = token_balance.get("Address", "")
-            if address.lower() == builder_address_lower:
-                builder_involved = True
-                break
-        
-        if builder_involved:
-            builder_trades.append(trade)
-    
-    return builder_trades
+    return [trade for trade in normalize_trades(trades) if trade.involves(builder_address_lower)]
+
+
+@app.before_request
+def _start_timer():
+    g.request_started = time.perf_counter()
+
+
+@app.after_request
+def _record_request(response):
+    started = g.get("request_started")
+    if started is not None:
+        # The matched route, not the path, so builder addresses don't each get a series
+        _http_duration.observe(
+            time.perf_counter() - started,
+            endpoint=request.endpoint or "unmatched", method=request.method, status=str(response.status_code),
+        )
+    return response
+
+
+def _snapshot_gauge(read):
+    def callback():
+        snapshot = _snapshot
+        return read(snapshot) if snapshot is not None else None
+    return callback
+
+
+def _subscription_stat(name):
+    def callback():
+        ingestor = _subscription
+        return ingestor.stats()[name] if ingestor is not None else None
+    return callback
+
+
+def _client_stat(name):
+    # Only once a query has created the client
+    return lambda: dataservice._client.stats()[name] if dataservice._client is not None else None
+
+
+metrics.gauge("snapshot_version", "Version of the snapshot being served", _snapshot_gauge(lambda snapshot: snapshot.version))
+metrics.gauge("snapshot_age_seconds", "Age of the snapshot being served", _snapshot_gauge(lambda snapshot: snapshot.age))
+metrics.gauge(
+    "snapshot_trades", "Filtered trades in the snapshot being served",
+    _snapshot_gauge(lambda snapshot: (snapshot.stats or {}).get("total_transactions")),
+)
+metrics.gauge("refresh_in_progress", "1 while an API fetch is running", lambda: int(_refresh_in_progress.is_set()))
+metrics.counter("fetch_executions_total", "API fetches run", lambda: _fetch_flight.executions)
+metrics.counter("fetch_coalesced_total", "Callers that joined an in-flight fetch instead of starting one",
+                lambda: _fetch_flight.coalesced)
+metrics.gauge("fetch_waiting", "Callers waiting on the in-flight fetch", lambda: _fetch_flight.stats()["waiting"])
+metrics.counter("bitquery_requests_total", "Bitquery HTTP requests, retries included", _client_stat("requests"))
+metrics.counter("bitquery_retries_total", "Bitquery requests retried", _client_stat("retries"))
+metrics.counter("bitquery_failures_total", "Bitquery queries that failed after retrying", _client_stat("failures"))
+metrics.gauge("events_subscribers", "Open /events streams", lambda: _events.subscriber_count)
+metrics.counter("events_published_total", "Live update events published", lambda: _events.published)
+metrics.counter("events_dropped_total", "Live update events dropped for slow clients", lambda: _events.dropped)
+metrics.counter("subscription_connects_total", "Subscription connections established", _subscription_stat("connects"))
+metrics.counter("subscription_trades_total", "Trades received over the subscription", _subscription_stat("trades_received"))
+metrics.gauge("subscription_last_block", "Highest block received over the subscription", _subscription_stat("last_block"))
+
+
+@app.route("/metrics")
+def prometheus_metrics():
+    """Process metrics in the Prometheus text format."""
+    return Response(metrics.REGISTRY.render(), mimetype="text/plain; version=0.0.4")
 
 
 @app.route("/")
 def index():
-    """Main dashboard route."""
-    data = load_data()
+    """Main dashboard route. ?window=1h|24h|7d shows archived history instead of the latest trades."""
+    window = request.args.get("window") or None
+    # Only the configured windows, as each one is memoized per snapshot
+    if window is not None and window not in WINDOWS:
+        return render_template("error.html", message=f"Unknown window '{window}'. Use one of: {', '.join(WINDOWS)}"), 400
+
+    snapshot = load_snapshot()
     
-    if data is None:
+    if snapshot is None:
         return render_template("error.html", message="Could not fetch data from API")
     
-    stats = calculate_stats(data)
-    
+    # Stats are computed when the snapshot is built and the HTML once per
+    # snapshot, so a cache-hit view does no aggregation or rendering work
+    if window is None:
+        stats = snapshot.stats
+    else:
+        # The archive only changes when a fetch publishes a new snapshot
+        stats = snapshot.view(("window_stats", window), lambda: _window_stats(window))
     if stats is None:
+        if window is not None:
+            return render_template("error.html", message="The trade archive is not available")
         return render_template("error.html", message="Invalid data format from API")
     
-    return render_template("dashboard.html", stats=stats)
+    body = snapshot.view(("dashboard", window), lambda: _render(
+        "dashboard.html", stats=stats, fetched_at=snapshot.fetched_at_iso,
+        window=window, windows=list(WINDOWS), version=snapshot.version,
+    ))
+    return _with_cache_headers(body, snapshot)
+
+
+@app.route("/events")
+def events():
+    """Server-Sent Events stream of builder summary changes, which the dashboard patches in place."""
+    subscriber = _events.subscribe()
+    snapshot = _snapshot
+    # EventSource resends the last event id on reconnect; the page passes the
+    # version it was rendered from. Either way, a client that missed updates
+    # first gets every builder row.
+    last_seen = request.headers.get("Last-Event-ID") or request.args.get("since")
+    if snapshot is not None and last_seen is not None and last_seen != str(snapshot.version):
+        subscriber.put_nowait(format_event("builders", _builders_event(None, snapshot), snapshot.version))
+    response = Response(_events.stream(subscriber), mimetype="text/event-stream")
+    response.headers["Cache-Control"] = "no-cache"
+    # Don't let nginx buffer the stream
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
 
 
 @app.route("/refresh")
 def refresh_cache():
     """Manually refresh the data cache."""
-    data = load_data(force_refresh=True)
-    if data is None:
+    snapshot = load_snapshot(force_refresh=True)
+    if snapshot is None:
         return render_template("error.html", message="Could not fetch data from API")
     return render_template("error.html", message="Cache refreshed successfully! <a href='/'>Go back to dashboard</a>")
 
 
+def _page_args():
+    """The cursor and page size requested in the query string."""
+    cursor = request.args.get("cursor") or None
+    try:
+        limit = int(request.args.get("limit", BUILDER_PAGE_SIZE))
+    except ValueError:
+        limit = BUILDER_PAGE_SIZE
+    return cursor, max(1, min(limit, MAX_BUILDER_PAGE_SIZE))
+
+
 @app.route("/builder/<address>")
 def builder_trades(address):
-    """Show individual trades for a specific builder. Only filters cached data, never calls API."""
+    """Show individual trades for a specific builder, a page at a time. Only uses cached data, never calls API."""
     # use_cache_only=True means we ONLY use cached data, never make API calls
-    data = load_data(use_cache_only=True)
+    snapshot = load_snapshot(use_cache_only=True)
     
-    if data is None:
+    if snapshot is None:
         return render_template("error.html", message="No cached data available. Please visit the <a href='/'>dashboard</a> first to load data.")
     
-    trades = get_builder_trades(data, address)
-    
-    processed_trades = process_builder_trades(trades, address)
+    cursor, limit = _page_args()
+
+    # Only the requested page of the builder's trades is processed and rendered
+    def render():
+        rows, next_cursor, total = snapshot.builder_page(address, cursor, limit)
+        return _render(
+            "builder_trades.html", builder_address=address, trades=rows, total=total,
+            builder_label=builder_registry.get_registry().label(address),
+            next_cursor=next_cursor, limit=limit,
+            page_url=url_for("builder_trades_page", address=address),
+            details_url=url_for("builder_trade_details", address=address),
+            details_limit=MAX_BUILDER_PAGE_SIZE,
+        )
+
+    try:
+        if cursor is None and limit == BUILDER_PAGE_SIZE and snapshot.has_trades_for(address):
+            # Default first pages are rendered once per builder per snapshot;
+            # deeper pages, other page sizes and unknown addresses aren't
+            # memoized so they can't grow the memo
+            body = snapshot.view(("builder", address.lower()), render)
+        else:
+            body = render()
+    except ValueError:
+        return render_template("error.html", message="Invalid page cursor"), 400
     
-    return render_template("builder_trades.html", builder_address=address, trades=processed_trades)
+    return _with_cache_headers(body, snapshot)
+
+
+@app.route("/api/builder/<address>/trades")
+def builder_trades_page(address):
+    """
+    One page of a builder's trades as JSON, for loading more on scroll.
+
+    Query parameters: cursor (next_cursor of the previous page), limit, and
+    html=1 to include the rendered trade cards.
+    """
+    snapshot = load_snapshot(use_cache_only=True)
+    if snapshot is None:
+        return jsonify({"error": "No cached data available"}), 503
+
+    cursor, limit = _page_args()
+    try:
+        rows, next_cursor, total = snapshot.builder_page(address, cursor, limit)
+    except ValueError:
+        return jsonify({"error": "Invalid page cursor"}), 400
+
+    page = {
+        "address": address,
+        "version": snapshot.version,
+        "total": total,
+        "next_cursor": next_cursor,
+        "trades": rows,
+    }
+    if request.args.get("html"):
+        page["html"] = _render("_trade_list.html", trades=rows)
+    return _with_cache_headers(jsonify(page), snapshot)
+
+
+@app.route("/api/builder/<address>/details")
+def builder_trade_details(address):
+    """
+    Drill-down details (see processing.process_trade_details) of a builder's
+    trades as JSON, fetched from the API on first request and kept in memory.
+
+    Query parameters: tx, a comma-separated list of the builder's transaction
+    hashes (one page's worth at most), and html=1 to include each trade's
+    rendered details keyed by "<tx_hash>:<log_index>".
+    """
+    snapshot = load_snapshot(use_cache_only=True)
+    if snapshot is None:
+        return jsonify({"error": "No cached data available"}), 503
+
+    requested = {tx_hash.strip().lower() for tx_hash in (request.args.get("tx") or "").split(",")}
+    requested.discard("")
+    if len(requested) > MAX_BUILDER_PAGE_SIZE:
+        return jsonify({"error": f"At most {MAX_BUILDER_PAGE_SIZE} transactions per request"}), 400
+    # Only the builder's own trades can be looked up, so the route can't be
+    # used to send arbitrary queries upstream
+    known = snapshot.view(
+        ("builder_tx_hashes", address.lower()),
+        lambda: frozenset(trade.tx_hash.lower() for trade in snapshot.builder_trades(address)),
+    ) if snapshot.has_trades_for(address) else frozenset()
+    tx_hashes = sorted(requested & known)
+
+    details = get_trade_details(tx_hashes)
+    if details is None:
+        return jsonify({"error": "Could not fetch trade details from API"}), 503
+
+    page = {"address": address, "details": details}
+    if request.args.get("html"):
+        page["html"] = {
+            f"{row['tx_hash'].lower()}:{row['log_index']}": _render("_trade_details.html", details=row)
+            for rows in details.values()
+            for row in rows
+        }
+    return jsonify(page)
+
+
+def _api_response(snapshot, key, build, excluded=()):
+    """
+    JSON response for the document build() returns, encoded once per snapshot.
+
+    The fields= query parameter selects dotted paths of the document; without
+    it, every top-level field except those in excluded is sent. The full
+    document's encoded (and compressed, per Accept-Encoding) body is memoized
+    per snapshot and encoding, so repeated requests only copy bytes.
+
+    Args:
+        snapshot: Snapshot the document is derived from
+        key: Memo key of the document, e.g. ("api_stats", window)
+        build: Called as build(top_level_fields) to produce the document; the
+            argument is the set of top-level fields wanted, or None for all,
+            so expensive parts nobody asked for can be skipped
+        excluded: Top-level fields left out unless named in fields=
+    """
+    fields = jsonapi.parse_fields(request.args.get("fields"))
+    encoding = jsonapi.negotiate_encoding(request.headers.get("Accept-Encoding"))
+
+    def encode():
+        if fields is not None:
+            document = jsonapi.select_fields(build({field.split(".", 1)[0] for field in fields}), fields)
+        else:
+            document = build(None)
+            if excluded:
+                document = {name: value for name, value in document.items() if name not in excluded}
+        with metrics.span("json_encode"):
+            body = jsonapi.dumps(document)
+        with metrics.span("compress", encoding=encoding or "identity"):
+            return jsonapi.compress(body, encoding)
+
+    if fields is None:
+        body, content_encoding = snapshot.view(("api", key, encoding), encode)
+    else:
+        # Arbitrary selections aren't memoized so they can't grow the memo
+        body, content_encoding = encode()
+    response = app.response_class(body, mimetype="application/json")
+    if content_encoding is not None:
+        response.headers["Content-Encoding"] = content_encoding
+    response.vary.add("Accept-Encoding")
+    # Each field selection and encoding is a different representation
+    etag = snapshot.etag
+    if fields is not None:
+        etag += "-" + format(zlib.crc32(",".join(fields).encode()), "08x")
+    if content_encoding is not None:
+        etag += "-" + content_encoding
+    return _with_cache_headers(response, snapshot, etag=etag)
+
+
+def _api_error(message, status):
+    return app.response_class(jsonapi.dumps({"error": message}), status=status, mimetype="application/json")
+
+
+@app.route("/api/stats")
+def api_stats():
+    """
+    calculate_stats() for the current snapshot as JSON, or for an archived
+    window with ?window=1h|24h|7d.
+
+    fields= picks dotted paths, e.g. fields=total_transactions,builder_summary.address.
+    The per-address and per-block sets are only sent when named in fields=.
+    """
+    window = request.args.get("window") or None
+    if window is not None and window not in WINDOWS:
+        return _api_error(f"Unknown window '{window}'. Use one of: {', '.join(WINDOWS)}", 400)
+
+    snapshot = load_snapshot()
+    if snapshot is None:
+        return _api_error("Could not fetch data from API", 503)
+
+    if window is None:
+        stats = snapshot.stats
+    else:
+        stats = snapshot.view(("window_stats", window), lambda: _window_stats(window))
+    if stats is None:
+        return _api_error("The trade archive is not available" if window else "Invalid data format from API", 503)
+
+    def build(wanted):
+        document = dict(stats)
+        document["version"] = snapshot.version
+        document["fetched_at"] = snapshot.fetched_at
+        document["window"] = window
+        return document
+
+    return _api_response(snapshot, ("stats", window), build, excluded=API_STATS_EXCLUDED)
+
+
+@app.route("/api/builder/<address>")
+def api_builder(address):
+    """
+    A builder's summary row and process_builder_trades() output as JSON. Only
+    uses cached data, never calls the API.
+
+    fields= picks dotted paths, e.g. fields=summary to skip the trades, or
+    fields=trades.tx_hash,trades.block_number. See /api/builder/<address>/trades
+    for the trades a page at a time.
+    """
+    snapshot = load_snapshot(use_cache_only=True)
+    if snapshot is None:
+        return _api_error("No cached data available", 503)
+    if not snapshot.has_trades_for(address):
+        return _api_error(f"No trades for builder {address}", 404)
+
+    address_lower = address.lower()
+
+    def build(wanted):
+        document = {"address": address, "version": snapshot.version, "fetched_at": snapshot.fetched_at}
+        if wanted is None or "summary" in wanted:
+            document["summary"] = next(
+                (row for row in (snapshot.stats or {}).get("builder_summary", [])
+                 if row["address"].lower() == address_lower),
+                None,
+            )
+        if wanted is None or "trades" in wanted:
+            document["trades"] = snapshot.builder_rows(address_lower)
+        return document
+
+    return _api_response(snapshot, ("builder", address_lower), build)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,345 @@
+"""
+Append-only local archive of every trade the dashboard has ingested.
+
+The live snapshot only ever covers the latest FETCH_LIMIT trades. The archive
+keeps them beyond that in SQLite, and maintains per-block rollups as trades are
+inserted, so the stats and builder profit over 1h/24h/7d windows are range
+queries over the rollups instead of a rescan of every trade.
+"""
+import heapq
+import re
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from typing import Iterable, Optional
+
+import builders as builder_registry
+from models import normalize_trades
+
+WINDOWS = {"1h": 3600, "24h": 86400, "7d": 7 * 86400}
+_WINDOW_PATTERN = re.compile(r"^(\d+)([mhd])$")
+_WINDOW_UNITS = {"m": 60, "h": 3600, "d": 86400}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS trades (
+    tx_hash TEXT NOT NULL,
+    log_index TEXT NOT NULL,
+    block_number INTEGER,
+    block_time TEXT NOT NULL,
+    dex_protocol TEXT,
+    value_usd REAL NOT NULL,
+    PRIMARY KEY (tx_hash, log_index)
+);
+CREATE INDEX IF NOT EXISTS trades_block_time ON trades (block_time);
+CREATE INDEX IF NOT EXISTS trades_block_number ON trades (block_number);
+
+-- Per-address, per-block balance rows and their sum, for the per-address
+-- tables; clustered by time, so a window reads one contiguous range
+CREATE TABLE IF NOT EXISTS address_block_rollups (
+    block_time TEXT NOT NULL,
+    block_number INTEGER NOT NULL,
+    address TEXT NOT NULL,
+    count INTEGER NOT NULL DEFAULT 0,
+    balance_change REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (block_time, block_number, address)
+) WITHOUT ROWID;
+
+-- Per-block counters: trades, value, increases/decreases, protocol and reason counts
+CREATE TABLE IF NOT EXISTS block_rollups (
+    block_number INTEGER NOT NULL,
+    block_time TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    key NOT NULL,  -- no affinity, so integer reason codes stay integers
+    count INTEGER NOT NULL DEFAULT 0,
+    amount REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (block_number, kind, key)
+);
+CREATE INDEX IF NOT EXISTS block_rollups_time ON block_rollups (block_time, kind);
+
+CREATE TABLE IF NOT EXISTS builder_block_rollups (
+    builder TEXT NOT NULL,
+    block_number INTEGER NOT NULL,
+    block_time TEXT NOT NULL,
+    total_profit_usd REAL NOT NULL DEFAULT 0,
+    total_balance_change REAL NOT NULL DEFAULT 0,
+    transaction_count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (builder, block_number)
+);
+CREATE INDEX IF NOT EXISTS builder_block_rollups_time ON builder_block_rollups (block_time);
+
+CREATE TABLE IF NOT EXISTS builder_token_rollups (
+    builder TEXT NOT NULL,
+    block_number INTEGER NOT NULL,
+    block_time TEXT NOT NULL,
+    token TEXT NOT NULL,
+    balance_change REAL NOT NULL DEFAULT 0,
+    profit_usd REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (builder, block_number, token)
+);
+CREATE INDEX IF NOT EXISTS builder_token_rollups_time ON builder_token_rollups (block_time);
+"""
+
+
+def parse_window(window: str) -> Optional[int]:
+    """Length in seconds of a window such as "1h", "24h" or "7d", or None if it isn't one."""
+    if window in WINDOWS:
+        return WINDOWS[window]
+    match = _WINDOW_PATTERN.match(window or "")
+    if not match:
+        return None
+    return int(match.group(1)) * _WINDOW_UNITS[match.group(2)]
+
+
+def _format_time(timestamp: float) -> str:
+    # Same format as Block.Time, so windows are plain string comparisons
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(timestamp))
+
+
+class TradeArchive:
+    """
+    SQLite-backed trade archive.
+
+    Trades are deduplicated on (Transaction.Hash, Log.Index), the same
+    identity the incremental refresh uses, so a transaction with several
+    swaps keeps all of them while re-ingested trades are ignored.
+    """
+
+    def __init__(self, path: str, builder_addresses: Optional[Iterable[str]] = None):
+        self.path = path
+        # None follows the builder registry as it is reloaded, so builders
+        # added later get rollups from then on
+        self._builder_addresses = builder_addresses
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._migrate_balance_changes()
+
+    def _migrate_balance_changes(self) -> None:
+        # Archives from before address_block_rollups kept every balance row;
+        # roll them up once and drop them
+        if self._conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'balance_changes'").fetchone() is None:
+            return
+        with self._conn:
+            self._conn.execute(
+                """
+                INSERT OR IGNORE INTO address_block_rollups
+                SELECT MIN(b.block_time), t.block_number, b.address, COUNT(*), SUM(b.balance_change)
+                FROM balance_changes b JOIN trades t USING (tx_hash, log_index)
+                WHERE t.block_number IS NOT NULL
+                GROUP BY t.block_number, b.address
+                """
+            )
+            self._conn.execute("DROP TABLE balance_changes")
+
+    @property
+    def registry(self):
+        return builder_registry.resolve(self._builder_addresses)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def add_trades(self, trades: Iterable) -> int:
+        """
+        Append trades, skipping ones already archived, and update the rollups.
+
+        Returns the number of trades actually added.
+        """
+        added = 0
+        builder_addresses = self.registry.by_address
+        with self._lock, self._conn:
+            cursor = self._conn.cursor()
+            for trade in normalize_trades(trades):
+                if not trade.block_time or trade.log_index is None:
+                    continue
+                cursor.execute(
+                    "INSERT OR IGNORE INTO trades VALUES (?, ?, ?, ?, ?, ?)",
+                    (trade.tx_hash, str(trade.log_index), trade.block_height, trade.block_time,
+                     trade.dex_protocol, trade.value_usd),
+                )
+                if cursor.rowcount != 1:
+                    continue
+                added += 1
+                self._add_rollups(cursor, trade, builder_addresses)
+        return added
+
+    def _add_rollups(self, cursor, trade, builder_addresses) -> None:
+        block = trade.block_height
+        block_time = trade.block_time
+        counters = defaultdict(lambda: [0, 0.0])
+        counters[("trades", "")][0] += 1
+        counters[("trades", "")][1] += trade.value_usd
+        counters[("protocol", str(trade.dex_protocol))][0] += 1
+        addresses = defaultdict(lambda: [0, 0.0])
+
+        builders_in_trade = set()
+        for balance in trade.balances:
+            if balance.address:
+                totals = addresses[balance.address]
+                totals[0] += 1
+                totals[1] += balance.balance_change
+            if balance.reason_code is not None:
+                counters[("reason", balance.reason_code)][0] += 1
+            if balance.post_balance > balance.pre_balance:
+                counters[("increases", "")][0] += 1
+            elif balance.post_balance < balance.pre_balance:
+                counters[("decreases", "")][0] += 1
+
+            builder = balance.address_lower
+            if builder not in builder_addresses or block is None:
+                continue
+            first_row = builder not in builders_in_trade
+            builders_in_trade.add(builder)
+            cursor.execute(
+                """
+                INSERT INTO builder_block_rollups VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (builder, block_number) DO UPDATE SET
+                    total_profit_usd = total_profit_usd + excluded.total_profit_usd,
+                    total_balance_change = total_balance_change + excluded.total_balance_change,
+                    transaction_count = transaction_count + excluded.transaction_count
+                """,
+                (builder, block, block_time, balance.profit_usd, balance.balance_change, int(first_row)),
+            )
+            token = (
+                f"{balance.currency_name} ({balance.currency_symbol})"
+                if balance.currency_symbol else balance.currency_name
+            )
+            cursor.execute(
+                """
+                INSERT INTO builder_token_rollups VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (builder, block_number, token) DO UPDATE SET
+                    balance_change = balance_change + excluded.balance_change,
+                    profit_usd = profit_usd + excluded.profit_usd
+                """,
+                (builder, block, block_time, str(token), balance.balance_change, balance.profit_usd),
+            )
+
+        if block is None:
+            return
+        cursor.executemany(
+            """
+            INSERT INTO address_block_rollups VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (block_time, block_number, address) DO UPDATE SET
+                count = count + excluded.count,
+                balance_change = balance_change + excluded.balance_change
+            """,
+            [(block_time, block, address, count, change) for address, (count, change) in addresses.items()],
+        )
+        cursor.executemany(
+            """
+            INSERT INTO block_rollups VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (block_number, kind, key) DO UPDATE SET
+                count = count + excluded.count,
+                amount = amount + excluded.amount
+            """,
+            [(block, block_time, kind, key, count, amount)
+             for (kind, key), (count, amount) in counters.items()],
+        )
+
+    def prune(self, older_than_seconds: float) -> None:
+        """Drop archived trades and rollups older than the given age."""
+        cutoff = _format_time(time.time() - older_than_seconds)
+        with self._lock, self._conn:
+            for table in ("trades", "address_block_rollups", "block_rollups",
+                          "builder_block_rollups", "builder_token_rollups"):
+                self._conn.execute(f"DELETE FROM {table} WHERE block_time < ?", (cutoff,))
+
+    def window_stats(self, window: str, now: Optional[float] = None) -> Optional[dict]:
+        """
+        calculate_stats()-shaped summary of the trades in the last `window`.
+
+        Every figure comes from the per-block rollup tables, so the cost grows
+        with the blocks and the addresses active in each, not with the balance
+        rows behind them. The raw unique_addresses/unique_blocks sets and the
+        full balance_change_by_address map are not materialized; their counts are.
+        """
+        seconds = parse_window(window)
+        if seconds is None:
+            return None
+        cutoff = _format_time((now if now is not None else time.time()) - seconds)
+
+        with self._lock:
+            conn = self._conn
+            counters = defaultdict(dict)
+            for kind, key, count, amount in conn.execute(
+                "SELECT kind, key, SUM(count), SUM(amount) FROM block_rollups "
+                "WHERE block_time >= ? GROUP BY kind, key",
+                (cutoff,),
+            ):
+                counters[kind][key] = (count, amount)
+
+            earliest, latest, unique_blocks = conn.execute(
+                "SELECT MIN(block_time), MAX(block_time), COUNT(DISTINCT block_number) "
+                "FROM block_rollups WHERE block_time >= ? AND kind = 'trades'",
+                (cutoff,),
+            ).fetchone()
+
+            address_rows = conn.execute(
+                "SELECT address, SUM(count), SUM(balance_change) FROM address_block_rollups "
+                "WHERE block_time >= ? GROUP BY address",
+                (cutoff,),
+            ).fetchall()
+
+            builders = conn.execute(
+                "SELECT builder, SUM(total_profit_usd), SUM(total_balance_change), "
+                "SUM(transaction_count), COUNT(*) FROM builder_block_rollups "
+                "WHERE block_time >= ? GROUP BY builder ORDER BY MIN(rowid)",
+                (cutoff,),
+            ).fetchall()
+            tokens = conn.execute(
+                "SELECT builder, token, SUM(balance_change), SUM(profit_usd) FROM builder_token_rollups "
+                "WHERE block_time >= ? GROUP BY builder, token ORDER BY MIN(rowid)",
+                (cutoff,),
+            ).fetchall()
+
+        trade_count, value_usd = counters["trades"].get("", (0, 0.0))
+        stats = {
+            "window": window,
+            "total_transactions": trade_count,
+            "total_value_usd": value_usd,
+            "total_balance_change": 0,
+            "unique_addresses_count": len(address_rows),
+            "unique_blocks_count": unique_blocks,
+            "date_range": {"earliest": earliest, "latest": latest},
+            "balance_changes": {
+                "increases": counters["increases"].get("", (0, 0))[0],
+                "decreases": counters["decreases"].get("", (0, 0))[0],
+            },
+            "transactions_by_reason": {key: count for key, (count, _) in counters["reason"].items()},
+            "dex_protocols": dict(sorted(
+                ((key, count) for key, (count, _) in counters["protocol"].items()),
+                key=lambda x: x[1], reverse=True,
+            )),
+        }
+
+        # Ties broken by address, as in StatsAccumulator.result()
+        stats["address_summary"] = [
+            {"address": address, "count": count, "total_balance_change": change}
+            for address, count, change in heapq.nsmallest(10, address_rows, key=lambda x: (-abs(x[2]), x[0]))
+        ]
+        stats["transactions_by_address"] = {
+            address: count for address, count, _ in heapq.nsmallest(10, address_rows, key=lambda x: (-x[1], x[0]))
+        }
+
+        registry = self.registry
+        builder_tokens = defaultdict(dict)
+        for builder, token, change, profit in tokens:
+            builder_tokens[builder][token] = {"balance_change": change, "profit_usd": profit}
+        builder_summary = [
+            {
+                "address": registry.display_address(builder),
+                "label": registry.label(builder),
+                "total_profit_usd": profit,
+                "total_balance_change": change,
+                "total_transactions": transactions,
+                "total_blocks": blocks,
+                "tokens": builder_tokens.get(builder, {}),
+            }
+            for builder, profit, change, transactions, blocks in builders
+        ]
+        builder_summary.sort(key=lambda x: x["total_profit_usd"], reverse=True)
+        stats["builder_summary"] = builder_summary
+        return stats
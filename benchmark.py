@@ -0,0 +1,325 @@
+"""
+Offline benchmarks of the data path, on synthetic payloads from synthetic.py:
+
+    python benchmark.py [--sizes 20000 200000 2000000] [--memory] [--save out.json] [--compare base.json]
+    python benchmark.py --e2e [--e2e-trades 20000] [--latency 0.2]
+
+The stage run times filter_trades_by_addresses, calculate_stats,
+get_builder_trades, the snapshot index and process_builder_trades for each
+payload size (and pipeline.IngestPass against the same work done by those
+stages), with throughput and, with --memory, the peak memory each stage
+allocates (tracemalloc slows the stages down, so timings are taken in a
+separate pass). Payloads above --materialize trades are never held in memory
+whole: they are generated and filtered as a stream, like a streamed API
+response.
+
+--save writes the results as JSON and --compare flags stages that got slower
+than a saved run by more than --threshold.
+
+--e2e serves the dashboard against mock_bitquery.py and times "/",
+"/builder/<address>" and its trade details over HTTP, cold and warm. Like the app, it needs a
+config.py (the token only ever goes to the mock).
+"""
+import argparse
+import gc
+import json
+import os
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+
+import metrics
+import builders as builder_registry
+import fields
+from filter import DEFAULT_ADDRESSES, filter_trades_by_addresses, iter_trades_by_addresses
+from models import DASHBOARD_FIELDS, block_number, involves_any, trade_key
+from pipeline import IngestPass
+from processing import StatsAccumulator, calculate_stats, process_builder_trades
+from snapshot import Snapshot, build_address_index
+from synthetic import generate_trades
+
+MATERIALIZE_LIMIT = 200000  # Largest payload built as one dict; bigger ones are streamed
+
+
+def _get_builder_trades():
+    """app.get_builder_trades, or None if the app can't be imported here (no config.py)."""
+    try:
+        from app import get_builder_trades
+    except ImportError as e:
+        print(f"Skipping get_builder_trades: {e}")
+        return None
+    return get_builder_trades
+
+
+def _measure(function, memory):
+    """Run function; returns (result, seconds, peak bytes or None)."""
+    # Don't bill a stage for collecting what the previous one left behind
+    gc.collect()
+    if memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        result = function()
+    finally:
+        seconds = time.perf_counter() - start
+        peak = None
+        if memory:
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+    return result, seconds, peak
+
+
+def _separate_stages(source):
+    """What IngestPass does in one pass, as the stages it replaces."""
+    block_keys = {}
+
+    def tally_blocks(trades):
+        # Like dataservice.tally_blocks(), with the trade keys IngestPass
+        # counts each block's trades by
+        for trade in trades:
+            number = block_number(trade)
+            if number is not None:
+                block_keys.setdefault(number, set()).add(trade_key(trade))
+            yield trade
+
+    trades = list(iter_trades_by_addresses(tally_blocks(source)))
+    return trades, block_keys, StatsAccumulator().update(trades), build_address_index(trades)
+
+
+def run_stages(size, options, memory=False):
+    """
+    Time each stage of the data path on a synthetic payload of size trades.
+
+    Returns:
+        A list of {"stage", "items", "seconds", "peak_bytes"} dicts
+    """
+    generate = lambda: generate_trades(
+        size, rows_per_trade=options.rows_per_trade, builder_hit_rate=options.builder_hit_rate,
+        dict_join_rate=options.dict_join_rate, seed=options.seed,
+    )
+    results = []
+
+    def stage(name, items, function):
+        result, seconds, peak = _measure(function, memory)
+        results.append({"stage": name, "items": items, "seconds": seconds, "peak_bytes": peak})
+        return result
+
+    if size <= options.materialize:
+        data = stage("generate", size, lambda: {"data": {"EVM": {"DEXTrades": list(generate())}}})
+        # Filter, stats and address index in one pass, against the same work
+        # done by the separate stages it replaces
+        raw = data["data"]["EVM"]["DEXTrades"]
+        stage("IngestPass (single pass)", size, lambda: IngestPass().feed(raw))
+        stage("separate stages (same work)", size, lambda: _separate_stages(raw))
+        filtered = stage("filter_trades_by_addresses", size, lambda: filter_trades_by_addresses(data))
+        del data
+    else:
+        filtered = stage("generate+filter (streamed)", size, lambda: {
+            "data": {"EVM": {"DEXTrades": list(iter_trades_by_addresses(generate()))}}
+        })
+    trades = filtered["data"]["EVM"]["DEXTrades"]
+
+    stats = stage("calculate_stats", len(trades), lambda: calculate_stats(filtered))
+    builders = stats["builder_summary"]
+    address = builders[0]["address"] if builders else DEFAULT_ADDRESSES[0]
+
+    get_builder_trades = _get_builder_trades()
+    if get_builder_trades is not None:
+        stage("get_builder_trades (scan)", len(trades), lambda: get_builder_trades(filtered, address))
+
+    snapshot = stage("Snapshot (address index)", len(trades), lambda: Snapshot(filtered, 1, stats=stats))
+    builder_trades = stage("Snapshot.builder_trades", len(trades), lambda: snapshot.builder_trades(address))
+    stage("process_builder_trades", len(builder_trades), lambda: process_builder_trades(builder_trades, address))
+    return results
+
+
+def retained_memory(size, options):
+    """
+    Bytes the trades a snapshot keeps hold on to, as the raw DEXTrade dicts
+    the dashboard's query returns (DASHBOARD_FIELDS only) and as normalized
+    Trade records; the other trades of the payload are dropped as they are
+    generated, like a streamed response.
+
+    Returns:
+        A {"raw dicts": bytes, "Trade records": bytes} dict
+    """
+    generate = lambda: generate_trades(
+        size, rows_per_trade=options.rows_per_trade, builder_hit_rate=options.builder_hit_rate,
+        dict_join_rate=options.dict_join_rate, seed=options.seed,
+    )
+    by_address = builder_registry.get_registry().by_address
+    retained = {}
+    for name, keep in (
+        ("raw dicts", lambda: [
+            trade for trade in (fields.project(raw, DASHBOARD_FIELDS) for raw in generate())
+            if involves_any(trade, by_address)
+        ]),
+        ("Trade records", lambda: list(iter_trades_by_addresses(
+            fields.project(raw, DASHBOARD_FIELDS) for raw in generate()
+        ))),
+    ):
+        tracemalloc.start()
+        try:
+            kept = keep()
+            retained[name] = tracemalloc.get_traced_memory()[0]
+        finally:
+            tracemalloc.stop()
+        del kept
+    return retained
+
+
+def _format_rate(items, seconds):
+    rate = items / seconds if seconds > 0 else float("inf")
+    return f"{rate / 1e6:7.2f}M/s" if rate >= 1e6 else f"{rate / 1e3:7.1f}k/s"
+
+
+def print_stages(size, results):
+    print(f"\n{size:,} trades")
+    for result in results:
+        peak = result["peak_bytes"]
+        print(
+            f"  {result['stage']:<30} {result['seconds'] * 1000:10.1f} ms  "
+            f"{_format_rate(result['items'], result['seconds'])}  ({result['items']:,} in)"
+            + (f"  peak {peak / 2 ** 20:8.1f} MiB" if peak is not None else "")
+        )
+
+
+def compare(current, baseline, threshold):
+    """Stages slower than in baseline by more than threshold (a fraction); returns their descriptions."""
+    slower = []
+    for size, results in current.items():
+        before = {result["stage"]: result for result in baseline.get(size, [])}
+        for result in results:
+            old = before.get(result["stage"])
+            if old is None or old["seconds"] <= 0:
+                continue
+            ratio = result["seconds"] / old["seconds"]
+            if ratio > 1 + threshold:
+                slower.append(
+                    f"{int(size):,} trades, {result['stage']}: {old['seconds'] * 1000:.1f} ms -> "
+                    f"{result['seconds'] * 1000:.1f} ms ({(ratio - 1) * 100:+.0f}%)"
+                )
+    return slower
+
+
+def _latencies(session, url, count):
+    timings = []
+    for _ in range(count):
+        start = time.perf_counter()
+        response = session.get(url)
+        response.raise_for_status()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def _summarize(timings):
+    ordered = sorted(timings)
+    pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000
+    return f"min {ordered[0] * 1000:7.1f}  p50 {pick(0.5):7.1f}  p95 {pick(0.95):7.1f}  max {ordered[-1] * 1000:7.1f} ms"
+
+
+def run_end_to_end(options):
+    """Serve the app against a mock Bitquery and time its pages over HTTP."""
+    from mock_bitquery import MockBitqueryServer
+
+    mock = MockBitqueryServer(
+        port=0, trades=options.e2e_trades, latency=options.latency,
+        rows_per_trade=options.rows_per_trade, builder_hit_rate=options.builder_hit_rate,
+        dict_join_rate=options.dict_join_rate, seed=options.seed,
+    ).start()
+    # Read at import, so set before the app is loaded; nothing is written to disk
+    os.environ["BITQUERY_URL"] = mock.url
+    for name in ("SNAPSHOT_PATH", "ARCHIVE_PATH", "CACHE_BACKEND"):
+        os.environ[name] = ""
+    os.environ["SHARED_CACHE"] = "0"
+
+    import requests
+    from werkzeug.serving import WSGIRequestHandler, make_server
+    try:
+        import app
+    except ImportError as e:
+        sys.exit(f"The end-to-end run needs the app importable: {e}")
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass
+
+    server = make_server("127.0.0.1", 0, app.app, threaded=True, request_handler=QuietHandler)
+    threading.Thread(target=server.serve_forever, name="benchmark-app", daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_port}"
+    session = requests.Session()
+
+    print(f"\nEnd to end: {options.e2e_trades:,} trades served by the mock at {options.latency * 1000:.0f} ms latency")
+    try:
+        print(f"  {'/ (cold: fetch + stats + render)':<40} {_summarize(_latencies(session, base + '/', 1))}")
+        print(f"  {'/ (warm)':<40} {_summarize(_latencies(session, base + '/', options.requests))}")
+        builders = app.get_snapshot().stats["builder_summary"]
+        if builders:
+            url = f"{base}/builder/{builders[0]['address']}"
+            print(f"  {'/builder/<address> (first)':<40} {_summarize(_latencies(session, url, 1))}")
+            print(f"  {'/builder/<address> (warm)':<40} {_summarize(_latencies(session, url, options.requests))}")
+            tx_hashes = ",".join(trade.tx_hash for trade in app.get_snapshot().builder_trades(builders[0]["address"])[:50])
+            url = f"{base}/api/builder/{builders[0]['address']}/details?tx={tx_hashes}"
+            print(f"  {'/api/builder/<address>/details (first)':<40} {_summarize(_latencies(session, url, 1))}")
+            print(f"  {'/api/builder/<address>/details (warm)':<40} {_summarize(_latencies(session, url, options.requests))}")
+        print(f"  {'/api/stats (warm)':<40} {_summarize(_latencies(session, base + '/api/stats', options.requests))}")
+        response_bytes = sum(value for *_, value in metrics.counter("bitquery_response_bytes_total").samples())
+        print(f"  mock queries: {mock.queries}, response bytes: {response_bytes:,.0f}")
+    finally:
+        server.shutdown()
+        mock.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the dashboard's data path on synthetic trades")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[20000, 200000, 2000000])
+    parser.add_argument("--rows-per-trade", type=int, default=4)
+    parser.add_argument("--builder-hit-rate", type=float, default=0.3)
+    parser.add_argument("--dict-join-rate", type=float, default=0.05)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--materialize", type=int, default=MATERIALIZE_LIMIT,
+                        help="largest payload held in memory whole; bigger ones are streamed")
+    parser.add_argument("--memory", action="store_true", help="also measure each stage's peak memory")
+    parser.add_argument("--save", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="flag stages slower than in this saved JSON file")
+    parser.add_argument("--threshold", type=float, default=0.2, help="slowdown flagged by --compare")
+    parser.add_argument("--e2e", action="store_true", help="time the app's pages against mock_bitquery.py instead")
+    parser.add_argument("--e2e-trades", type=int, default=20000)
+    parser.add_argument("--latency", type=float, default=0.2, help="mock API latency in seconds (--e2e)")
+    parser.add_argument("--requests", type=int, default=50, help="warm requests per page (--e2e)")
+    options = parser.parse_args()
+
+    if options.e2e:
+        run_end_to_end(options)
+        sys.exit(0)
+
+    report = {}
+    for size in options.sizes:
+        results = run_stages(size, options)
+        if options.memory:
+            peaks = run_stages(size, options, memory=True)
+            for result, measured in zip(results, peaks):
+                result["peak_bytes"] = measured["peak_bytes"]
+        print_stages(size, results)
+        if options.memory and size <= options.materialize:
+            retained = retained_memory(size, options)
+            print("  kept trades retained: " + ", ".join(
+                f"{name} {count / 2 ** 20:.1f} MiB" for name, count in retained.items()
+            ))
+        report[str(size)] = results
+
+    # ru_maxrss is in KiB on Linux
+    print(f"\nMax RSS: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MiB")
+
+    if options.save:
+        with open(options.save, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if options.compare:
+        with open(options.compare, encoding="utf-8") as f:
+            slower = compare(report, json.load(f), options.threshold)
+        for line in slower:
+            print(f"SLOWER: {line}")
+        if slower:
+            sys.exit(1)
@@ -0,0 +1,247 @@
+"""
+Builder registry: the block builders the dashboard tracks, each a labelled
+entity with one or more addresses, loaded from a JSON file:
+
+    {"builders": [
+        {"label": "Titan", "addresses": ["0x4838b106fce9647bdf1e7877bf73ce8b0bad5f97"]},
+        {"label": "Example", "addresses": ["0x...", "0x..."]}
+    ]}
+
+The file is re-read when its modification time changes, so builders can be
+added or relabelled without a restart. Without a file, the registry is
+DEFAULT_ADDRESSES, one unlabelled builder per address.
+
+A registry is compiled once into a matcher: addresses are normalized through
+their 20 bytes to lower-case 0x hex, so any spelling of an address
+(checksummed, lower-case, with or without 0x) matches, and the per-row hot
+loops look them up with one dict hit however many addresses are tracked.
+"""
+import json
+import os
+import threading
+import time
+import zlib
+from functools import lru_cache
+from typing import Iterable, NamedTuple, Optional
+
+DEFAULT_ADDRESSES = [
+    "0xf2f5c73fa04406b1995e397b55c24ab1f3ea726c",
+    "0x036C9c0aaE7a8268F332bA968dac5963c6aDAca5",
+    "0xf573d99385c05c23b24ed33de616ad16a43a0919",
+    "0x000000000000d3B2C76221467d2f8c8f1dE832A2",
+    "0x199D5ED7F45F4eE35960cF22EAde2076e95B253F",
+    "0x4838b106fce9647bdf1e7877bf73ce8b0bad5f97",
+    "0xaab27b150451726ec7738aa1d0a94505c8729bd1",
+    "0x57865ba267d48671a41431f471933aec32a7c7d1",
+    "0x0000000000675d852C8638Df2f227949052b1208",
+    "0xdadb0d80178819f2319190d340ce9a924f783711",
+    "0x4675c7e5baafbffbca748158becba61ef3b0a263",
+    "0x396343362be2a4da1ce0c1c210945346fb82aa49"
+]
+
+# Registry file; empty uses DEFAULT_ADDRESSES
+BUILDERS_PATH = os.environ.get("BUILDERS_PATH", "builders.json")
+RELOAD_CHECK_INTERVAL = 5  # Seconds between checks of the file's modification time
+
+_registry = None
+_registry_lock = threading.Lock()
+_file_state = None  # (mtime_ns, size) of BUILDERS_PATH when last loaded, or None
+_checked_at = 0.0
+
+
+def address_key(address) -> Optional[bytes]:
+    """The 20 bytes of an address in any spelling, or None if it isn't one."""
+    if not isinstance(address, str):
+        return None
+    text = address.strip()
+    if text[:2] in ("0x", "0X"):
+        text = text[2:]
+    if len(text) != 40:
+        return None
+    try:
+        return bytes.fromhex(text)
+    except ValueError:
+        return None
+
+
+def _canonical(address) -> Optional[str]:
+    """The lower-case 0x hex of an address in any spelling, or None if it isn't one."""
+    key = address_key(address)
+    return "0x" + key.hex() if key is not None else None
+
+
+class Builder(NamedTuple):
+    """A builder entity: its label (None if unlabelled) and its addresses as configured."""
+
+    label: Optional[str]
+    addresses: tuple
+
+
+class BuilderRegistry:
+    """
+    Builder entities compiled for matching.
+
+    Args:
+        builders: Builder entities; an address may belong to only one
+        source: Where they were loaded from, for messages
+    """
+
+    def __init__(self, builders: Iterable[Builder], source: Optional[str] = None):
+        self.builders = tuple(builders)
+        self.source = source
+        # Lower-case 0x hex -> Builder. Trade records carry the lower-case hex
+        # of every address, interned at ingest, so matching a row is a lookup
+        # of that string rather than of its 20 bytes, which would need a
+        # decode per row
+        self.by_address = {}
+        self._display = {}  # lower-case hex -> address as configured
+        for builder in self.builders:
+            for address in builder.addresses:
+                address_lower = _canonical(address)
+                if address_lower is None:
+                    raise ValueError(f"Invalid address {address!r} for builder {builder.label!r}")
+                owner = self.by_address.get(address_lower)
+                if owner is not None:
+                    if owner is builder:
+                        continue
+                    raise ValueError(f"Address {address} belongs to both {owner.label!r} and {builder.label!r}")
+                self.by_address[address_lower] = builder
+                # Keep the configured spelling (e.g. checksummed), with a 0x prefix
+                text = address.strip()
+                self._display[address_lower] = "0x" + (text[2:] if text[:2] in ("0x", "0X") else text)
+        self.addresses = tuple(self._display.values())
+        # Changes when a label or an address changes, not when one is respelled
+        canonical = [
+            (builder.label, sorted(address_key(address).hex() for address in builder.addresses))
+            for builder in self.builders
+        ]
+        self.version = format(zlib.crc32(json.dumps(canonical).encode()), "08x")
+
+    @classmethod
+    def from_addresses(cls, addresses: Iterable[str], source: Optional[str] = None) -> "BuilderRegistry":
+        """An unlabelled builder per address."""
+        return cls((Builder(None, (address,)) for address in addresses), source)
+
+    @classmethod
+    def load(cls, path: str) -> "BuilderRegistry":
+        """Read a registry file; raises OSError or ValueError if it can't be used."""
+        with open(path, encoding="utf-8") as f:
+            config = json.load(f)
+        entries = config.get("builders") if isinstance(config, dict) else config
+        if not isinstance(entries, list):
+            raise ValueError('Expected a list of builders, or {"builders": [...]}')
+        builders = []
+        for entry in entries:
+            if isinstance(entry, str):
+                entry = {"addresses": [entry]}
+            if not isinstance(entry, dict):
+                raise ValueError(f"Invalid builder entry: {entry!r}")
+            addresses = entry.get("addresses", [])
+            if isinstance(entry.get("address"), str):
+                addresses = [entry["address"]] + list(addresses)
+            if not addresses or not all(isinstance(address, str) for address in addresses):
+                raise ValueError(f"Builder entry without addresses: {entry!r}")
+            label = entry.get("label")
+            builders.append(Builder(str(label) if label else None, tuple(addresses)))
+        return cls(builders, path)
+
+    def __len__(self):
+        return len(self.by_address)
+
+    def __contains__(self, address):
+        return _canonical(address) in self.by_address
+
+    def label(self, address: str) -> Optional[str]:
+        """The label of the builder an address belongs to, or None."""
+        builder = self.by_address.get(address) or self.by_address.get(_canonical(address))
+        return builder.label if builder is not None else None
+
+    def display_address(self, address_lower: str) -> str:
+        """An address as it is spelled in the registry (e.g. checksummed), always 0x-prefixed."""
+        return self._display.get(address_lower, address_lower)
+
+
+@lru_cache(maxsize=16)
+def _compile(addresses: tuple) -> BuilderRegistry:
+    return BuilderRegistry.from_addresses(addresses)
+
+
+def resolve(addresses=None) -> BuilderRegistry:
+    """
+    The registry for an addresses argument: a registry as is, the current
+    registry if None or empty, or a list of addresses compiled into one
+    (cached, so callers passing the same list don't recompile it).
+    """
+    if isinstance(addresses, BuilderRegistry):
+        return addresses
+    if not addresses:
+        return get_registry()
+    return _compile(tuple(addresses))
+
+
+def _stat(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+def get_registry() -> BuilderRegistry:
+    """
+    The current registry, reloaded from BUILDERS_PATH if the file changed
+    since it was loaded (checked at most every RELOAD_CHECK_INTERVAL seconds).
+    A file that fails to load is reported and the previous registry kept.
+    """
+    global _registry, _file_state, _checked_at
+
+    registry = _registry
+    if registry is not None and time.monotonic() - _checked_at < RELOAD_CHECK_INTERVAL:
+        return registry
+    with _registry_lock:
+        if _registry is not None and time.monotonic() - _checked_at < RELOAD_CHECK_INTERVAL:
+            return _registry
+        _checked_at = time.monotonic()
+        state = _stat(BUILDERS_PATH) if BUILDERS_PATH else None
+        if _registry is not None and state == _file_state:
+            return _registry
+
+        if state is None:
+            if _file_state is not None:
+                print(f"{BUILDERS_PATH} was removed; tracking the default builder addresses")
+            _registry = _compile(tuple(DEFAULT_ADDRESSES))
+        else:
+            try:
+                registry = BuilderRegistry.load(BUILDERS_PATH)
+            except (OSError, ValueError) as e:
+                print(f"Could not load builders from {BUILDERS_PATH}: {e}; keeping the previous registry")
+                if _registry is None:
+                    _registry = _compile(tuple(DEFAULT_ADDRESSES))
+            else:
+                print(f"Loaded {len(registry.builders)} builders ({len(registry)} addresses) from {BUILDERS_PATH}")
+                _registry = registry
+        # A broken file isn't retried until it changes again
+        _file_state = state
+        return _registry
+
+
+if __name__ == "__main__":
+    # Matching throughput with hundreds of tracked addresses:
+    #   python builders.py [addresses] [trades]
+    import random
+    import sys
+    from models import involves_any, normalize_trades
+    from synthetic import generate_trades
+
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    trades = list(normalize_trades(generate_trades(int(sys.argv[2]) if len(sys.argv) > 2 else 50000)))
+    rng = random.Random(0)
+    extra = ["0x%040x" % rng.getrandbits(160) for _ in range(max(0, count - len(DEFAULT_ADDRESSES)))]
+    registry = BuilderRegistry.from_addresses(DEFAULT_ADDRESSES + extra)
+
+    rows = sum(len(trade.balances) for trade in trades)
+    start = time.perf_counter()
+    matched = sum(1 for trade in trades if involves_any(trade, registry.by_address))
+    elapsed = time.perf_counter() - start
+    print(f"{len(registry)} addresses, {len(trades):,} trades ({rows:,} rows): {matched:,} matched "
+          f"in {elapsed * 1000:.1f} ms ({rows / elapsed / 1e6:.1f}M rows/s)")
@@ -0,0 +1,284 @@
+"""
+Where fetched snapshots are kept between requests.
+
+Every backend stores the latest Snapshot, with its stats inside, and an
+optional TTL. MemoryCacheBackend keeps it in the process;
+FilesystemCacheBackend (on a shared mount) and RedisCacheBackend share it
+between hosts, so one Bitquery fetch serves all of them. FakeRedis is an
+in-process stand-in for a Redis server, implementing just the commands
+RedisCacheBackend uses.
+"""
+import json
+import os
+import threading
+import time
+from typing import Optional
+
+try:
+    import redis
+except ImportError:  # optional dependency
+    redis = None
+
+from snapshot import Snapshot, freshness
+from store import open_snapshot_file
+
+
+class CacheBackend:
+    """
+    Interface of the cache backends.
+
+    Args:
+        ttl: Seconds after which stored entries expire, or None to keep them
+            until they are replaced
+    """
+
+    def __init__(self, ttl: Optional[float] = None):
+        self.ttl = ttl
+
+    def _ttl(self, ttl):
+        return self.ttl if ttl is None else ttl
+
+    def freshness(self) -> Optional[tuple]:
+        """Snapshot.freshness of the stored snapshot, without loading it; None if there is none."""
+        raise NotImplementedError
+
+    def get_snapshot(self) -> Optional[Snapshot]:
+        """The stored snapshot, or None if there is none or it expired."""
+        raise NotImplementedError
+
+    def set_snapshot(self, snapshot: Snapshot, ttl: Optional[float] = None) -> None:
+        """Replace the stored snapshot."""
+        raise NotImplementedError
+
+
+class MemoryCacheBackend(CacheBackend):
+    """Keeps everything in this process, like the module globals in app.py."""
+
+    def __init__(self, ttl: Optional[float] = None):
+        super().__init__(ttl)
+        self._lock = threading.Lock()
+        self._snapshot = None  # (snapshot, expires_at)
+
+    @staticmethod
+    def _expires_at(ttl):
+        return time.time() + ttl if ttl is not None else None
+
+    @staticmethod
+    def _live(entry):
+        return entry is not None and (entry[1] is None or entry[1] > time.time())
+
+    def freshness(self):
+        snapshot = self.get_snapshot()
+        return snapshot.freshness if snapshot is not None else None
+
+    def get_snapshot(self):
+        entry = self._snapshot
+        return entry[0] if self._live(entry) else None
+
+    def set_snapshot(self, snapshot, ttl=None):
+        with self._lock:
+            self._snapshot = (snapshot, self._expires_at(self._ttl(ttl)))
+
+
+class FilesystemCacheBackend(CacheBackend):
+    """
+    A snapshot file in a directory, e.g. on a mount shared by several hosts.
+
+    Expiry is judged by file modification time against the backend's ttl; the
+    per-call ttl arguments are ignored. Snapshots are loaded lazily, so a reader
+    decodes only what it serves.
+    """
+
+    def __init__(self, directory: str, ttl: Optional[float] = None):
+        super().__init__(ttl)
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._loaded = (None, None)  # (file state, Snapshot) of the last load
+
+    @property
+    def snapshot_path(self):
+        return os.path.join(self.directory, "snapshot.bin")
+
+    def _stat_live(self, path, ttl=None):
+        """os.stat() of path, or None if it is missing or older than the TTL."""
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        ttl = self._ttl(ttl)
+        if ttl is not None and stat.st_mtime + ttl < time.time():
+            return None
+        return stat
+
+    def freshness(self):
+        if self._stat_live(self.snapshot_path) is None:
+            return None
+        snapshot_file = open_snapshot_file(self.snapshot_path)
+        if snapshot_file is None:
+            return None
+        with snapshot_file:
+            return freshness(snapshot_file.header["block_cursor"], snapshot_file.header["fetched_at"])
+
+    def get_snapshot(self):
+        stat = self._stat_live(self.snapshot_path)
+        if stat is None:
+            return None
+        state = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            loaded_state, snapshot = self._loaded
+            if loaded_state != state:
+                snapshot = Snapshot.load(self.snapshot_path, lazy=True)
+                self._loaded = (state, snapshot)
+            return snapshot
+
+    def set_snapshot(self, snapshot, ttl=None):
+        snapshot.save(self.snapshot_path)
+
+
+class RedisCacheBackend(CacheBackend):
+    """
+    The snapshot in Redis, shared by every host pointed at the server.
+
+    Args:
+        client: A redis.Redis (or FakeRedis) client; created from url if None
+        url: Server URL used when client is None
+        prefix: Prefix of every key this backend writes
+        ttl: See CacheBackend
+    """
+
+    def __init__(self, client=None, url: Optional[str] = None, prefix: str = "mev-dashboard:",
+                 ttl: Optional[float] = None):
+        super().__init__(ttl)
+        if client is None:
+            if redis is None:
+                raise RuntimeError("The Redis cache backend requires redis (pip install redis)")
+            client = redis.Redis.from_url(url or "redis://localhost:6379/0")
+        self.client = client
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._loaded = None  # Last Snapshot decoded, reused while the stored one is unchanged
+
+    def _key(self, *parts):
+        return self.prefix + ":".join(str(part) for part in parts)
+
+    @staticmethod
+    def _expiry(ttl):
+        return int(ttl) if ttl is not None else None
+
+    def freshness(self):
+        value = self.client.get(self._key("freshness"))
+        return tuple(json.loads(value)) if value is not None else None
+
+    def get_snapshot(self):
+        stored = self.freshness()
+        if stored is None:
+            return None
+        loaded = self._loaded
+        if loaded is not None and loaded.freshness == stored:
+            return loaded
+        data = self.client.get(self._key("snapshot"))
+        if data is None:
+            return None
+        try:
+            snapshot = Snapshot.from_bytes(data, lazy=True)
+        except Exception as e:
+            print(f"Ignoring unreadable snapshot in Redis: {e}")
+            return None
+        with self._lock:
+            self._loaded = snapshot
+        return snapshot
+
+    def set_snapshot(self, snapshot, ttl=None):
+        expiry = self._expiry(self._ttl(ttl))
+        pipeline = self.client.pipeline()
+        pipeline.set(self._key("snapshot"), snapshot.to_bytes(), ex=expiry)
+        pipeline.set(self._key("freshness"), json.dumps(snapshot.freshness), ex=expiry)
+        pipeline.execute()
+
+
+class FakeRedis:
+    """
+    In-process stand-in for a Redis server: get, set (with ex) and pipeline(),
+    the commands RedisCacheBackend uses, storing values as bytes like a real
+    server does.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data = {}  # key -> (bytes, expires_at)
+
+    @staticmethod
+    def _encode(value):
+        if isinstance(value, bytes):
+            return value
+        if isinstance(value, str):
+            return value.encode()
+        if isinstance(value, (int, float)):
+            return str(value).encode()
+        raise TypeError(f"Invalid input of type {type(value).__name__}")
+
+    def _live(self, key):
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        if entry[1] is not None and entry[1] <= time.time():
+            del self._data[key]
+            return None
+        return entry
+
+    def _get(self, key):
+        entry = self._live(key)
+        return entry[0] if entry is not None else None
+
+    def _set(self, key, value, ex=None):
+        self._data[key] = (self._encode(value), time.time() + ex if ex is not None else None)
+        return True
+
+    def get(self, key):
+        with self._lock:
+            return self._get(key)
+
+    def set(self, key, value, ex=None):
+        with self._lock:
+            return self._set(key, value, ex=ex)
+
+    def pipeline(self, transaction=True):
+        return _FakePipeline(self)
+
+
+class _FakePipeline:
+    """Queues commands and applies them together under the FakeRedis lock, like MULTI/EXEC."""
+
+    def __init__(self, client):
+        self._client = client
+        self._commands = []
+
+    def set(self, key, value, ex=None):
+        self._commands.append((self._client._set, (key, value), {"ex": ex}))
+        return self
+
+    def execute(self):
+        commands, self._commands = self._commands, []
+        with self._client._lock:
+            return [command(*args, **kwargs) for command, args, kwargs in commands]
+
+
+def make_backend(spec: str, ttl: Optional[float] = None) -> Optional[CacheBackend]:
+    """
+    Create a backend from a CACHE_BACKEND setting.
+
+    "memory", "fakeredis", "redis://host:port/db" (or "rediss://...") and
+    "file:/some/directory" are understood; an empty spec means no backend.
+    """
+    if not spec:
+        return None
+    if spec == "memory":
+        return MemoryCacheBackend(ttl=ttl)
+    if spec == "fakeredis":
+        return RedisCacheBackend(client=FakeRedis(), ttl=ttl)
+    if spec.startswith(("redis://", "rediss://", "unix://")):
+        return RedisCacheBackend(url=spec, ttl=ttl)
+    if spec.startswith("file:"):
+        return FilesystemCacheBackend(spec[len("file:"):], ttl=ttl)
+    raise ValueError(f"Unknown cache backend: {spec}")
@@ -0,0 +1,221 @@
+"""
+Optional NumPy backend for the builder summary.
+
+The builder balance rows are copied into flat arrays once, and the per-builder,
+per-block and per-token sums are grouped reductions (bincount/unique) instead
+of per-row dict updates. NumPy is not a hard dependency; check available()
+before using it.
+"""
+import math
+import sys
+import time
+from array import array
+
+try:
+    import numpy as np
+except ImportError:  # optional dependency
+    np = None
+
+import builders as builder_registry
+from models import normalize_trades
+
+
+def available():
+    """True if NumPy is installed and the columnar backend can be used."""
+    return np is not None
+
+
+class BalanceColumns:
+    """
+    The builder balance rows of a set of trades as parallel NumPy arrays.
+
+    Builders, blocks and tokens are replaced by dense integer ids, numbered in
+    order of first appearance so results can be emitted in the same order the
+    dict-based aggregation produces.
+    """
+
+    def __init__(self, trades, builder_addresses=None):
+        if np is None:
+            raise RuntimeError("The columnar backend requires numpy (pip install numpy)")
+
+        self.registry = builder_registry.resolve(builder_addresses)
+        builder_set = self.registry.by_address
+
+        builder_ids = {}
+        block_ids = {}
+        token_ids = {}
+        builders = array("q")
+        blocks = array("q")
+        tokens = array("q")
+        trade_ids = array("q")
+        balance_changes = array("d")
+        profits = array("d")
+
+        trade_count = 0
+        for trade_id, trade in enumerate(normalize_trades(trades)):
+            trade_count = trade_id + 1
+            block_number = trade.block_number
+            if not block_number:
+                continue
+            for balance in trade.balances:
+                address_lower = balance.address_lower
+                if address_lower not in builder_set:
+                    continue
+                currency_symbol = balance.currency_symbol
+                currency_name = balance.currency_name
+                token_key = f"{currency_name} ({currency_symbol})" if currency_symbol else currency_name
+
+                builders.append(builder_ids.setdefault(address_lower, len(builder_ids)))
+                blocks.append(block_ids.setdefault(block_number, len(block_ids)))
+                tokens.append(token_ids.setdefault(token_key, len(token_ids)))
+                trade_ids.append(trade_id)
+                balance_changes.append(balance.balance_change)
+                profits.append(balance.profit_usd)
+
+        self.builders = list(builder_ids)
+        self.tokens = list(token_ids)
+        self.block_count = len(block_ids)
+        self.trade_count = trade_count
+
+        self.builder = np.frombuffer(builders, dtype=np.int64)
+        self.block = np.frombuffer(blocks, dtype=np.int64)
+        self.token = np.frombuffer(tokens, dtype=np.int64)
+        self.trade = np.frombuffer(trade_ids, dtype=np.int64)
+        self.balance_change = np.frombuffer(balance_changes, dtype=np.float64)
+        self.profit_usd = np.frombuffer(profits, dtype=np.float64)
+
+    def __len__(self):
+        return len(self.builder)
+
+    def builder_summary(self):
+        """The calculate_stats() builder_summary list, computed with grouped reductions."""
+        rows = len(self)
+        if not rows:
+            return []
+
+        n_builders = len(self.builders)
+        n_tokens = len(self.tokens)
+        builder = self.builder
+
+        profit = np.bincount(builder, weights=self.profit_usd, minlength=n_builders)
+        change = np.bincount(builder, weights=self.balance_change, minlength=n_builders)
+
+        # Blocks built: distinct (builder, block) pairs per builder
+        block_pairs, first_row, pair_of_row = np.unique(
+            builder * self.block_count + self.block, return_index=True, return_inverse=True
+        )
+        blocks_built = np.bincount(block_pairs // self.block_count, minlength=n_builders)
+
+        # Trades built: distinct (builder, trade) pairs per builder
+        trade_pairs = np.unique(builder * self.trade_count + self.trade)
+        trades_built = np.bincount(trade_pairs // self.trade_count, minlength=n_builders)
+
+        # Per (builder, token) sums
+        builder_token = builder * n_tokens + self.token
+        size = n_builders * n_tokens
+        token_rows = np.bincount(builder_token, minlength=size)
+        token_change = np.bincount(builder_token, weights=self.balance_change, minlength=size)
+        token_profit = np.bincount(builder_token, weights=self.profit_usd, minlength=size)
+
+        # Order tokens the way the dict-based code inserts them: by the first
+        # appearance of the builder's block they first show up in, then by row
+        row_order = first_row[pair_of_row.reshape(-1)] * rows + np.arange(rows)
+        token_first = np.full(size, np.iinfo(np.int64).max, dtype=np.int64)
+        np.minimum.at(token_first, builder_token, row_order)
+
+        summary = []
+        for builder_id, address_lower in enumerate(self.builders):
+            base = builder_id * n_tokens
+            present = np.nonzero(token_rows[base:base + n_tokens])[0]
+            present = present[np.argsort(token_first[base + present], kind="stable")]
+            tokens = {
+                self.tokens[token_id]: {
+                    "balance_change": float(token_change[base + token_id]),
+                    "profit_usd": float(token_profit[base + token_id]),
+                }
+                for token_id in present
+            }
+            summary.append({
+                "address": self.registry.display_address(address_lower),
+                "label": self.registry.label(address_lower),
+                "total_profit_usd": float(profit[builder_id]),
+                "total_balance_change": float(change[builder_id]),
+                "total_transactions": int(trades_built[builder_id]),
+                "total_blocks": int(blocks_built[builder_id]),
+                "tokens": tokens,
+            })
+
+        # Sort builders by total profit USD (descending)
+        summary.sort(key=lambda x: x["total_profit_usd"], reverse=True)
+        return summary
+
+
+def builder_summary(trades, builder_addresses=None):
+    """Columnar equivalent of calculate_stats(...)["builder_summary"]."""
+    return BalanceColumns(trades, builder_addresses).builder_summary()
+
+
+def _summaries_match(expected, actual, rel_tol=1e-9, abs_tol=1e-6):
+    """Compare two builder summaries, allowing for float summation-order differences."""
+    def close(a, b):
+        return math.isclose(a, b, rel_tol=rel_tol, abs_tol=abs_tol)
+
+    expected = {row["address"]: row for row in expected}
+    actual = {row["address"]: row for row in actual}
+    if expected.keys() != actual.keys():
+        return False
+    for address, row in expected.items():
+        other = actual[address]
+        if (row["total_transactions"], row["total_blocks"], row.get("label")) != (
+            other["total_transactions"], other["total_blocks"], other.get("label")
+        ):
+            return False
+        if not (close(row["total_profit_usd"], other["total_profit_usd"])
+                and close(row["total_balance_change"], other["total_balance_change"])):
+            return False
+        if list(row["tokens"]) != list(other["tokens"]):
+            return False
+        for token, values in row["tokens"].items():
+            if not (close(values["balance_change"], other["tokens"][token]["balance_change"])
+                    and close(values["profit_usd"], other["tokens"][token]["profit_usd"])):
+                return False
+    return True
+
+
+if __name__ == "__main__":
+    # Timing against the dict-based aggregation (parity is checked by
+    # tests/test_columnar.py):
+    #   python columnar.py [rows ...]   (default: 20000 200000 2000000 balance rows)
+    from processing import calculate_stats
+    from synthetic import generate_trades
+
+    if not available():
+        sys.exit("numpy is not installed")
+
+    sizes = [int(arg) for arg in sys.argv[1:]] or [20000, 200000, 2000000]
+    rows_per_trade = 4
+    for rows in sizes:
+        trades = list(normalize_trades(generate_trades(rows // rows_per_trade, rows_per_trade=rows_per_trade)))
+        data = {"data": {"EVM": {"DEXTrades": trades}}}
+
+        start = time.perf_counter()
+        calculate_stats(data)
+        dict_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        calculate_stats(data, columnar=True)
+        columnar_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        columns = BalanceColumns(trades)
+        load_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        columns.builder_summary()
+        reduce_seconds = time.perf_counter() - start
+
+        print(
+            f"{rows:>9} rows: calculate_stats dict {dict_seconds * 1000:8.1f} ms, "
+            f"columnar {columnar_seconds * 1000:8.1f} ms "
+            f"(builder rows {len(columns)}: load {load_seconds * 1000:.1f} ms, "
+            f"reduce {reduce_seconds * 1000:.1f} ms)"
+        )
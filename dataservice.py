@@ -1,153 +1,322 @@
+import codecs
 import json
 import os
+import random
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
+from typing import Iterable, Iterator, NamedTuple, Optional
 import config
+import fields
+import metrics
 import requests
+from requests.adapters import HTTPAdapter
+from models import _balance_joins, block_number, trade_key  # noqa: F401 - block_number, trade_key re-exported
+from processing import _without, process_trade_details
 
-BITQUERY_URL = "https://streaming.bitquery.io/graphql"
-
-
-def _build_query(limit: int) -> str:
-    return f"""{{
-  EVM(dataset: realtime, network: eth) {{
-    DEXTrades(limit: {{count: {limit}}}, where: {{Fee: {{PriorityFeePerGas: {{eq: "0"}}}}}}) {{
-      Block {{
-        Time
-        Number
-      }}
-      Fee {{
-        Burnt
-        BurntInUSD
-        EffectiveGasPrice
-        EffectiveGasPriceInUSD
-        GasRefund
-        MinerReward
-        MinerRewardInUSD
-        PriorityFeePerGas
-        PriorityFeePerGasInUSD
-        Savings
-        SavingsInUSD
-        SenderFee
-        SenderFeeInUSD
-      }}
-      Receipt {{
-        ContractAddress
-        Status
-      }}
-      TransactionStatus {{
-        Success
-      }}
-      Log {{
-        Signature {{
-          Name
-        }}
-        SmartContract
-      }}
-      Call {{
-        From
-        InternalCalls
-        Signature {{
-          Name
-          Signature
-        }}
-        To
-        Value
-      }}
-      Transaction {{
-        Gas
-        Cost
-        CostInUSD
-        GasFeeCap
-        GasFeeCapInUSD
-        GasPrice
-        GasPriceInUSD
-        GasTipCap
-        GasTipCapInUSD
-        Index
-        Nonce
-        Protected
-        Time
-        Type
-        Value
-        ValueInUSD
-        Hash
-        From
-        To
-      }}
-      Trade {{
-        Buy {{
-          Amount
-          AmountInUSD
-          Buyer
-          Seller
-          Currency {{
-            Decimals
-            Name
-            Symbol
-            SmartContract
-          }}
-          Price
-          PriceInUSD
-        }}
-        Sell {{
-          Amount
-          AmountInUSD
-          Buyer
-          Seller
-          Currency {{
-            Name
-            Symbol
-            SmartContract
-          }}
-          Price
-          PriceInUSD
-        }}
-        Dex {{
-          ProtocolName
-          SmartContract
-          OwnerAddress
-        }}
-      }}
-      joinTransactionBalances(Transaction_Hash: Transaction_Hash, join: inner) {{
-        TokenBalance {{
-          Address
-          BalanceChangeReasonCode
-          Currency {{
-            Name
-            Symbol
-            SmartContract
-          }}
-          PostBalance
-          PostBalanceInUSD
-          PreBalance
-          PreBalanceInUSD
-        }}
-        Transaction {{
-          Hash
-        }}
-      }}
+BITQUERY_URL = os.environ.get("BITQUERY_URL", "https://streaming.bitquery.io/graphql")
+STREAM_CHUNK_SIZE = 64 * 1024
+
+CONNECT_TIMEOUT = 10  # Seconds to establish a connection
+READ_TIMEOUT = 60  # Seconds to wait for the first byte, and between bytes of a streamed body
+MAX_RETRIES = 4  # Retries after the first attempt on rate limits, server errors and dropped connections
+RETRY_BACKOFF = 1.0  # First retry delay in seconds; doubles with every attempt
+MAX_RETRY_DELAY = 30.0
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+POOL_SIZE = 8  # Keep-alive connections kept per host
+FETCH_CONCURRENCY = 4  # Most shard queries of a sharded fetch in flight at once
+# Field sets (see fields.py) selected by the trade fetch and subscription, and
+# by the on-demand drill-down of a builder's trades
+QUERY_FIELD_SETS = ("dashboard",)
+DETAIL_FIELD_SETS = ("drill_down",)
+DETAIL_TRADES_PER_TX = 20  # Row limit of a details query per transaction asked for
+
+metrics.counter("bitquery_response_bytes_total", "Bytes of Bitquery response bodies, decompressed")
+metrics.counter("bitquery_wire_bytes_total", "Bytes of Bitquery response bodies as received")
+metrics.counter("bitquery_trades_total", "DEXTrades received from Bitquery, before filtering")
+
+_DEX_TRADES_START = re.compile(r'"DEXTrades"\s*:\s*\[')
+_ERRORS_KEY = re.compile(r'"errors"\s*:\s*')
+# Characters of a streamed response outside the DEXTrades array kept to look
+# for GraphQL errors in; error responses are far smaller
+MAX_OUTSIDE_TEXT = 65536
+
+
+def _build_where(since_block: Optional[int] = None, until_block: Optional[int] = None) -> str:
+    clauses = ['Fee: {PriorityFeePerGas: {eq: "0"}}']
+    bounds = []
+    if since_block is not None:
+        bounds.append(f'gt: "{int(since_block)}"')
+    if until_block is not None:
+        bounds.append(f'le: "{int(until_block)}"')
+    if bounds:
+        clauses.append(f'Block: {{Number: {{{", ".join(bounds)}}}}}')
+    return "{" + ", ".join(clauses) + "}"
+
+
+def _build_balance_args(addresses: Optional[Iterable[str]] = None) -> str:
+    args = "Transaction_Hash: Transaction_Hash, join: inner"
+    if addresses:
+        address_list = ", ".join(json.dumps(addr.lower()) for addr in addresses)
+        args += f", where: {{TokenBalance: {{Address: {{in: [{address_list}]}}}}}}"
+    return args
+
+
+def _build_query(
+    limit: int,
+    since_block: Optional[int] = None,
+    addresses: Optional[Iterable[str]] = None,
+    until_block: Optional[int] = None,
+    field_sets: Iterable[str] = QUERY_FIELD_SETS,
+) -> str:
+    """
+    Build the DEXTrades GraphQL query, selecting the fields of field_sets
+    (see fields.py).
+
+    When addresses are given, the balance join is restricted to those
+    addresses server-side. Because the join is inner, trades that touch none of
+    the addresses are dropped by the API instead of being downloaded and
+    filtered locally, and only the matching balance rows are returned.
+    """
+    where = _build_where(since_block, until_block)
+    return _build_operation(
+        "", "dataset: realtime, network: eth", f"limit: {{count: {limit}}}, where: {where}", addresses, field_sets
+    )
+
+
+def _build_subscription(
+    addresses: Optional[Iterable[str]] = None,
+    field_sets: Iterable[str] = QUERY_FIELD_SETS,
+) -> str:
+    """
+    Build the DEXTrades GraphQL subscription: the same fields as _build_query(),
+    pushed as new blocks are indexed instead of returned once.
+    """
+    return _build_operation("subscription ", "network: eth", f"where: {_build_where()}", addresses, field_sets)
+
+
+def _build_details_query(tx_hashes: Iterable[str], field_sets: Iterable[str] = DETAIL_FIELD_SETS) -> str:
+    """Build a DEXTrades query for the trades of the given transactions, selecting field_sets."""
+    hashes = sorted({tx_hash.lower() for tx_hash in tx_hashes})
+    hash_list = ", ".join(json.dumps(tx_hash) for tx_hash in hashes)
+    trades_args = (
+        f"limit: {{count: {len(hashes) * DETAIL_TRADES_PER_TX}}}, "
+        f"where: {{Transaction: {{Hash: {{in: [{hash_list}]}}}}}}"
+    )
+    return _build_operation("", "dataset: realtime, network: eth", trades_args, field_sets=field_sets)
+
+
+def _build_operation(
+    operation: str,
+    evm_args: str,
+    trades_args: str,
+    addresses: Optional[Iterable[str]] = None,
+    field_sets: Iterable[str] = QUERY_FIELD_SETS,
+) -> str:
+    selection = fields.selection(
+        fields.union(field_sets), {"joinTransactionBalances": _build_balance_args(addresses)}
+    )
+    return f"""{operation}{{
+  EVM({evm_args}) {{
+    DEXTrades({trades_args}) {{
+{selection}
     }}
   }}
 }}"""
 
 
-def fetch_transaction_balances(limit: int = 20000) -> dict:
+class BitqueryClient:
     """
-    Fetch the latest DEXTrades from the Bitquery streaming API.
+    Bitquery GraphQL client over one pooled requests.Session.
 
-    Returns the decoded JSON payload as a Python dictionary.
+    Connections are kept alive between queries, responses are requested
+    compressed, and rate limits (429), server errors and dropped connections
+    are retried with jittered exponential backoff, honouring Retry-After.
+    Safe to share between threads.
+
+    Args:
+        url: GraphQL endpoint
+        token: OAuth token (config.TOKEN if None)
+        connect_timeout: Seconds to establish a connection
+        read_timeout: Seconds to wait for the response, and between chunks of a streamed body
+        max_retries: Retries after the first attempt
+        backoff: Delay before the first retry; doubled for each further one
+        max_delay: Upper bound of a single retry delay, Retry-After included
+        deadline: If set, give up instead of retrying once this many seconds
+            have passed since the query was first sent
+        pool_size: Keep-alive connections kept open per host
     """
-    query = _build_query(limit)
-    payload = json.dumps({"query": query, "variables": "{}"})
 
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {config.TOKEN}",
-    }
+    def __init__(
+        self,
+        url: str = BITQUERY_URL,
+        token: Optional[str] = None,
+        connect_timeout: float = CONNECT_TIMEOUT,
+        read_timeout: float = READ_TIMEOUT,
+        max_retries: int = MAX_RETRIES,
+        backoff: float = RETRY_BACKOFF,
+        max_delay: float = MAX_RETRY_DELAY,
+        deadline: Optional[float] = None,
+        pool_size: int = POOL_SIZE,
+    ):
+        self.url = url
+        self.token = token
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_delay = max_delay
+        self.deadline = deadline
+
+        self.session = requests.Session()
+        # Retries are done here rather than by urllib3, so they can be logged,
+        # counted and bounded by the deadline
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({
+            "Content-Type": "application/json",
+            "Accept-Encoding": "gzip, deflate",
+        })
+
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.retries = 0
+        self.failures = 0
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def _retry_delay(self, attempt: int, response: Optional[requests.Response]) -> float:
+        """Seconds to wait before retry number attempt (0-based)."""
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after:
+            try:
+                delay = float(retry_after)
+            except ValueError:
+                try:
+                    delay = parsedate_to_datetime(retry_after).timestamp() - time.time()
+                except (TypeError, ValueError):
+                    delay = None
+            if delay is not None:
+                return min(max(delay, 0.0), self.max_delay)
+        # Full jitter keeps concurrent refreshes from retrying in lockstep
+        return min(self.backoff * 2 ** attempt, self.max_delay) * random.uniform(0.5, 1.0)
+
+    def post(self, query: str, stream: bool = False) -> requests.Response:
+        """
+        Send a GraphQL query and return the successful response.
+
+        With stream=True the body is left unread so it can be consumed with
+        iter_content(); the caller should close the response.
+
+        Raises:
+            requests.HTTPError: If the API keeps failing, or fails with a status
+                that is not worth retrying
+            requests.ConnectionError, requests.Timeout: If the connection keeps failing
+        """
+        payload = json.dumps({"query": query, "variables": "{}"})
+        token = self.token if self.token is not None else config.TOKEN
+        headers = {"Authorization": f"Bearer {token}"}
+        started = time.monotonic()
+
+        attempt = 0
+        while True:
+            self._count("requests")
+            response = None
+            try:
+                response = self.session.post(
+                    self.url, headers=headers, data=payload, timeout=self.timeout, stream=stream
+                )
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = e
+            else:
+                if response.status_code not in RETRY_STATUSES:
+                    if not response.ok:
+                        response.close()
+                        self._count("failures")
+                    response.raise_for_status()
+                    return response
+                error = requests.HTTPError(f"{response.status_code} from {self.url}", response=response)
 
-    response = requests.post(BITQUERY_URL, headers=headers, data=payload, timeout=60)
-    response.raise_for_status()
+            delay = self._retry_delay(attempt, response)
+            if response is not None:
+                # Release the connection back to the pool
+                response.close()
+            out_of_time = self.deadline is not None and time.monotonic() - started + delay > self.deadline
+            if attempt >= self.max_retries or out_of_time:
+                self._count("failures")
+                raise error
+            attempt += 1
+            self._count("retries")
+            print(f"Bitquery request failed ({error}); retry {attempt}/{self.max_retries} in {delay:.1f}s")
+            time.sleep(delay)
+
+    def stats(self) -> dict:
+        """Counters for monitoring the client."""
+        return {"requests": self.requests, "retries": self.retries, "failures": self.failures}
+
+    def close(self):
+        self.session.close()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> BitqueryClient:
+    """The process-wide BitqueryClient, created on first use."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = BitqueryClient()
+    return _client
+
+
+def _post_query(query: str, stream: bool = False) -> requests.Response:
+    # Until the response headers arrive (the whole body unless streaming), retries included
+    with metrics.span("bitquery_request"):
+        return get_client().post(query, stream=stream)
+
+
+def _count_response_bytes(response: requests.Response, decoded: int) -> None:
+    metrics.inc("bitquery_response_bytes_total", decoded)
+    # Bytes read off the socket, before gzip decoding
+    tell = getattr(response.raw, "tell", None)
+    metrics.inc("bitquery_wire_bytes_total", tell() if tell is not None else decoded)
+
+
+def _count_bytes(chunks: Iterable[bytes], sizes: list) -> Iterator[bytes]:
+    for chunk in chunks:
+        sizes.append(len(chunk))
+        yield chunk
+
+
+def fetch_transaction_balances(
+    limit: int = 20000,
+    since_block: Optional[int] = None,
+    addresses: Optional[Iterable[str]] = None,
+    until_block: Optional[int] = None,
+) -> dict:
+    """
+    Fetch the latest DEXTrades from the Bitquery streaming API.
+
+    Args:
+        limit: Maximum number of trades to request
+        since_block: If set, only request trades from blocks strictly newer than this one
+        addresses: If set, only request trades whose balance changes touch one of these addresses
+        until_block: If set, only request trades from blocks up to and including this one
+
+    Returns the decoded JSON payload as a Python dictionary.
+    """
+    response = _post_query(_build_query(limit, since_block, addresses, until_block))
     
-    data = response.json()
+    _count_response_bytes(response, len(response.content))
+    with metrics.span("json_decode"):
+        data = response.json()
     
     # Validate response structure
     if not isinstance(data, dict):
@@ -179,6 +348,401 @@ def fetch_transaction_balances(limit: int = 20000) -> dict:
     return data
 
 
+def iter_dex_trades(chunks: Iterable[bytes]) -> Iterator[dict]:
+    """
+    Incrementally decode the data.EVM.DEXTrades array of a response body.
+
+    Consumes raw byte chunks and yields each trade as soon as it has been fully
+    received, so only one trade (plus one chunk of unparsed text) is held in
+    memory at a time instead of the whole decoded payload.
+
+    The text around the array is kept for a GraphQL "errors" list, which is
+    printed once the body has been read.
+
+    Raises:
+        RuntimeError: If the response has errors and no DEXTrades array
+        json.JSONDecodeError: If a trade is malformed or the body is cut off
+    """
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    chunks = iter(chunks)
+    buf = ""
+    pos = 0
+    # None before the array, True inside it, False after it
+    in_array = None
+    exhausted = False
+    # Text outside the array, up to MAX_OUTSIDE_TEXT characters
+    outside = []
+    outside_size = 0
+
+    while True:
+        if in_array is None:
+            match = _DEX_TRADES_START.search(buf, pos)
+            if match:
+                kept = buf[pos:match.start()]
+                in_array = True
+                pos = match.end()
+            else:
+                # Keep a tail in case the key straddles two chunks
+                end = len(buf) if exhausted else max(pos, len(buf) - 64)
+                kept = buf[pos:end]
+                pos = end
+        elif in_array:
+            while pos < len(buf) and buf[pos] in " \t\r\n,":
+                pos += 1
+            kept = ""
+            if pos < len(buf):
+                if buf[pos] == "]":
+                    in_array = False
+                    pos += 1
+                    continue
+                try:
+                    trade, end = decoder.raw_decode(buf, pos)
+                except json.JSONDecodeError:
+                    if exhausted:
+                        raise
+                else:
+                    pos = end
+                    yield trade
+                    continue
+        else:
+            kept = buf[pos:]
+            pos = len(buf)
+        if kept and outside_size < MAX_OUTSIDE_TEXT:
+            outside.append(kept)
+            outside_size += len(kept)
+
+        if exhausted:
+            break
+        chunk = next(chunks, None)
+        if chunk is None:
+            exhausted = True
+            buf = buf[pos:] + utf8.decode(b"", final=True)
+        else:
+            buf = buf[pos:] + utf8.decode(chunk)
+        pos = 0
+
+    errors = _graphql_errors("".join(outside), decoder)
+    if errors:
+        print(f"Bitquery returned errors: {errors}")
+        if in_array is None:
+            raise RuntimeError(f"Bitquery returned errors and no trades: {errors}")
+    if in_array is None:
+        print("Response missing 'DEXTrades' list")
+    elif in_array:
+        raise json.JSONDecodeError("Unterminated DEXTrades array", buf, len(buf))
+
+
+def _graphql_errors(text: str, decoder: json.JSONDecoder):
+    """The value of the "errors" key in text (part of a response body), or None."""
+    match = _ERRORS_KEY.search(text)
+    if match is None:
+        return None
+    try:
+        return decoder.raw_decode(text, match.end())[0]
+    except json.JSONDecodeError:
+        # Cut off at MAX_OUTSIDE_TEXT; report it as it is
+        return text[match.end():match.end() + 500]
+
+
+def stream_transaction_balances(
+    limit: int = 20000,
+    since_block: Optional[int] = None,
+    addresses: Optional[Iterable[str]] = None,
+    until_block: Optional[int] = None,
+) -> Iterator[dict]:
+    """
+    Like fetch_transaction_balances(), but yield DEXTrades one at a time as
+    the response body arrives instead of decoding it in one go.
+    """
+    response = _post_query(_build_query(limit, since_block, addresses, until_block), stream=True)
+    sizes = []
+    # Reading the body and decoding it interleave; time each separately
+    chunks = metrics.IterationTimer(
+        _count_bytes(response.iter_content(chunk_size=STREAM_CHUNK_SIZE), sizes), "bitquery_download"
+    )
+    trades = metrics.IterationTimer(iter_dex_trades(chunks), "json_decode", inner=chunks)
+    try:
+        with response:
+            yield from trades
+    finally:
+        chunks.record()
+        trades.record()
+        _count_response_bytes(response, sum(sizes))
+        metrics.inc("bitquery_trades_total", trades.items)
+
+
+def fetch_trade_details(tx_hashes: Iterable[str], field_sets: Iterable[str] = DETAIL_FIELD_SETS) -> dict:
+    """
+    Fetch the drill-down fields of the trades of the given transactions, which
+    the dashboard's own query leaves out.
+
+    Args:
+        tx_hashes: Transaction hashes to look up, in one query
+        field_sets: Field sets to select (see fields.py)
+
+    Returns:
+        process_trade_details() of each trade found, as a list per lower-cased
+        transaction hash (transactions without trades are left out), or None
+        if the response was not a DEXTrades payload
+    """
+    tx_hashes = list(tx_hashes)
+    if not tx_hashes:
+        return {}
+    response = _post_query(_build_details_query(tx_hashes, field_sets))
+    _count_response_bytes(response, len(response.content))
+    with metrics.span("json_decode"):
+        data = response.json()
+
+    evm = ((data.get("data") if isinstance(data, dict) else None) or {}).get("EVM") or {}
+    trades = evm.get("DEXTrades") if isinstance(evm, dict) else None
+    if not isinstance(trades, list):
+        print(f"Unexpected trade details response: {str(data)[:200]}")
+        return None
+
+    details = {}
+    for trade in trades:
+        if isinstance(trade, dict):
+            row = process_trade_details(trade)
+            details.setdefault(row["tx_hash"].lower(), []).append(row)
+    return details
+
+
+def tally_blocks(trades: Iterable[dict], block_counts: dict) -> Iterator[dict]:
+    """Pass trades through unchanged while counting them per block number into block_counts."""
+    for trade in trades:
+        number = block_number(trade)
+        if number is not None:
+            block_counts[number] = block_counts.get(number, 0) + 1
+        yield trade
+
+
+def merge_block_keys(block_counts: dict, block_keys: dict, delta_keys: dict) -> tuple:
+    """
+    Fold newly fetched trades into per-block counts, counting each trade once,
+    so a batch delivered again (a reconnect backfill overlapping the stream, a
+    block fetched again because it had arrived in part) doesn't inflate them.
+
+    Args:
+        block_counts: Unfiltered trade counts per block of the window
+        block_keys: trade_key()s of those trades, per block. A block missing
+            here (e.g. one loaded from a snapshot file, which doesn't keep the
+            keys) can't be deduplicated and keeps the larger of its counts
+        delta_keys: trade_key()s of the newly fetched trades, per block
+
+    Returns:
+        New (block_counts, block_keys) dicts; the arguments are left unchanged
+    """
+    counts = dict(block_counts)
+    keys = dict(block_keys)
+    for number, new in delta_keys.items():
+        known = keys.get(number)
+        if known is not None:
+            merged = known | new
+        elif number in counts:
+            counts[number] = max(counts[number], len(new))
+            continue
+        else:
+            merged = new
+        keys[number] = merged
+        counts[number] = len(merged)
+    return counts, keys
+
+
+def window_start_block(block_counts: dict, limit: int) -> Optional[int]:
+    """
+    Oldest block that still belongs to the latest `limit` trades.
+
+    block_counts should hold the unfiltered per-block trade counts. The block
+    the limit falls in is kept whole: a full fetch of `limit` trades returns
+    part of it, but which part can't be told from counts, so an incrementally
+    maintained window holds at least `limit` trades, and at most that block's
+    remaining trades more than a full fetch.
+    """
+    total = 0
+    start = None
+    for number in sorted(block_counts, reverse=True):
+        start = number
+        total += block_counts[number]
+        if total >= limit:
+            break
+    return start
+
+
+def splice_trades(existing: list, added: list, evicted: list) -> list:
+    """
+    The window's trades after processing.StatsAccumulator.merge() returned
+    (added, evicted) for it: the new trades first, matching the newest-first
+    order of the API, then the existing ones that were not evicted.
+    """
+    if not evicted:
+        return added + existing
+    return added + _without(existing, {id(trade) for trade in evicted})
+
+
+class Shard(NamedTuple):
+    """One query of a sharded fetch: blocks in (since_block, until_block], balance join on addresses."""
+    since_block: Optional[int] = None
+    until_block: Optional[int] = None
+    addresses: Optional[tuple] = None
+
+
+def plan_shards(
+    shards: int,
+    by: str = "blocks",
+    since_block: Optional[int] = None,
+    addresses: Optional[Iterable[str]] = None,
+    block_counts: Optional[dict] = None,
+    limit: int = 20000,
+) -> list:
+    """
+    Split one DEXTrades query into up to `shards` queries that together return
+    the same trades.
+
+    by="blocks" cuts the block range of the latest `limit` trades into ranges
+    of about equal trade counts. The range is only known from the per-block
+    counts of a previous fetch (block_counts); the top shard is left open for
+    blocks produced since. Without counts, or when only blocks newer than
+    since_block are wanted, there is no range worth splitting and a single
+    shard is returned.
+
+    by="builders" splits addresses into subsets, each queried with the
+    balance join restricted to its subset. This needs the server-side address
+    filter, so addresses must be given.
+
+    Returns:
+        A list of Shard
+    """
+    address_tuple = tuple(addresses) if addresses else None
+    if by == "builders":
+        if not address_tuple:
+            raise ValueError("Sharding by builder needs the addresses to filter on")
+        count = max(1, min(shards, len(address_tuple)))
+        return [
+            Shard(since_block, None, address_tuple[i::count])
+            for i in range(count)
+        ]
+    if by != "blocks":
+        raise ValueError(f"Unknown shard strategy: {by}")
+
+    if shards <= 1 or since_block is not None or not block_counts:
+        return [Shard(since_block, None, address_tuple)]
+
+    start = window_start_block(block_counts, limit)
+    numbers = sorted(number for number in block_counts if number >= start)
+    total = sum(block_counts[number] for number in numbers)
+    # shards - 1 closed ranges over the known blocks, plus the open top one
+    per_shard = total / max(1, shards - 1)
+    plan = []
+    lower = numbers[0] - 1
+    running = 0
+    for number in numbers[:-1]:
+        running += block_counts[number]
+        if len(plan) < shards - 2 and running >= per_shard * (len(plan) + 1):
+            plan.append(Shard(lower, number, address_tuple))
+            lower = number
+    plan.append(Shard(lower, numbers[-1], address_tuple))
+    plan.append(Shard(numbers[-1], None, address_tuple))
+    return plan
+
+
+def _trade_position(trade: dict) -> tuple:
+    """(block, transaction index, log index) of a raw DEXTrade, for newest-first ordering."""
+    position = [block_number(trade)]
+    for section, key in (("Transaction", "Index"), ("Log", "Index")):
+        value = trade.get(section) or {}
+        try:
+            position.append(int(value.get(key)) if isinstance(value, dict) else None)
+        except (TypeError, ValueError):
+            position.append(None)
+    return tuple(-1 if part is None else part for part in position)
+
+
+def _balance_key(balance) -> tuple:
+    token_balance = balance.get("TokenBalance") if isinstance(balance, dict) else None
+    if not isinstance(token_balance, dict):
+        return (repr(balance),)
+    currency = token_balance.get("Currency") or {}
+    return (
+        token_balance.get("Address"),
+        currency.get("SmartContract") if isinstance(currency, dict) else None,
+        token_balance.get("BalanceChangeReasonCode"),
+        token_balance.get("PreBalance"),
+        token_balance.get("PostBalance"),
+    )
+
+
+def merge_shard_trades(results: Iterable[Iterable[dict]], limit: Optional[int] = None) -> list:
+    """
+    Combine the trades of several shards into one newest-first list.
+
+    A trade returned by more than one shard is kept once. Builder shards each
+    return only their own addresses' balance rows, so those are unioned.
+
+    Args:
+        results: Each shard's trades
+        limit: Keep only the newest `limit` trades, like a single query would
+    """
+    merged = {}
+    for trades in results:
+        for trade in trades:
+            key = trade_key(trade)
+            existing = merged.get(key)
+            if existing is None:
+                merged[key] = trade
+                continue
+            balances = list(_balance_joins(existing.get("joinTransactionBalances")))
+            seen = {_balance_key(balance) for balance in balances}
+            for balance in _balance_joins(trade.get("joinTransactionBalances")):
+                if _balance_key(balance) not in seen:
+                    seen.add(_balance_key(balance))
+                    balances.append(balance)
+            existing["joinTransactionBalances"] = balances
+    trades = sorted(merged.values(), key=_trade_position, reverse=True)
+    return trades[:limit] if limit is not None else trades
+
+
+def fetch_sharded(
+    shards: list,
+    limit: int = 20000,
+    concurrency: int = FETCH_CONCURRENCY,
+) -> dict:
+    """
+    Run the queries of a plan_shards() plan concurrently and merge the results.
+
+    Every shard is asked for up to `limit` trades and the merged list is cut
+    back to the newest `limit`. If any shard fails the whole fetch fails,
+    rather than publishing a window with a hole in it.
+
+    Args:
+        shards: The Shard list to fetch
+        limit: Maximum number of trades in the result
+        concurrency: Most queries in flight at once, to stay under the API's rate limit
+
+    Returns:
+        A payload shaped like fetch_transaction_balances()'s
+    """
+    def fetch(shard):
+        started = time.monotonic()
+        trades = list(stream_transaction_balances(
+            limit=limit, since_block=shard.since_block, addresses=shard.addresses,
+            until_block=shard.until_block,
+        ))
+        print(
+            f"Shard blocks ({shard.since_block}, {shard.until_block}]"
+            f"{f' for {len(shard.addresses)} addresses' if shard.addresses else ''}: "
+            f"{len(trades)} trades in {time.monotonic() - started:.2f}s"
+        )
+        return trades
+
+    if len(shards) == 1:
+        results = [fetch(shards[0])]
+    else:
+        with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(shards))), thread_name_prefix="shard") as pool:
+            results = list(pool.map(fetch, shards))
+    return {"data": {"EVM": {"DEXTrades": merge_shard_trades(results, limit)}}}
+
+
 def save_run_log(data: dict, path: str = "run.log") -> None:
     """Persist the supplied response dict to disk."""
     with open(path, "w", encoding="utf-8") as f:
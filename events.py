@@ -0,0 +1,114 @@
+"""
+Live dashboard updates, pushed to browsers as Server-Sent Events.
+
+Each time a snapshot is published, the builder summary is compared with the
+previous one and only the builders whose numbers changed are broadcast. The
+dashboard patches those table rows in place instead of reloading the page
+(and re-rendering every table); only when builders join or leave the summary
+does it reload.
+"""
+import json
+import queue
+import threading
+from typing import Iterator, Optional
+
+# Builder summary fields sent to the page
+BUILDER_FIELDS = ("total_profit_usd", "total_balance_change", "total_transactions", "total_blocks", "tokens")
+
+
+def builder_deltas(previous_stats: Optional[dict], stats: Optional[dict]) -> list:
+    """
+    Builders whose summary changed between two calculate_stats() results.
+
+    Each entry has the builder's new totals plus profit_delta and new_blocks,
+    the change since the previous stats.
+    """
+    if not stats:
+        return []
+    before = {row["address"]: row for row in (previous_stats or {}).get("builder_summary", [])}
+    deltas = []
+    for row in stats.get("builder_summary", []):
+        old = before.get(row["address"])
+        if old is not None and all(old[field] == row[field] for field in BUILDER_FIELDS):
+            continue
+        delta = {"address": row["address"]}
+        for field in BUILDER_FIELDS:
+            delta[field] = row[field]
+        delta["profit_delta"] = row["total_profit_usd"] - (old["total_profit_usd"] if old else 0.0)
+        delta["new_blocks"] = row["total_blocks"] - (old["total_blocks"] if old else 0)
+        deltas.append(delta)
+    return deltas
+
+
+def format_event(event: str, data, event_id=None) -> str:
+    """Encode one Server-Sent Event."""
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    for line in json.dumps(data, separators=(",", ":")).splitlines():
+        lines.append(f"data: {line}")
+    return "\n".join(lines) + "\n\n"
+
+
+class EventBroker:
+    """
+    Fans published events out to every connected client.
+
+    Each subscriber gets a bounded queue; a client too slow to keep up loses
+    its oldest events rather than holding up the publisher.
+    """
+
+    def __init__(self, queue_size: int = 100):
+        self.queue_size = queue_size
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self.published = 0
+        self.dropped = 0
+
+    def subscribe(self) -> queue.Queue:
+        subscriber = queue.Queue(self.queue_size)
+        with self._lock:
+            self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: queue.Queue) -> None:
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    def publish(self, event: str, data, event_id=None) -> None:
+        """Queue an event for every subscriber."""
+        message = format_event(event, data, event_id)
+        with self._lock:
+            subscribers = list(self._subscribers)
+        self.published += 1
+        for subscriber in subscribers:
+            while True:
+                try:
+                    subscriber.put_nowait(message)
+                    break
+                except queue.Full:
+                    try:
+                        subscriber.get_nowait()
+                        self.dropped += 1
+                    except queue.Empty:
+                        pass
+
+    def stream(self, subscriber: queue.Queue, keepalive: float = 15.0) -> Iterator[str]:
+        """
+        Yield a subscriber's events as they arrive, with a comment line every
+        keepalive seconds so proxies don't close an idle connection. Unsubscribes
+        when the client goes away.
+        """
+        try:
+            while True:
+                try:
+                    yield subscriber.get(timeout=keepalive)
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+        finally:
+            self.unsubscribe(subscriber)
@@ -0,0 +1,178 @@
+"""
+Registry of the DEXTrades fields each consumer reads, so queries select only
+what is used instead of every field Bitquery offers:
+
+    fields.register("dashboard", ("Block.Number", "Trade.Buy.AmountInUSD", ...))
+    fields.selection(fields.union(["dashboard"]))
+
+Paths are dotted field names below DEXTrades. The consumer that reads the
+fields declares them next to the code that reads them (models.py for the
+Trade record behind the dashboard, processing.py for the builder drill-down),
+and a query is generated from the union of the sets it serves.
+"""
+import re
+from typing import Iterable, Optional
+
+# Every set includes these: trades are keyed, ordered and merged by them
+IDENTITY_FIELDS = ("Block.Number", "Transaction.Hash", "Transaction.Index", "Log.Index")
+
+FIELD_SETS = {}
+
+_TOKEN = re.compile(r"[A-Za-z_][A-Za-z0-9_]*|[{}()]")
+
+
+def register(name: str, paths: Iterable[str]) -> tuple:
+    """
+    Declare the fields of set name; registering a name again replaces it.
+
+    Returns:
+        The paths as a tuple, e.g. for the consumer to keep as a constant
+    """
+    paths = tuple(paths)
+    for path in paths:
+        if not path or "" in path.split("."):
+            raise ValueError(f"Invalid field path {path!r} in field set {name!r}")
+    FIELD_SETS[name] = paths
+    return paths
+
+
+def union(names: Iterable[str]) -> tuple:
+    """
+    The identity fields and the fields of every set in names, each once, in
+    the order they were first declared.
+    """
+    paths = dict.fromkeys(IDENTITY_FIELDS)
+    for name in names:
+        if name not in FIELD_SETS:
+            raise KeyError(f"Unknown field set {name!r}; registered: {', '.join(sorted(FIELD_SETS))}")
+        paths.update(dict.fromkeys(FIELD_SETS[name]))
+    return tuple(paths)
+
+
+def _tree(paths: Iterable[str]) -> dict:
+    tree = {}
+    for path in paths:
+        node = tree
+        for part in path.split("."):
+            node = node.setdefault(part, {})
+    return tree
+
+
+def selection(paths: Iterable[str], arguments: Optional[dict] = None, indent: int = 6) -> str:
+    """
+    GraphQL selection set text for paths, one field per line.
+
+    Args:
+        paths: Dotted field paths, e.g. from union()
+        arguments: Argument text of fields that take some, by top-level name,
+            e.g. {"joinTransactionBalances": "join: inner"}
+        indent: Spaces before the top-level fields
+    """
+    arguments = arguments or {}
+    lines = []
+
+    def render(tree, depth, top):
+        pad = " " * depth
+        for name, subtree in tree.items():
+            args = f"({arguments[name]})" if top and arguments.get(name) else ""
+            if subtree:
+                lines.append(f"{pad}{name}{args} {{")
+                render(subtree, depth + 2, False)
+                lines.append(f"{pad}}}")
+            else:
+                lines.append(f"{pad}{name}{args}")
+
+    render(_tree(paths), indent, True)
+    return "\n".join(lines)
+
+
+def parse_selection(query: str, field: str = "DEXTrades") -> tuple:
+    """
+    The dotted paths a query selects below field, ignoring arguments; the
+    inverse of selection(), up to order. Returns () if field isn't selected.
+    """
+    tokens = _TOKEN.findall(query)
+    try:
+        i = tokens.index(field) + 1
+    except ValueError:
+        return ()
+    paths = []
+    stack = []
+    previous = None
+    depth = 0
+    while i < len(tokens):
+        token = tokens[i]
+        i += 1
+        if token == "(":
+            # Skip the arguments, which can nest parentheses in values
+            nesting = 1
+            while i < len(tokens) and nesting:
+                nesting += {"(": 1, ")": -1}.get(tokens[i], 0)
+                i += 1
+        elif depth == 0 and token != "{":
+            # field is a leaf, without a selection set of its own
+            break
+        elif token == "{":
+            depth += 1
+            if depth > 1:
+                stack.append(previous)
+                previous = None
+        elif token == "}":
+            if previous is not None:
+                paths.append(".".join(stack + [previous]))
+                previous = None
+            depth -= 1
+            if depth == 0:
+                break
+            stack.pop()
+        else:
+            if previous is not None:
+                paths.append(".".join(stack + [previous]))
+            previous = token
+    return tuple(paths)
+
+
+def project(value, paths: Iterable[str]):
+    """
+    Copy of a raw trade (or list of them) keeping only paths, as the API
+    would return it for a query selecting them. Lists are projected item by
+    item, as are dicts of items (the dict form of joinTransactionBalances).
+    """
+    return _project(value, _tree(paths))
+
+
+def _project(value, tree):
+    if not tree:
+        return value
+    if isinstance(value, list):
+        return [_project(item, tree) for item in value]
+    if isinstance(value, dict):
+        if not any(key in value for key in tree) and all(isinstance(item, dict) for item in value.values()):
+            return {key: _project(item, tree) for key, item in value.items()}
+        return {key: _project(value[key], subtree) for key, subtree in tree.items() if key in value}
+    return value
+
+
+if __name__ == "__main__":
+    # How much smaller the projections are than the full trade
+    # (tests/test_fields.py checks they lose nothing):
+    #   python fields.py [trades]
+    import json
+    import sys
+    # The sets are registered on the imported module, not on this __main__ one
+    import processing  # noqa: F401 - registers drill_down
+    from fields import project, union
+    from synthetic import generate_trades
+
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    full = list(generate_trades(count))
+    dashboard_paths = union(["dashboard"])
+    detail_paths = union(["drill_down"])
+    lean = project(full, dashboard_paths)
+    details = project(full, detail_paths)
+
+    size = lambda value: len(json.dumps(value, separators=(",", ":")))
+    print(f"{count:,} trades")
+    print(f"  full:       {size(full):>12,} bytes")
+    print(f"  dashboard:  {size(lean):>12,} bytes ({size(lean) / size(full):.0%}), {len(dashboard_paths)} fields")
+    print(f"  drill_down: {size(details):>12,} bytes ({size(details) / size(full):.0%}), {len(detail_paths)} fields")
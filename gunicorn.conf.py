@@ -0,0 +1,18 @@
+"""
+gunicorn settings, read from the working directory by `gunicorn app:app`.
+
+Every open dashboard keeps its /events stream (Server-Sent Events) open. A
+sync worker serves one request at a time, so each tab would take a whole
+worker and a few tabs would stall every other page; gthread workers give a
+stream a thread instead.
+"""
+import os
+
+workers = int(os.environ.get("WEB_CONCURRENCY", "4"))
+worker_class = "gthread"
+# Requests in flight per worker, open /events streams included; workers x
+# threads bounds the dashboards that can stay connected at once
+threads = int(os.environ.get("GUNICORN_THREADS", "32"))
+# gthread workers heartbeat from their main thread, so a long-lived stream
+# isn't mistaken for a hung worker
+timeout = 60
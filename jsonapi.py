@@ -0,0 +1,149 @@
+"""
+Encoding for the JSON API: a fast JSON encoder, field selection and response
+compression.
+
+orjson and brotli are used when installed (pip install orjson brotli); without
+them responses are encoded with the json module and compressed with gzip only.
+"""
+import gzip
+import json
+from typing import Iterable, Optional
+
+try:
+    import orjson
+except ImportError:  # optional dependency
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # optional dependency
+    brotli = None
+
+# Bodies smaller than this are sent uncompressed; the headers would cost more than they save
+MIN_COMPRESS_SIZE = 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+def _default(value):
+    # calculate_stats() keeps unique addresses and blocks as sets
+    if isinstance(value, (set, frozenset)):
+        return sorted(value, key=str)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(value) -> bytes:
+    """Compact JSON encoding of value, as UTF-8 bytes."""
+    if orjson is not None:
+        # Stats dicts have int keys (reason codes, block numbers)
+        return orjson.dumps(value, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(value, default=_default, separators=(",", ":"), ensure_ascii=False).encode()
+
+
+def parse_fields(value: Optional[str]) -> Optional[tuple]:
+    """
+    The fields= query parameter as a sorted tuple of dotted paths, or None if
+    it is missing or empty.
+
+    "builder_summary.address,total_transactions" selects total_transactions and
+    the address of every builder_summary entry.
+    """
+    if not value:
+        return None
+    fields = {field.strip() for field in value.split(",")}
+    fields.discard("")
+    return tuple(sorted(fields)) or None
+
+
+def select_fields(value, fields: Iterable[str]):
+    """
+    Copy of value keeping only the dotted paths in fields.
+
+    A path descends into dicts by key and applies to every element of a list,
+    so "builder_summary.address" keeps the address of each builder. Unknown
+    fields are ignored.
+    """
+    tree = {}
+    for field in fields:
+        node = tree
+        for part in field.split("."):
+            # An empty node means "everything below"; a shorter path wins
+            if node is not None and part in node and not node[part]:
+                node = None
+                break
+            node = node.setdefault(part, {})
+        if node:
+            node.clear()
+    return _select(value, tree)
+
+
+def _select(value, tree):
+    if not tree:
+        return value
+    if isinstance(value, list):
+        return [_select(item, tree) for item in value]
+    if isinstance(value, dict):
+        return {key: _select(value[key], subtree) for key, subtree in tree.items() if key in value}
+    return value
+
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """The best compression the client accepts ("br" or "gzip"), or None."""
+    if not accept_encoding:
+        return None
+    accepted = set()
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        if params.replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            continue
+        accepted.add(name.strip().lower())
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+
+def compress(body: bytes, encoding: Optional[str]) -> tuple:
+    """
+    Compress body for the negotiated encoding.
+
+    Returns:
+        A (body, content_encoding) tuple; content_encoding is None if the body
+        was left as it is
+    """
+    if encoding is None or len(body) < MIN_COMPRESS_SIZE:
+        return body, None
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY), "br"
+    if encoding == "gzip":
+        # mtime=0 so the same body always compresses to the same bytes
+        return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0), "gzip"
+    return body, None
+
+
+if __name__ == "__main__":
+    # Encoder and compression timings on a synthetic snapshot's stats
+    # (tests/test_app.py checks the output):
+    #   python jsonapi.py [trades]
+    import sys
+    import time
+    from processing import StatsAccumulator
+    from models import normalize_trades
+    from synthetic import generate_trades
+
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    stats = StatsAccumulator().update(normalize_trades(list(generate_trades(count)))).result()
+
+    start = time.perf_counter()
+    body = dumps(stats)
+    elapsed = time.perf_counter() - start
+    print(f"{'orjson' if orjson is not None else 'json'}: {len(body):,} bytes in {elapsed * 1000:.1f}ms")
+    for encoding in ("gzip", "br"):
+        if encoding == "br" and brotli is None:
+            continue
+        start = time.perf_counter()
+        compressed, _ = compress(body, encoding)
+        print(f"{encoding}: {len(compressed):,} bytes in {(time.perf_counter() - start) * 1000:.1f}ms")
+    selected = select_fields(stats, ("total_transactions", "builder_summary.address"))
+    print(f"fields=total_transactions,builder_summary.address: {len(dumps(selected)):,} bytes")
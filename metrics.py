@@ -0,0 +1,260 @@
+"""
+In-process metrics: counters, gauges and timing spans, exposed in the
+Prometheus text format by the /metrics route.
+
+    with metrics.span("render", template="dashboard.html"):
+        ...
+    metrics.inc("cache_requests_total", result="hit")
+
+Every span is recorded in the span_seconds histogram, labelled by name, so
+where request and refresh time goes can be read off one metric.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterable, Optional
+
+PREFIX = "mev_dashboard_"
+# Seconds; spans range from sub-millisecond cache hits to minute-long fetches
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+def _label_key(labels: dict) -> tuple:
+    return tuple(sorted(labels.items()))
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(key: tuple, extra: Optional[tuple] = None) -> str:
+    items = list(key) + ([extra] if extra else [])
+    if not items:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in items) + "}"
+
+
+def _format_value(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """
+    A monotonically increasing value per label set.
+
+    With a callback, the values are read from it at scrape time instead, for
+    totals another object already keeps. It returns a number, or a dict of
+    label tuples (as in (("result", "hit"),)) to numbers.
+    """
+
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, callback: Optional[Callable] = None):
+        self.name = name
+        self.help = help
+        self.callback = callback
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        if self.callback is not None:
+            try:
+                values = self.callback()
+            except Exception as e:
+                print(f"Metric {self.name} callback failed: {e}")
+                return
+            if not isinstance(values, dict):
+                values = {(): values}
+        else:
+            with self._lock:
+                values = dict(self._values)
+        for key, value in values.items():
+            if value is not None:
+                yield self.name, key, None, value
+
+
+class Gauge(Counter):
+    """A value that can go up and down; see Counter for callbacks."""
+
+    kind = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        with self._lock:
+            self._values[_label_key(labels)] = value
+
+
+class Histogram:
+    """Observations counted into cumulative buckets, with their sum and count, per label set."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, buckets: Iterable[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self._lock = threading.Lock()
+        self._values = {}  # label key -> [bucket counts..., sum, count]
+
+    def observe(self, value: float, **labels) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[i] += 1
+            entry[-2] += value
+            entry[-1] += 1
+
+    def samples(self):
+        with self._lock:
+            values = [(key, list(entry)) for key, entry in self._values.items()]
+        for key, entry in values:
+            for bound, count in zip(self.buckets, entry):
+                yield f"{self.name}_bucket", key, ("le", _format_value(float(bound))), count
+            yield f"{self.name}_sum", key, None, entry[-2]
+            yield f"{self.name}_count", key, None, entry[-1]
+
+
+class Registry:
+    """The metrics of one process, by name."""
+
+    def __init__(self, prefix: str = PREFIX):
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def _get(self, cls, name, help, **kwargs):
+        full_name = self.prefix + name
+        metric = self._metrics.get(full_name)
+        if metric is None:
+            with self._lock:
+                metric = self._metrics.get(full_name)
+                if metric is None:
+                    metric = self._metrics[full_name] = cls(full_name, help, **kwargs)
+        if type(metric) is not cls:
+            raise ValueError(f"Metric {full_name} is already registered as a {metric.kind}")
+        return metric
+
+    def counter(self, name: str, help: str = "", callback: Optional[Callable] = None) -> Counter:
+        counter = self._get(Counter, name, help)
+        if callback is not None:
+            counter.callback = callback
+        return counter
+
+    def gauge(self, name: str, help: str = "", callback: Optional[Callable] = None) -> Gauge:
+        gauge = self._get(Gauge, name, help)
+        if callback is not None:
+            gauge.callback = callback
+        return gauge
+
+    def histogram(self, name: str, help: str = "", buckets: Iterable[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._get(Histogram, name, help, buckets=buckets)
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format (version 0.0.4)."""
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda metric: metric.name)
+        lines = []
+        for metric in metrics:
+            if metric.help:
+                lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, key, extra, value in metric.samples():
+                lines.append(f"{name}{_format_labels(key, extra)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+_spans = REGISTRY.histogram("span_seconds", "Time spent in each instrumented stage")
+
+
+def counter(name: str, help: str = "", callback: Optional[Callable] = None) -> Counter:
+    return REGISTRY.counter(name, help, callback)
+
+
+def gauge(name: str, help: str = "", callback: Optional[Callable] = None) -> Gauge:
+    return REGISTRY.gauge(name, help, callback)
+
+
+def histogram(name: str, help: str = "", buckets: Iterable[float] = DEFAULT_BUCKETS) -> Histogram:
+    return REGISTRY.histogram(name, help, buckets)
+
+
+def inc(name: str, amount: float = 1, **labels) -> None:
+    """Increment counter name (registered on first use) by amount."""
+    REGISTRY.counter(name).inc(amount, **labels)
+
+
+def observe_span(name: str, seconds: float, **labels) -> None:
+    """Record seconds spent in stage name."""
+    _spans.observe(seconds, span=name, **labels)
+
+
+@contextmanager
+def span(name: str, **labels):
+    """Time the enclosed block as stage name, whether it returns or raises."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_span(name, time.perf_counter() - start, **labels)
+
+
+class IterationTimer:
+    """
+    Times how long an iterator takes to produce its items, for stages that are
+    interleaved in one streaming pipeline (network read, JSON decode, filter).
+
+    Args:
+        iterable: The items to pass through
+        name: Span the time is recorded as once the iterator is exhausted, or
+            None to only measure it (for use as another timer's inner)
+        inner: IterationTimer of the iterator this one consumes; its time is
+            subtracted so each stage reports only its own work
+    """
+
+    def __init__(self, iterable: Iterable, name: Optional[str], inner: Optional["IterationTimer"] = None, **labels):
+        self._iterator = iter(iterable)
+        self.name = name
+        self.inner = inner
+        self.labels = labels
+        self.seconds = 0.0
+        self.items = 0
+        self._recorded = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        start = time.perf_counter()
+        try:
+            item = next(self._iterator)
+        except StopIteration:
+            self.seconds += time.perf_counter() - start
+            self.record()
+            raise
+        self.seconds += time.perf_counter() - start
+        self.items += 1
+        return item
+
+    @property
+    def own_seconds(self) -> float:
+        return self.seconds - (self.inner.seconds if self.inner is not None else 0.0)
+
+    def record(self) -> None:
+        """Record the span now, e.g. when the consumer stops early; only the first call counts."""
+        if not self._recorded and self.name is not None:
+            self._recorded = True
+            observe_span(self.name, max(0.0, self.own_seconds), **self.labels)
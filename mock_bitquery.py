@@ -0,0 +1,194 @@
+"""
+Local stand-in for Bitquery's GraphQL endpoint, so the dashboard can be run and
+timed end to end offline:
+
+    python mock_bitquery.py [--port 8766] [--trades 50000] [--latency 0.2] [--rate-limit 5]
+    BITQUERY_URL=http://127.0.0.1:8766/graphql python app.py
+
+It answers DEXTrades queries built by dataservice._build_query() and
+_build_details_query() from a fixed set of synthetic trades (see
+synthetic.py), honouring the limit, the block range (gt/le), the balance
+join's address filter, the transaction hash filter and the selected fields.
+Responses are gzipped when the client accepts it, like the real endpoint.
+"""
+import argparse
+import gzip
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import fields
+from models import _balance_joins
+from synthetic import generate_trades
+
+_LIMIT = re.compile(r"limit:\s*\{\s*count:\s*(\d+)")
+_SINCE = re.compile(r'Number:\s*\{[^}]*gt:\s*"(\d+)"')
+_UNTIL = re.compile(r'Number:\s*\{[^}]*le:\s*"(\d+)"')
+_ADDRESSES = re.compile(r"Address:\s*\{\s*in:\s*\[([^\]]*)\]")
+_HASHES = re.compile(r"Hash:\s*\{\s*in:\s*\[([^\]]*)\]")
+
+
+class MockBitqueryServer:
+    """
+    Args:
+        host: Interface to listen on
+        port: Port to listen on (0 picks a free one; see .port once started)
+        trades: Number of synthetic trades served, newest block first
+        latency: Seconds to wait before answering each query
+        rate_limit: Queries accepted per second; further ones get a 429 with
+            Retry-After (None for no limit)
+        **kwargs: Passed on to synthetic.generate_trades()
+    """
+
+    def __init__(self, host="127.0.0.1", port=8766, trades=50000, latency=0.0, rate_limit=None, **kwargs):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.trades = list(generate_trades(trades, **kwargs))
+        self.queries = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+        self._window = (0, 0)  # (second, queries accepted in it)
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}/graphql"
+
+    def answer(self, query: str) -> list:
+        """The trades a query selects, newest first."""
+        match = _LIMIT.search(query)
+        limit = int(match.group(1)) if match else None
+        match = _SINCE.search(query)
+        since_block = int(match.group(1)) if match else None
+        match = _UNTIL.search(query)
+        until_block = int(match.group(1)) if match else None
+        match = _ADDRESSES.search(query)
+        addresses = {address.lower() for address in json.loads(f"[{match.group(1)}]")} if match else None
+        match = _HASHES.search(query)
+        tx_hashes = {tx_hash.lower() for tx_hash in json.loads(f"[{match.group(1)}]")} if match else None
+        paths = fields.parse_selection(query)
+
+        selected = []
+        for trade in self.trades:
+            if tx_hashes is not None and trade["Transaction"]["Hash"].lower() not in tx_hashes:
+                continue
+            number = int(trade["Block"]["Number"])
+            if until_block is not None and number > until_block:
+                continue
+            if since_block is not None and number <= since_block:
+                # Trades are ordered newest block first
+                break
+            if addresses is not None:
+                # The inner join keeps only the matching balance rows, and
+                # drops trades without any
+                rows = [
+                    row for row in _balance_joins(trade["joinTransactionBalances"])
+                    if (row["TokenBalance"]["Address"] or "").lower() in addresses
+                ]
+                if not rows:
+                    continue
+                trade = dict(trade, joinTransactionBalances=rows)
+            selected.append(fields.project(trade, paths) if paths else trade)
+            if limit is not None and len(selected) >= limit:
+                break
+        return selected
+
+    def _admit(self):
+        """True if a query may be answered now under the rate limit."""
+        with self._lock:
+            self.queries += 1
+            if self.rate_limit is None:
+                return True
+            second = int(time.time())
+            start, count = self._window
+            if start != second:
+                start, count = second, 0
+            if count >= self.rate_limit:
+                self.rejected += 1
+                return False
+            self._window = (start, count + 1)
+            return True
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send(self, status, body=b"", headers=()):
+                self.send_response(status)
+                for name, value in headers:
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                try:
+                    payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                    query = payload["query"]
+                except (ValueError, KeyError, TypeError):
+                    self._send(400, b'{"errors":[{"message":"Invalid request"}]}', [("Content-Type", "application/json")])
+                    return
+                if not server._admit():
+                    self._send(429, b'{"errors":[{"message":"Rate limit exceeded"}]}',
+                               [("Content-Type", "application/json"), ("Retry-After", "1")])
+                    return
+                if server.latency:
+                    time.sleep(server.latency)
+
+                body = json.dumps({"data": {"EVM": {"DEXTrades": server.answer(query)}}}).encode()
+                headers = [("Content-Type", "application/json")]
+                if "gzip" in (self.headers.get("Accept-Encoding") or ""):
+                    body = gzip.compress(body, compresslevel=1)
+                    headers.append(("Content-Encoding", "gzip"))
+                self._send(200, body, headers)
+
+        return Handler
+
+    def start(self):
+        """Serve on a daemon thread; returns once the server is listening."""
+        self._server = ThreadingHTTPServer((self.host, self.port), self._handler())
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, name="mock-bitquery", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+    def serve_forever(self):
+        self._server = ThreadingHTTPServer((self.host, self.port), self._handler())
+        self._server.daemon_threads = True
+        self._server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mock Bitquery GraphQL server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--trades", type=int, default=50000)
+    parser.add_argument("--rows-per-trade", type=int, default=4)
+    parser.add_argument("--builder-hit-rate", type=float, default=0.3)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds before each answer")
+    parser.add_argument("--rate-limit", type=int, default=None, help="queries per second before 429s")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    server = MockBitqueryServer(
+        args.host, args.port, trades=args.trades, latency=args.latency, rate_limit=args.rate_limit,
+        rows_per_trade=args.rows_per_trade, builder_hit_rate=args.builder_hit_rate, seed=args.seed,
+    )
+    print(f"Mock Bitquery server with {len(server.trades)} trades on http://{args.host}:{args.port}/graphql")
+    server.serve_forever()
@@ -0,0 +1,175 @@
+"""
+Local stand-in for Bitquery's subscription endpoint, so subscription ingestion
+can be run and checked offline:
+
+    python mock_subscription.py [--port 8765] [--rate 2] [--trades-per-block 20] [--drop-after N]
+
+It speaks the graphql-ws protocol and pushes one block of synthetic trades
+(see synthetic.py) every 1/rate seconds. Block numbers keep counting while a
+client is disconnected, so a reconnecting client has a gap to backfill;
+trades_since() answers that backfill from the blocks generated so far.
+"""
+import argparse
+import asyncio
+import json
+import threading
+import time
+
+try:
+    import websockets
+except ImportError:  # optional dependency
+    websockets = None
+
+from synthetic import generate_trades
+
+
+class MockSubscriptionServer:
+    """
+    Args:
+        host: Interface to listen on
+        port: Port to listen on (0 picks a free one; see .port once started)
+        rate: Blocks pushed per second
+        trades_per_block: Synthetic trades in each block
+        start_block: Number of the first block
+        drop_after: Close each connection after this many messages, to
+            exercise reconnects (None keeps connections open)
+        builder_hit_rate: Passed on to synthetic.generate_trades()
+    """
+
+    def __init__(self, host="127.0.0.1", port=8765, rate=2.0, trades_per_block=20,
+                 start_block=21000000, drop_after=None, builder_hit_rate=0.3):
+        if websockets is None:
+            raise RuntimeError("The mock subscription server requires websockets (pip install websockets)")
+        self.host = host
+        self.port = port
+        self.rate = rate
+        self.trades_per_block = trades_per_block
+        self.drop_after = drop_after
+        self.builder_hit_rate = builder_hit_rate
+        self.next_block = start_block
+        self.history = []  # Every trade generated, oldest block first
+        self.connections = 0
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._stopped = None
+        self._loop = None
+        self._thread = None
+
+    @property
+    def url(self):
+        return f"ws://{self.host}:{self.port}/graphql"
+
+    def _generate_block(self):
+        """The next block's trades, timestamped now."""
+        with self._lock:
+            number = self.next_block
+            self.next_block += 1
+            trades = list(generate_trades(
+                self.trades_per_block, trades_per_block=self.trades_per_block,
+                start_block=number, builder_hit_rate=self.builder_hit_rate, seed=number,
+            ))
+            block_time = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+            for trade in trades:
+                trade["Block"]["Time"] = block_time
+            self.history.extend(trades)
+            return trades
+
+    def trades_since(self, since_block):
+        """Trades of the blocks newer than since_block generated so far, newest first (a backfill query)."""
+        with self._lock:
+            return [trade for trade in reversed(self.history) if int(trade["Block"]["Number"]) > since_block]
+
+    async def _handle(self, websocket, path=None):
+        self.connections += 1
+        sent = 0
+        subscription_id = None
+        async for raw in websocket:
+            message = json.loads(raw)
+            kind = message.get("type")
+            if kind == "connection_init":
+                await websocket.send(json.dumps({"type": "connection_ack"}))
+            elif kind in ("start", "subscribe"):
+                subscription_id = message.get("id")
+                break
+            elif kind == "connection_terminate":
+                return
+        if subscription_id is None:
+            return
+
+        queue = asyncio.Queue()
+        self._subscribers.add(queue)
+        try:
+            while True:
+                try:
+                    trades = await asyncio.wait_for(queue.get(), 10)
+                except asyncio.TimeoutError:
+                    await websocket.send(json.dumps({"type": "ka"}))
+                    continue
+                await websocket.send(json.dumps({
+                    "id": subscription_id,
+                    "type": "data",
+                    "payload": {"data": {"EVM": {"DEXTrades": trades}}},
+                }))
+                sent += 1
+                if self.drop_after is not None and sent >= self.drop_after:
+                    await websocket.close()
+                    return
+        finally:
+            self._subscribers.discard(queue)
+
+    async def _produce(self):
+        # Blocks keep coming whether or not anyone is subscribed, like the chain
+        while True:
+            await asyncio.sleep(1 / self.rate)
+            trades = self._generate_block()
+            for queue in list(self._subscribers):
+                queue.put_nowait(trades)
+
+    async def _serve(self):
+        self._stopped = asyncio.Event()
+        async with websockets.serve(self._handle, self.host, self.port, subprotocols=["graphql-ws"]) as server:
+            self.port = server.sockets[0].getsockname()[1]
+            producer = asyncio.ensure_future(self._produce())
+            self._ready.set()
+            try:
+                await self._stopped.wait()
+            finally:
+                producer.cancel()
+
+    def serve_forever(self):
+        asyncio.run(self._serve())
+
+    def start(self):
+        """Serve on a daemon thread; returns once the server is listening."""
+        def run():
+            self._loop = asyncio.new_event_loop()
+            self._loop.run_until_complete(self._serve())
+
+        self._thread = threading.Thread(target=run, name="mock-subscription", daemon=True)
+        self._thread.start()
+        self._ready.wait(10)
+        return self
+
+    def stop(self):
+        if self._loop is not None and self._stopped is not None:
+            self._loop.call_soon_threadsafe(self._stopped.set)
+        if self._thread is not None:
+            self._thread.join(5)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mock Bitquery subscription server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--rate", type=float, default=2.0, help="blocks per second")
+    parser.add_argument("--trades-per-block", type=int, default=20)
+    parser.add_argument("--drop-after", type=int, default=None, help="close connections after N messages")
+    args = parser.parse_args()
+
+    server = MockSubscriptionServer(
+        args.host, args.port, rate=args.rate, trades_per_block=args.trades_per_block,
+        drop_after=args.drop_after,
+    )
+    print(f"Mock subscription server on ws://{args.host}:{args.port}/graphql")
+    server.serve_forever()
@@ -0,0 +1,362 @@
+import sys
+from typing import Iterable, Iterator, Optional
+import fields
+
+
+def safe_float(value, default=0.0):
+    """Safely convert a value to float, handling None, empty strings, and invalid values."""
+    # The API sends numbers as strings; float() skips surrounding whitespace
+    # itself and rejects empty strings
+    if isinstance(value, str):
+        try:
+            return float(value)
+        except ValueError:
+            return default
+    if isinstance(value, (int, float)):
+        return float(value)
+    return default
+
+
+def _intern(value, _sys_intern=sys.intern):
+    """Intern repeated strings (symbols, protocol names, addresses) so snapshots share them."""
+    return _sys_intern(value) if type(value) is str else value
+
+
+def _as_dict(value):
+    return value if isinstance(value, dict) else {}
+
+
+def _balance_joins(raw_balances):
+    """Normalize joinTransactionBalances, which the API returns as a list, a single item or a dict of items."""
+    if isinstance(raw_balances, list):
+        return raw_balances
+    if isinstance(raw_balances, dict):
+        if "TokenBalance" in raw_balances:
+            return [raw_balances]
+        return [v for v in raw_balances.values() if isinstance(v, dict)]
+    return []
+
+
+class BalanceChange:
+    """One TokenBalance row of a trade's joinTransactionBalances, with numbers pre-parsed."""
+
+    __slots__ = (
+        "address",
+        "address_lower",
+        "currency_name",
+        "currency_symbol",
+        "currency_address",
+        "pre_balance",
+        "post_balance",
+        "balance_change",
+        "profit_usd",
+        "reason_code",
+    )
+
+    def __init__(self, token_balance):
+        get = token_balance.get
+        currency = _as_dict(get("Currency"))
+        address = get("Address") or ""
+
+        # Addresses mostly arrive lower-cased already; both fields then share one string
+        self.address_lower = address_lower = _intern(address.lower())
+        self.address = address_lower if address == address_lower else _intern(address)
+        self.currency_name = _intern(currency.get("Name", "Unknown"))
+        self.currency_symbol = _intern(currency.get("Symbol", ""))
+        self.currency_address = _intern(currency.get("SmartContract", ""))
+        # Plain float() first; safe_float() only for the odd missing or malformed number
+        try:
+            pre_balance = float(get("PreBalance"))
+            post_balance = float(get("PostBalance"))
+            profit_usd = float(get("PostBalanceInUSD")) - float(get("PreBalanceInUSD"))
+        except (TypeError, ValueError):
+            pre_balance = safe_float(get("PreBalance"))
+            post_balance = safe_float(get("PostBalance"))
+            profit_usd = safe_float(get("PostBalanceInUSD")) - safe_float(get("PreBalanceInUSD"))
+        self.pre_balance = pre_balance
+        self.post_balance = post_balance
+        self.balance_change = post_balance - pre_balance
+        self.profit_usd = profit_usd
+        self.reason_code = _intern(get("BalanceChangeReasonCode"))
+
+    def to_row(self):
+        """Plain tuple of the record's fields, for compact serialization."""
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    @classmethod
+    def from_row(cls, row):
+        record = cls.__new__(cls)
+        (record.address, record.address_lower, record.currency_name, record.currency_symbol,
+         record.currency_address, record.pre_balance, record.post_balance, record.balance_change,
+         record.profit_usd, record.reason_code) = row
+        return record
+
+
+class TradeSide:
+    """The Buy or Sell leg of a trade."""
+
+    __slots__ = (
+        "amount",
+        "amount_usd",
+        "price",
+        "price_usd",
+        "currency_name",
+        "currency_symbol",
+        "currency_address",
+    )
+
+    def __init__(self, side):
+        currency = _as_dict(side.get("Currency"))
+
+        get = side.get
+        try:
+            self.amount = float(get("Amount"))
+            self.amount_usd = float(get("AmountInUSD"))
+            self.price = float(get("Price"))
+            self.price_usd = float(get("PriceInUSD"))
+        except (TypeError, ValueError):
+            self.amount = safe_float(get("Amount"))
+            self.amount_usd = safe_float(get("AmountInUSD"))
+            self.price = safe_float(get("Price"))
+            self.price_usd = safe_float(get("PriceInUSD"))
+        self.currency_name = _intern(currency.get("Name", ""))
+        self.currency_symbol = _intern(currency.get("Symbol", ""))
+        self.currency_address = _intern(currency.get("SmartContract", ""))
+
+    def to_row(self):
+        """Plain tuple of the record's fields, for compact serialization."""
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    @classmethod
+    def from_row(cls, row):
+        record = cls.__new__(cls)
+        (record.amount, record.amount_usd, record.price, record.price_usd,
+         record.currency_name, record.currency_symbol, record.currency_address) = row
+        return record
+
+
+class Trade:
+    """
+    A DEXTrade reduced to the fields the dashboard uses.
+
+    Built once per trade when the payload is ingested, so the filter, the
+    aggregation and the drill-down all work on pre-parsed floats and
+    pre-lowered addresses instead of re-walking the raw nested dicts.
+    """
+
+    __slots__ = (
+        "tx_hash",
+        "tx_index",
+        "log_index",
+        "block_number",
+        "block_height",
+        "block_time",
+        "buy",
+        "sell",
+        "dex_protocol",
+        "balances",
+    )
+
+    def __init__(self, raw):
+        transaction = _as_dict(raw.get("Transaction"))
+        block = _as_dict(raw.get("Block"))
+        log = _as_dict(raw.get("Log"))
+        trade_info = _as_dict(raw.get("Trade"))
+        dex_info = _as_dict(trade_info.get("Dex"))
+
+        self.tx_hash = transaction.get("Hash", "")
+        # Position of the transaction in its block, for ordering trades within a block
+        try:
+            self.tx_index = int(transaction.get("Index"))
+        except (TypeError, ValueError):
+            self.tx_index = None
+        self.log_index = log.get("Index")
+        self.block_number = _intern(block.get("Number", ""))
+        try:
+            self.block_height = int(self.block_number)
+        except (TypeError, ValueError):
+            self.block_height = None
+        self.block_time = _intern(block.get("Time", ""))
+        self.buy = TradeSide(_as_dict(trade_info.get("Buy")))
+        self.sell = TradeSide(_as_dict(trade_info.get("Sell")))
+        self.dex_protocol = _intern(dex_info.get("ProtocolName", "Unknown"))
+
+        balances = []
+        for balance_join in _balance_joins(raw.get("joinTransactionBalances")):
+            if not isinstance(balance_join, dict):
+                continue
+            token_balance = balance_join.get("TokenBalance", {})
+            if not token_balance or not isinstance(token_balance, dict):
+                continue
+            balances.append(BalanceChange(token_balance))
+        self.balances = tuple(balances)
+
+    def to_row(self):
+        """
+        Nested tuples of plain values (str/int/float/None) that from_row()
+        turns back into an equal Trade; suitable for marshal, which also
+        preserves the interning of the strings.
+        """
+        return (
+            self.tx_hash,
+            self.tx_index,
+            self.log_index,
+            self.block_number,
+            self.block_height,
+            self.block_time,
+            self.buy.to_row(),
+            self.sell.to_row(),
+            self.dex_protocol,
+            tuple(balance.to_row() for balance in self.balances),
+        )
+
+    @classmethod
+    def from_row(cls, row):
+        record = cls.__new__(cls)
+        (record.tx_hash, record.tx_index, record.log_index, record.block_number, record.block_height,
+         record.block_time, buy, sell, record.dex_protocol, balances) = row
+        record.buy = TradeSide.from_row(buy)
+        record.sell = TradeSide.from_row(sell)
+        from_balance_row = BalanceChange.from_row
+        record.balances = tuple([from_balance_row(balance) for balance in balances])
+        return record
+
+    @property
+    def key(self):
+        """Identity across fetches: the transaction hash plus the swap's log index."""
+        return (self.tx_hash, self.log_index)
+
+    @property
+    def position(self):
+        """
+        (block, transaction index, log index) as ints, for ordering trades
+        chronologically; missing parts sort first, as -1.
+        """
+        try:
+            log_index = int(self.log_index)
+        except (TypeError, ValueError):
+            log_index = -1
+        return (
+            self.block_height if self.block_height is not None else -1,
+            self.tx_index if self.tx_index is not None else -1,
+            log_index,
+        )
+
+    @property
+    def value_usd(self):
+        return max(self.buy.amount_usd, self.sell.amount_usd)
+
+    def involves(self, address_lower):
+        """True if one of the trade's balance changes belongs to address_lower."""
+        for balance in self.balances:
+            if balance.address_lower == address_lower:
+                return True
+        return False
+
+
+# The DEXTrades fields Trade reads, and so everything the dashboard (stats,
+# filter, archive, builder pages) needs from the API
+DASHBOARD_FIELDS = fields.register("dashboard", (
+    "Block.Time",
+    "Block.Number",
+    "Transaction.Hash",
+    "Transaction.Index",
+    "Log.Index",
+    "Trade.Buy.Amount",
+    "Trade.Buy.AmountInUSD",
+    "Trade.Buy.Currency.Name",
+    "Trade.Buy.Currency.Symbol",
+    "Trade.Buy.Currency.SmartContract",
+    "Trade.Buy.Price",
+    "Trade.Buy.PriceInUSD",
+    "Trade.Sell.Amount",
+    "Trade.Sell.AmountInUSD",
+    "Trade.Sell.Currency.Name",
+    "Trade.Sell.Currency.Symbol",
+    "Trade.Sell.Currency.SmartContract",
+    "Trade.Sell.Price",
+    "Trade.Sell.PriceInUSD",
+    "Trade.Dex.ProtocolName",
+    "joinTransactionBalances.TokenBalance.Address",
+    "joinTransactionBalances.TokenBalance.BalanceChangeReasonCode",
+    "joinTransactionBalances.TokenBalance.Currency.Name",
+    "joinTransactionBalances.TokenBalance.Currency.Symbol",
+    "joinTransactionBalances.TokenBalance.Currency.SmartContract",
+    "joinTransactionBalances.TokenBalance.PostBalance",
+    "joinTransactionBalances.TokenBalance.PostBalanceInUSD",
+    "joinTransactionBalances.TokenBalance.PreBalance",
+    "joinTransactionBalances.TokenBalance.PreBalanceInUSD",
+))
+
+
+def block_number(trade) -> Optional[int]:
+    """Return a trade's Block.Number as an int, or None if it is missing or malformed."""
+    if isinstance(trade, Trade):
+        return trade.block_height
+    if not isinstance(trade, dict):
+        return None
+    block = trade.get("Block") or {}
+    if not isinstance(block, dict):
+        return None
+    try:
+        return int(block.get("Number"))
+    except (TypeError, ValueError):
+        return None
+
+
+def trade_key(trade) -> tuple:
+    """
+    Identity of a DEXTrade across fetches.
+
+    A transaction can contain several swaps (multi-hop routes), so the hash
+    alone is not unique; the swap's log index disambiguates them.
+    """
+    if isinstance(trade, Trade):
+        return trade.key
+    transaction = trade.get("Transaction") or {}
+    log = trade.get("Log") or {}
+    tx_hash = transaction.get("Hash", "") if isinstance(transaction, dict) else ""
+    log_index = log.get("Index") if isinstance(log, dict) else None
+    return (tx_hash, log_index)
+
+
+def involves_any(trade, addresses) -> bool:
+    """
+    True if one of trade's balance changes belongs to an address in
+    addresses (lower-cased keys, e.g. BuilderRegistry.by_address).
+
+    Raw DEXTrade dicts are checked on their joinTransactionBalances rows as
+    they are, so a trade that doesn't match is never normalized.
+    """
+    if isinstance(trade, Trade):
+        for balance in trade.balances:
+            if balance.address_lower in addresses:
+                return True
+        return False
+    for balance_join in _balance_joins(trade.get("joinTransactionBalances")):
+        if not isinstance(balance_join, dict):
+            continue
+        token_balance = balance_join.get("TokenBalance")
+        if not token_balance or not isinstance(token_balance, dict):
+            continue
+        address = token_balance.get("Address")
+        if address and address.lower() in addresses:
+            return True
+    return False
+
+
+def normalize_trade(trade):
+    """Convert a raw DEXTrade dict into a Trade; Trades are returned unchanged, anything else as None."""
+    if isinstance(trade, Trade):
+        return trade
+    if isinstance(trade, dict):
+        return Trade(trade)
+    return None
+
+
+def normalize_trades(trades: Iterable) -> Iterator[Trade]:
+    """Lazily normalize raw DEXTrades, skipping entries that are not trades."""
+    for trade in trades:
+        record = normalize_trade(trade)
+        if record is not None:
+            yield record
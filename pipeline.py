@@ -0,0 +1,93 @@
+"""
+Single-pass ingest: each trade of a response is counted for its block and
+checked against the builder registry on its raw balance rows; only a trade
+that matches is normalized, folded into the aggregates and recorded in the
+address index, instead of going through tally_blocks(),
+iter_trades_by_addresses(), StatsAccumulator.update() and
+snapshot.build_address_index() one after another:
+
+    ingest = IngestPass(registry).feed(stream_transaction_balances())
+    Snapshot(data, version, block_counts=ingest.block_counts, block_keys=ingest.block_keys,
+             accumulator=ingest.accumulator, builder_index=ingest.builder_index)
+
+The membership check stops at the first builder row, so trades that are
+dropped (most of a window) cost a few dict lookups and are never normalized
+or aggregated.
+"""
+from typing import Iterable, Optional
+import builders as builder_registry
+from models import Trade, involves_any, normalize_trade
+from processing import StatsAccumulator
+
+
+class IngestPass:
+    """
+    Filter, aggregate and index a stream of trades in one pass.
+
+    Args:
+        registry: BuilderRegistry or addresses to keep trades of; None for the
+            current registry (see builders.resolve())
+        aggregate: If False, only count blocks and filter, e.g. for a delta
+            that is merged into a previous window before it is aggregated
+    """
+
+    def __init__(self, registry=None, aggregate: bool = True):
+        self.registry = builder_registry.resolve(registry)
+        # The kept trades, in the order received
+        self.trades = []
+        # trade_key()s of every trade received, kept or not, per block
+        self.block_keys = {}
+        self.accumulator: Optional[StatsAccumulator] = StatsAccumulator(self.registry) if aggregate else None
+
+    @property
+    def builder_index(self) -> Optional[dict]:
+        """Map of lower-cased address to its kept trades, kept by the accumulator as it adds them."""
+        return self.accumulator.index if self.accumulator is not None else None
+
+    @property
+    def block_counts(self) -> dict:
+        """Unfiltered trade counts per block, as tally_blocks() counts them (each trade once)."""
+        return {number: len(keys) for number, keys in self.block_keys.items()}
+
+    def feed(self, raw_trades: Iterable) -> "IngestPass":
+        """Ingest raw DEXTrade dicts (or Trade records); returns self."""
+        trades = self.trades
+        block_keys = self.block_keys
+        by_address = self.registry.by_address
+        accumulator = self.accumulator
+
+        for raw in raw_trades:
+            # Raw trades are counted and matched as they are; only the kept
+            # ones are normalized
+            if isinstance(raw, dict):
+                # models.block_number() and trade_key(), inlined
+                try:
+                    number = int(raw["Block"]["Number"])
+                except (KeyError, TypeError, ValueError):
+                    number = None
+                if number is not None:
+                    transaction = raw.get("Transaction")
+                    log = raw.get("Log")
+                    key = (
+                        transaction.get("Hash", "") if isinstance(transaction, dict) else "",
+                        log.get("Index") if isinstance(log, dict) else None,
+                    )
+            elif isinstance(raw, Trade):
+                number = raw.block_height
+                key = (raw.tx_hash, raw.log_index)
+            else:
+                continue
+            if number is not None:
+                keys = block_keys.get(number)
+                if keys is None:
+                    keys = block_keys[number] = set()
+                keys.add(key)
+
+            if not involves_any(raw, by_address):
+                continue
+            trade = normalize_trade(raw)
+            if accumulator is not None:
+                accumulator.add(trade)
+            trades.append(trade)
+        return self
+
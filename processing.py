@@ -1,9 +1,464 @@
-from collections import defaultdict
-from filter import DEFAULT_ADDRESSES
+import copy
+import heapq
+import builders as builder_registry
+import columnar as columnar_backend
+import fields
+from models import _as_dict, normalize_trades, safe_float
 
+# The DEXTrades fields process_trade_details() reads; fetched per builder page
+# on demand rather than for every trade of the window
+DETAIL_FIELDS = fields.register("drill_down", (
+    "Transaction.From",
+    "Transaction.To",
+    "Transaction.Nonce",
+    "Transaction.Type",
+    "Transaction.ValueInUSD",
+    "Transaction.Gas",
+    "Transaction.GasPrice",
+    "Transaction.CostInUSD",
+    "TransactionStatus.Success",
+    "Fee.EffectiveGasPrice",
+    "Fee.MinerRewardInUSD",
+    "Fee.BurntInUSD",
+    "Fee.SenderFeeInUSD",
+    "Fee.SavingsInUSD",
+    "Call.From",
+    "Call.To",
+    "Call.InternalCalls",
+    "Call.Signature.Name",
+    "Log.SmartContract",
+    "Log.Signature.Name",
+    "Trade.Buy.Buyer",
+    "Trade.Buy.Seller",
+    "Trade.Dex.SmartContract",
+    "Trade.Dex.OwnerAddress",
+))
+
+
+def _bump(counts, key, delta):
+    """Add delta to counts[key], dropping the key once it reaches zero."""
+    value = counts.get(key, 0) + delta
+    if value:
+        counts[key] = value
+    else:
+        del counts[key]
+
+
+def _trade_addresses(trade):
+    """The distinct lower-cased addresses of a trade's balance changes."""
+    return {balance.address_lower for balance in trade.balances if balance.address_lower}
+
+
+def _without(trades, gone):
+    """trades minus the ones whose id() is in gone, slicing when they are the last ones."""
+    count = len(gone)
+    # Evicted trades are normally the oldest, at the end of the window
+    if count <= len(trades) and all(id(trade) in gone for trade in trades[len(trades) - count:]):
+        return trades[:len(trades) - count]
+    return [trade for trade in trades if id(trade) not in gone]
+
+
+def _copy_totals(totals):
+    return {
+        **totals,
+        "blocks": dict(totals["blocks"]),
+        "tokens": {key: dict(token) for key, token in totals["tokens"].items()},
+    }
+
+
+def _top(heap, values, absolute=False, n=10):
+    """
+    Keys of the n largest live entries of a heap of (-value, key) pairs.
+
+    An entry is stale once values[key] (or its abs()) no longer matches; stale
+    and duplicate entries are dropped on the way, the live ones pushed back.
+    """
+    top = []
+    while heap and len(top) < n:
+        entry = heapq.heappop(heap)
+        negated, key = entry
+        value = values.get(key)
+        if value is None or -negated != (abs(value) if absolute else value) or (top and top[-1] == entry):
+            continue
+        top.append(entry)
+    for entry in top:
+        heapq.heappush(heap, entry)
+    return [key for _, key in top]
+
+
+class StatsAccumulator:
+    """
+    Running aggregates behind calculate_stats(), updated one trade at a time.
+
+    add() folds a trade into the per-builder/per-block/per-token totals and
+    remove() takes it back out again (for trades evicted from the window), so a
+    refresh costs O(new + evicted trades) instead of a pass over the whole
+    window. result() produces the same structure calculate_stats() returns.
+
+    With keep_trades, the accumulator also holds the trades themselves per
+    block and per address (index, the address index a Snapshot serves), so
+    merge() can skip trades it already has and evict old blocks by looking at
+    those blocks only. copy() is copy-on-write: below the top-level dicts, the
+    copy shares every per-address and per-block container with the original
+    until one of the two changes it.
+
+    Removal subtracts the same floats that were added, so running sums can pick
+    up rounding error over many add/remove cycles; rebuild from scratch on a
+    full refresh.
+    """
+
+    def __init__(self, builder_addresses=None, track_builders=True, keep_trades=True):
+        # When False, builder_summary is left empty for another backend to fill
+        self.track_builders = track_builders
+        # Track MEV builder addresses (the filtered addresses). Fixed for the
+        # accumulator's lifetime, so remove() takes back exactly what add() did
+        self.registry = builder_registry.resolve(builder_addresses)
+        self.builder_addresses = self.registry.by_address
+
+        self.trade_count = 0
+        self.total_value_usd = 0
+        self.increases = 0
+        self.decreases = 0
+        self.dex_protocols = {}
+        self.transactions_by_address = {}
+        self.balance_change_by_address = {}
+        self.transactions_by_reason = {}
+        # Multisets, so removing a trade can tell whether a block/time is still present
+        self.block_counts = {}
+        self.block_time_counts = {}
+        # builder_address -> running totals of its rows, with row counts per
+        # block and per token, so a block or token is counted until its last
+        # row is removed
+        self.builder_totals = {}
+        # Lower-cased address -> its trades in window order (see
+        # snapshot.build_address_index), and block height -> its trades
+        self.index = {} if keep_trades else None
+        self.block_trades = {} if keep_trades else None
+        # Heaps of (-count, address) and (-abs(balance change), address) for
+        # result()'s top 10s: built on first use, then pushed to whenever an
+        # address changes, and stale entries skipped when read (see _top())
+        self._count_heap = None
+        self._balance_heap = None
+        # After copy(), nested containers are shared until written to; ids of
+        # the ones this accumulator has copied or created since
+        self._shared = False
+        self._owned = set()
+
+    def update(self, trades):
+        """add() every trade in trades (raw dicts or Trade records)."""
+        for trade in normalize_trades(trades):
+            self.add(trade)
+        return self
+
+    def add(self, trade):
+        """Fold trade into the aggregates, after the trades added so far."""
+        self._apply(trade, 1, self.index)
+        if self.block_trades is not None:
+            self._append(self.block_trades, trade.block_height, trade)
+
+    def remove(self, trade):
+        """Take trade back out of the aggregates."""
+        self._apply(trade, -1)
+        if self.block_trades is not None:
+            gone = {id(trade)}
+            self._splice(self.block_trades, trade.block_height, gone=gone)
+            for address_lower in _trade_addresses(trade):
+                self._splice(self.index, address_lower, gone=gone)
+
+    def merge(self, trades, start_block=None):
+        """
+        Fold a delta into the window, for an accumulator with keep_trades.
+
+        Trades already held (by Trade.key) are skipped and blocks older than
+        start_block are evicted; only the blocks the delta touches and the
+        evicted ones are looked at. New trades go in front of the index
+        entries, as dataservice.splice_trades() puts them in front of the window.
+
+        Args:
+            trades: Trade records, newest first
+            start_block: Oldest block to keep, or None to keep every block
+
+        Returns:
+            An (added, evicted) tuple of trade lists
+        """
+        block_trades = self.block_trades
+        held = {}
+        added = []
+        for trade in trades:
+            number = trade.block_height
+            if start_block is not None and number is not None and number < start_block:
+                continue
+            keys = held.get(number)
+            if keys is None:
+                keys = held[number] = {known.key for known in block_trades.get(number, ())}
+            key = trade.key
+            if key not in keys:
+                keys.add(key)
+                added.append(trade)
+
+        evicted = []
+        if start_block is not None:
+            for number in [number for number in block_trades if number is not None and number < start_block]:
+                evicted.extend(block_trades.pop(number))
+
+        for trade in evicted:
+            self._apply(trade, -1)
+        for trade in added:
+            self._apply(trade, 1)
+            self._append(block_trades, trade.block_height, trade)
+
+        fronts = {}
+        for trade in added:
+            for address_lower in _trade_addresses(trade):
+                fronts.setdefault(address_lower, []).append(trade)
+        gone = {}
+        for trade in evicted:
+            for address_lower in _trade_addresses(trade):
+                gone.setdefault(address_lower, set()).add(id(trade))
+        for address_lower in fronts.keys() | gone.keys():
+            self._splice(self.index, address_lower, fronts.get(address_lower, []), gone.get(address_lower))
+        return added, evicted
+
+    def copy(self):
+        """
+        An independent copy, so a delta can be folded in without touching
+        this accumulator (e.g. the one of a published snapshot).
+
+        Only the top-level dicts are copied; what they hold is shared, by both
+        accumulators from then on, until one of them writes to it.
+        """
+        other = copy.copy(self)
+        for name in (
+            "dex_protocols", "transactions_by_address", "balance_change_by_address",
+            "transactions_by_reason", "block_counts", "block_time_counts", "builder_totals",
+        ):
+            setattr(other, name, dict(getattr(self, name)))
+        if self.index is not None:
+            other.index = dict(self.index)
+            other.block_trades = dict(self.block_trades)
+        if self._count_heap is not None:
+            other._count_heap = list(self._count_heap)
+            other._balance_heap = list(self._balance_heap)
+        self._shared = other._shared = True
+        self._owned = set()
+        other._owned = set()
+        return other
+
+    def _created(self, value):
+        # A container made since the last copy() is this accumulator's own
+        if self._shared:
+            self._owned.add(id(value))
+        return value
+
+    def _writable(self, parent, key, clone):
+        """parent[key], first replaced with clone(parent[key]) if it is still shared."""
+        value = parent[key]
+        if self._shared and id(value) not in self._owned:
+            value = parent[key] = self._created(clone(value))
+        return value
+
+    def _append(self, lists, key, trade):
+        trades = lists.get(key)
+        if trades is None:
+            lists[key] = self._created([trade])
+        elif trades[-1] is not trade:
+            # A trade with several rows for an address is listed once
+            self._writable(lists, key, list).append(trade)
+
+    def _splice(self, lists, key, front=(), gone=None):
+        """Replace lists[key] with front followed by its trades not in gone (ids)."""
+        trades = lists.get(key, [])
+        if gone:
+            trades = _without(trades, gone)
+        trades = [*front, *trades]
+        if trades:
+            lists[key] = self._created(trades)
+        else:
+            lists.pop(key, None)
+
+    def _apply(self, trade, sign, index=None):
+        block_number = trade.block_number
+        block_time = trade.block_time
+        builder_addresses = self.builder_addresses
+        counts = self.transactions_by_address
+        balance_changes = self.balance_change_by_address
+        count_heap = self._count_heap
+
+        self.trade_count += sign
+        self.total_value_usd += sign * trade.value_usd
+        _bump(self.dex_protocols, trade.dex_protocol, sign)
+
+        builders_in_trade = set()
+        for balance in trade.balances:
+            address = balance.address
+            balance_change = balance.balance_change
+
+            if address:
+                _bump(counts, address, sign)
+                if address in counts:
+                    total = balance_changes[address] = balance_changes.get(address, 0.0) + sign * balance_change
+                    if count_heap is not None:
+                        heapq.heappush(count_heap, (-counts[address], address))
+                        heapq.heappush(self._balance_heap, (-abs(total), address))
+                else:
+                    del balance_changes[address]
+
+            # Balance change reason codes
+            if balance.reason_code is not None:
+                _bump(self.transactions_by_reason, balance.reason_code, sign)
+
+            # Balance changes
+            if balance.post_balance > balance.pre_balance:
+                self.increases += sign
+            elif balance.post_balance < balance.pre_balance:
+                self.decreases += sign
+
+            address_lower = balance.address_lower
+            if index is not None and address_lower:
+                self._append(index, address_lower, trade)
+
+            # If this is a builder address, add to the builder's block data
+            if self.track_builders and address_lower in builder_addresses and block_number:
+                # Count each trade once per builder, however many rows it has
+                first_row = address_lower not in builders_in_trade
+                builders_in_trade.add(address_lower)
+                self._apply_builder_row(address_lower, block_number, balance, sign, first_row)
+
+        if block_time:
+            _bump(self.block_time_counts, block_time, sign)
+        if block_number:
+            _bump(self.block_counts, block_number, sign)
+
+    def _apply_builder_row(self, address_lower, block_number, balance, sign, first_row):
+        totals = self.builder_totals.get(address_lower)
+        if totals is None:
+            totals = self.builder_totals[address_lower] = self._created({
+                "total_profit_usd": 0.0,
+                "total_balance_change": 0.0,
+                "transaction_count": 0,
+                "rows": 0,
+                "blocks": {},
+                "tokens": {},
+            })
+        elif self._shared:
+            totals = self._writable(self.builder_totals, address_lower, _copy_totals)
+
+        totals["rows"] += sign
+        if totals["rows"] <= 0:
+            del self.builder_totals[address_lower]
+            return
+        _bump(totals["blocks"], block_number, sign)
+
+        # Add profit and balance change for this builder
+        totals["total_profit_usd"] += sign * balance.profit_usd
+        totals["total_balance_change"] += sign * balance.balance_change
+        if first_row:
+            totals["transaction_count"] += sign
+
+        # Track by token
+        currency_name = balance.currency_name
+        currency_symbol = balance.currency_symbol
+        token_key = f"{currency_name} ({currency_symbol})" if currency_symbol else currency_name
+        token_data = totals["tokens"].get(token_key)
+        if token_data is None:
+            token_data = totals["tokens"][token_key] = {
+                "balance_change": 0.0, "profit_usd": 0.0, "rows": 0,
+            }
+        token_data["rows"] += sign
+        if token_data["rows"] <= 0:
+            del totals["tokens"][token_key]
+            return
+        token_data["balance_change"] += sign * balance.balance_change
+        token_data["profit_usd"] += sign * balance.profit_usd
+
+    def result(self):
+        """Build the calculate_stats() dict from the current aggregates."""
+        times = self.block_time_counts
+        stats = {
+            "total_transactions": self.trade_count,
+            "total_value_usd": self.total_value_usd,
+            "total_balance_change": 0,
+            "unique_addresses": set(self.transactions_by_address),
+            "balance_change_by_address": dict(self.balance_change_by_address),
+            "date_range": {
+                "earliest": min(times) if times else None,
+                "latest": max(times) if times else None,
+            },
+            "balance_changes": {"increases": self.increases, "decreases": self.decreases},
+            "unique_blocks": set(self.block_counts),
+        }
+
+        # Convert sets to counts
+        stats["unique_addresses_count"] = len(stats["unique_addresses"])
+        stats["unique_blocks_count"] = len(stats["unique_blocks"])
+
+        # Top 10 by balance change and by transaction count, from heaps kept
+        # up to date as addresses change rather than a pass over all of them
+        self._build_heaps()
+        counts = self.transactions_by_address
+        balance_changes = self.balance_change_by_address
+        stats["address_summary"] = [
+            {
+                "address": address,
+                "count": counts[address],
+                "total_balance_change": balance_changes[address],
+            }
+            for address in _top(self._balance_heap, balance_changes, absolute=True)
+        ]
+        stats["transactions_by_address"] = {address: counts[address] for address in _top(self._count_heap, counts)}
+        stats["transactions_by_reason"] = dict(self.transactions_by_reason)
+        stats["dex_protocols"] = dict(sorted(self.dex_protocols.items(), key=lambda x: x[1], reverse=True))
+        
+        # Builder summary format for template, from the running totals
+        builder_summary = []
+        for builder_address_lower, totals in self.builder_totals.items():
+            builder_summary.append({
+                # Original address for display
+                "address": self.registry.display_address(builder_address_lower),
+                "label": self.registry.label(builder_address_lower),
+                "total_profit_usd": totals["total_profit_usd"],
+                "total_balance_change": totals["total_balance_change"],
+                "total_transactions": totals["transaction_count"],
+                "total_blocks": len(totals["blocks"]),
+                "tokens": {
+                    token_key: {"balance_change": token["balance_change"], "profit_usd": token["profit_usd"]}
+                    for token_key, token in totals["tokens"].items()
+                },
+            })
+
+        # Sort builders by total profit USD (descending)
+        builder_summary.sort(key=lambda x: x["total_profit_usd"], reverse=True)
+        stats["builder_summary"] = builder_summary
+
+        return stats
+
+    def _build_heaps(self):
+        # Built on first use and rebuilt once stale entries outnumber live ones
+        counts = self.transactions_by_address
+        if self._count_heap is None or len(self._count_heap) > 2 * len(counts) + 64:
+            self._count_heap = [(-count, address) for address, count in counts.items()]
+            heapq.heapify(self._count_heap)
+            self._balance_heap = [(-abs(change), address) for address, change in self.balance_change_by_address.items()]
+            heapq.heapify(self._balance_heap)
+
+
+def calculate_stats(data, columnar=False, window=None, archive=None):
+    """
+    Calculate statistics from the DEXTrades data, organized by block builder.
+
+    Args:
+        data: The API response data containing DEXTrades
+        columnar: If True and numpy is installed, compute builder_summary with
+            the vectorized backend in columnar.py instead of per-row dict updates
+        window: A rolling window such as "1h", "24h" or "7d". The stats then come
+            from archive's rollups rather than data
+        archive: The TradeArchive that answers window queries
+    """
+    if window is not None:
+        if archive is None:
+            return None
+        return archive.window_stats(window)
 
-def calculate_stats(data):
-    """Calculate statistics from the DEXTrades data, organized by block builder."""
     if not data:
         return None
     
@@ -25,270 +480,14 @@ def calculate_stats(data):
     trades = data["data"]["EVM"].get("DEXTrades", [])
     if not isinstance(trades, list):
         trades = []
-    
-    # Track MEV builder addresses (the filtered addresses)
-    mev_builder_addresses = {addr.lower() for addr in DEFAULT_ADDRESSES}
-    # Map lowercase to original address for display
-    mev_builder_address_map = {addr.lower(): addr for addr in DEFAULT_ADDRESSES}
-    
-    # Structure: builder_address -> block_number -> block summary
-    builder_blocks = defaultdict(lambda: defaultdict(lambda: {
-        "block_number": "",
-        "block_time": "",
-        "total_profit_usd": 0.0,
-        "total_balance_change": 0.0,
-        "transaction_count": 0,
-        "tokens": defaultdict(lambda: {"balance_change": 0.0, "profit_usd": 0.0}),
-    }))
-    
-    stats = {
-        "total_transactions": len(trades),
-        "total_value_usd": 0,
-        "total_balance_change": 0,
-        "unique_addresses": set(),
-        "transactions_by_address": defaultdict(int),
-        "balance_change_by_address": defaultdict(float),
-        "transactions_by_reason": defaultdict(int),
-        "date_range": {"earliest": None, "latest": None},
-        "balance_changes": {"increases": 0, "decreases": 0},
-        "unique_blocks": set(),
-        "dex_protocols": defaultdict(int),
-    }
-
-    for trade in trades:
-        if not isinstance(trade, dict):
-            continue
-        # Get transaction info
-        transaction = trade.get("Transaction", {}) or {}
-        block = trade.get("Block", {}) or {}
-        trade_info = trade.get("Trade", {}) or {}
-        fee_info = trade.get("Fee", {}) or {}
-        
-        block_number = block.get("Number", "")
-        block_time = block.get("Time", "")
-        
-        # Process joinTransactionBalances to get token balance changes
-        # Handle the same formats as the filter (list, dict, etc.)
-        raw_balances = trade.get("joinTransactionBalances")
-        balance_joins = []
-        
-        if raw_balances is not None:
-            if isinstance(raw_balances, list):
-                balance_joins = raw_balances
-            elif isinstance(raw_balances, dict):
-                # Check if it has TokenBalance directly (single item)
-                if "TokenBalance" in raw_balances:
-                    balance_joins = [raw_balances]
-                else:
-                    # Try to extract items from dict values
-                    balance_joins = [v for v in raw_balances.values() if isinstance(v, dict)]
-        
-        # Calculate total value from trade
-        buy_info = trade_info.get("Buy", {}) or {}
-        sell_info = trade_info.get("Sell", {}) or {}
-        if not isinstance(buy_info, dict):
-            buy_info = {}
-        if not isinstance(sell_info, dict):
-            sell_info = {}
-        buy_amount_usd = float(buy_info.get("AmountInUSD", 0) or 0)
-        sell_amount_usd = float(sell_info.get("AmountInUSD", 0) or 0)
-        trade_value_usd = max(buy_amount_usd, sell_amount_usd)
-        stats["total_value_usd"] += trade_value_usd
-
-        # DEX protocol tracking
-        dex_info = trade_info.get("Dex", {}) or {}
-        if not isinstance(dex_info, dict):
-            dex_info = {}
-        protocol_name = dex_info.get("ProtocolName", "Unknown")
-        stats["dex_protocols"][protocol_name] += 1
-
-        # Process each token balance in the trade
-        builder_address_lower = None
-        for balance_join in balance_joins:
-            if not isinstance(balance_join, dict):
-                continue
-            token_balance = balance_join.get("TokenBalance", {})
-            if not token_balance or not isinstance(token_balance, dict):
-                continue
-                
-            # Calculate balance change (post-pre)
-            pre_balance = float(token_balance.get("PreBalance", 0) or 0)
-            post_balance = float(token_balance.get("PostBalance", 0) or 0)
-            balance_change = post_balance - pre_balance
-            
-            # Calculate USD profit if available
-            pre_balance_usd = float(token_balance.get("PreBalanceInUSD", 0) or 0)
-            post_balance_usd = float(token_balance.get("PostBalanceInUSD", 0) or 0)
-            profit_usd = post_balance_usd - pre_balance_usd
-            
-            # Get currency info
-            currency = token_balance.get("Currency", {}) or {}
-            if not isinstance(currency, dict):
-                currency = {}
-            currency_name = currency.get("Name", "Unknown")
-            currency_symbol = currency.get("Symbol", "")
-            
-            # Unique addresses
-            address = token_balance.get("Address", "")
-            address_lower = address.lower() if address else ""
-            
-            # Check if this is an MEV builder address
-            is_mev_builder = address_lower in mev_builder_addresses
-            
-            # Track the builder address for this trade (use first MEV builder found)
-            if is_mev_builder and builder_address_lower is None:
-                builder_address_lower = address_lower
-            
-            if address:
-                stats["unique_addresses"].add(address)
-                stats["transactions_by_address"][address] += 1
-                stats["balance_change_by_address"][address] += balance_change
-
-            # Balance change reason codes
-            reason_code = token_balance.get("BalanceChangeReasonCode")
-            if reason_code is not None:
-                stats["transactions_by_reason"][reason_code] += 1
-
-            # Balance changes
-            if post_balance > pre_balance:
-                stats["balance_changes"]["increases"] += 1
-            elif post_balance < pre_balance:
-                stats["balance_changes"]["decreases"] += 1
-            
-            # If this is a builder address, add to builder's block data
-            if is_mev_builder and block_number:
-                # Use the current builder's address, not the first one found
-                block_data = builder_blocks[address_lower][block_number]
-                
-                # Initialize block data if first transaction in this block
-                if not block_data["block_number"]:
-                    block_data["block_number"] = block_number
-                    block_data["block_time"] = block_time
-                
-                # Add profit and balance change for this builder in this block
-                block_data["total_profit_usd"] += profit_usd
-                block_data["total_balance_change"] += balance_change
-                
-                # Track by token
-                token_key = f"{currency_name} ({currency_symbol})" if currency_symbol else currency_name
-                block_data["tokens"][token_key]["balance_change"] += balance_change
-                block_data["tokens"][token_key]["profit_usd"] += profit_usd
-        
-        # Count transactions for all builder blocks that were involved in this trade
-        # Track which builders we've already counted this transaction for
-        builders_in_trade = set()
-        for balance_join in balance_joins:
-            if not isinstance(balance_join, dict):
-                continue
-            token_balance = balance_join.get("TokenBalance", {})
-            if not token_balance or not isinstance(token_balance, dict):
-                continue
-            address = token_balance.get("Address", "")
-            address_lower = address.lower() if address else ""
-            if address_lower in mev_builder_addresses and block_number:
-                if address_lower not in builders_in_trade:
-                    block_data = builder_blocks[address_lower][block_number]
-                    block_data["transaction_count"] += 1
-                    builders_in_trade.add(address_lower)
-
-        # Date range
-        if block_time:
-            if stats["date_range"]["earliest"] is None or block_time < stats["date_range"]["earliest"]:
-                stats["date_range"]["earliest"] = block_time
-            if stats["date_range"]["latest"] is None or block_time > stats["date_range"]["latest"]:
-                stats["date_range"]["latest"] = block_time
-
-        # Unique blocks
-        if block_number:
-            stats["unique_blocks"].add(block_number)
-
-    # Convert sets to counts
-    stats["unique_addresses_count"] = len(stats["unique_addresses"])
-    stats["unique_blocks_count"] = len(stats["unique_blocks"])
-
-    # Convert defaultdicts to regular dicts for JSON serialization
-    # Create address summary with count and total balance change
-    address_summary = []
-    for address in stats["transactions_by_address"]:
-        address_summary.append({
-            "address": address,
-            "count": stats["transactions_by_address"][address],
-            "total_balance_change": stats["balance_change_by_address"][address],
-        })
-    address_summary.sort(key=lambda x: abs(x["total_balance_change"]), reverse=True)
-    stats["address_summary"] = address_summary[:10]  # Top 10 by balance change
-    
-    stats["transactions_by_address"] = dict(
-        sorted(stats["transactions_by_address"].items(), key=lambda x: x[1], reverse=True)[:10]
-    )
-    stats["transactions_by_reason"] = dict(stats["transactions_by_reason"])
-    stats["dex_protocols"] = dict(sorted(stats["dex_protocols"].items(), key=lambda x: x[1], reverse=True))
-    
-    # Convert builder_blocks to builder summary format for template
-    builder_summary = []
-    for builder_address_lower, blocks_dict in builder_blocks.items():
-        # Get original address for display
-        display_address = mev_builder_address_map.get(builder_address_lower, builder_address_lower)
-        
-        # Calculate totals across all blocks for this builder
-        total_profit_usd = 0.0
-        total_balance_change = 0.0
-        total_transactions = 0
-        total_blocks = len(blocks_dict)
-        all_tokens = defaultdict(lambda: {"balance_change": 0.0, "profit_usd": 0.0})
-        
-        # Aggregate data across all blocks
-        for block_number, block_data in blocks_dict.items():
-            # Aggregate tokens across all blocks
-            for token_key, token_data in block_data["tokens"].items():
-                all_tokens[token_key]["balance_change"] += token_data["balance_change"]
-                all_tokens[token_key]["profit_usd"] += token_data["profit_usd"]
-            
-            total_profit_usd += block_data["total_profit_usd"]
-            total_balance_change += block_data["total_balance_change"]
-            total_transactions += block_data["transaction_count"]
-        
-        # Convert all_tokens to regular dict
-        all_tokens_dict = {}
-        for token_key, token_data in all_tokens.items():
-            all_tokens_dict[token_key] = {
-                "balance_change": token_data["balance_change"],
-                "profit_usd": token_data["profit_usd"],
-            }
-        
-        builder_summary.append({
-            "address": display_address,
-            "total_profit_usd": total_profit_usd,
-            "total_balance_change": total_balance_change,
-            "total_transactions": total_transactions,
-            "total_blocks": total_blocks,
-            "tokens": all_tokens_dict,
-        })
-    
-    # Sort builders by total profit USD (descending)
-    builder_summary.sort(key=lambda x: x["total_profit_usd"], reverse=True)
-    stats["builder_summary"] = builder_summary
 
+    use_columnar = columnar and columnar_backend.available()
+    stats = StatsAccumulator(track_builders=not use_columnar, keep_trades=False).update(trades).result()
+    if use_columnar:
+        stats["builder_summary"] = columnar_backend.builder_summary(trades)
     return stats
 
 
-def safe_float(value, default=0.0):
-    """Safely convert a value to float, handling None, empty strings, and invalid values."""
-    if value is None:
-        return default
-    if isinstance(value, (int, float)):
-        return float(value)
-    if isinstance(value, str):
-        value = value.strip()
-        if not value:
-            return default
-        try:
-            return float(value)
-        except (ValueError, TypeError):
-            return default
-    return default
-
-
 def process_builder_trades(trades, builder_address):
     """
     Transform raw trades for a specific builder into a template-friendly structure.
@@ -299,90 +498,91 @@ def process_builder_trades(trades, builder_address):
     builder_address_lower = builder_address.lower()
     processed_trades = []
     
-    for trade in trades:
-        if not isinstance(trade, dict):
-            continue
-        
-        transaction = trade.get("Transaction", {}) or {}
-        block = trade.get("Block", {}) or {}
-        trade_info = trade.get("Trade", {}) or {}
-        
-        buy_info = trade_info.get("Buy", {}) or {}
-        sell_info = trade_info.get("Sell", {}) or {}
-        
-        raw_balances = trade.get("joinTransactionBalances")
-        balance_joins = []
-        
-        if raw_balances is not None:
-            if isinstance(raw_balances, list):
-                balance_joins = raw_balances
-            elif isinstance(raw_balances, dict):
-                if "TokenBalance" in raw_balances:
-                    balance_joins = [raw_balances]
-                else:
-                    balance_joins = [v for v in raw_balances.values() if isinstance(v, dict)]
-        
+    for trade in normalize_trades(trades):
         builder_balance_changes = []
-        for balance_join in balance_joins:
-            if not isinstance(balance_join, dict):
-                continue
-            token_balance = balance_join.get("TokenBalance", {})
-            if not token_balance or not isinstance(token_balance, dict):
-                continue
-            token_address = token_balance.get("Address", "")
-            if token_address.lower() == builder_address_lower:
-                currency = token_balance.get("Currency", {}) or {}
-                pre_balance = float(token_balance.get("PreBalance", 0) or 0)
-                post_balance = float(token_balance.get("PostBalance", 0) or 0)
-                balance_change = post_balance - pre_balance
-                pre_balance_usd = float(token_balance.get("PreBalanceInUSD", 0) or 0)
-                post_balance_usd = float(token_balance.get("PostBalanceInUSD", 0) or 0)
-                profit_usd = post_balance_usd - pre_balance_usd
-                
+        for balance in trade.balances:
+            if balance.address_lower == builder_address_lower:
                 builder_balance_changes.append({
-                    "currency_name": currency.get("Name", "Unknown"),
-                    "currency_symbol": currency.get("Symbol", ""),
-                    "currency_address": currency.get("SmartContract", ""),
-                    "pre_balance": pre_balance,
-                    "post_balance": post_balance,
-                    "balance_change": balance_change,
-                    "profit_usd": profit_usd,
-                    "reason_code": token_balance.get("BalanceChangeReasonCode", ""),
+                    "currency_name": balance.currency_name,
+                    "currency_symbol": balance.currency_symbol,
+                    "currency_address": balance.currency_address,
+                    "pre_balance": balance.pre_balance,
+                    "post_balance": balance.post_balance,
+                    "balance_change": balance.balance_change,
+                    "profit_usd": balance.profit_usd,
+                    "reason_code": balance.reason_code,
                 })
         
-        buy_currency = buy_info.get("Currency", {}) or {}
-        if not isinstance(buy_currency, dict):
-            buy_currency = {}
-        
-        sell_currency = sell_info.get("Currency", {}) or {}
-        if not isinstance(sell_currency, dict):
-            sell_currency = {}
-        
+        buy = trade.buy
+        sell = trade.sell
         processed_trades.append({
-            "tx_hash": transaction.get("Hash", ""),
-            "block_number": block.get("Number", ""),
-            "block_time": block.get("Time", ""),
+            "tx_hash": trade.tx_hash,
+            "log_index": trade.log_index,
+            "block_number": trade.block_number,
+            "block_time": trade.block_time,
             "buy": {
-                "amount": safe_float(buy_info.get("Amount")),
-                "amount_usd": safe_float(buy_info.get("AmountInUSD")),
-                "currency_name": buy_currency.get("Name", "") if buy_currency else "",
-                "currency_symbol": buy_currency.get("Symbol", "") if buy_currency else "",
-                "currency_address": buy_currency.get("SmartContract", "") if buy_currency else "",
-                "price": safe_float(buy_info.get("Price")),
-                "price_usd": safe_float(buy_info.get("PriceInUSD")),
+                "amount": buy.amount,
+                "amount_usd": buy.amount_usd,
+                "currency_name": buy.currency_name,
+                "currency_symbol": buy.currency_symbol,
+                "currency_address": buy.currency_address,
+                "price": buy.price,
+                "price_usd": buy.price_usd,
             },
             "sell": {
-                "amount": safe_float(sell_info.get("Amount")),
-                "amount_usd": safe_float(sell_info.get("AmountInUSD")),
-                "currency_name": sell_currency.get("Name", "") if sell_currency else "",
-                "currency_symbol": sell_currency.get("Symbol", "") if sell_currency else "",
-                "currency_address": sell_currency.get("SmartContract", "") if sell_currency else "",
-                "price": safe_float(sell_info.get("Price")),
-                "price_usd": safe_float(sell_info.get("PriceInUSD")),
+                "amount": sell.amount,
+                "amount_usd": sell.amount_usd,
+                "currency_name": sell.currency_name,
+                "currency_symbol": sell.currency_symbol,
+                "currency_address": sell.currency_address,
+                "price": sell.price,
+                "price_usd": sell.price_usd,
             },
-            "dex_protocol": trade_info.get("Dex", {}).get("ProtocolName", "Unknown") if trade_info.get("Dex") else "Unknown",
+            "dex_protocol": trade.dex_protocol,
             "balance_changes": builder_balance_changes,
         })
     
     return processed_trades
 
+
+def process_trade_details(raw):
+    """
+    The drill-down fields of a raw DEXTrade (see DETAIL_FIELDS) in a
+    template-friendly structure, keyed like the trade by tx_hash and log_index.
+    """
+    transaction = _as_dict(raw.get("Transaction"))
+    status = _as_dict(raw.get("TransactionStatus"))
+    fee = _as_dict(raw.get("Fee"))
+    call = _as_dict(raw.get("Call"))
+    log = _as_dict(raw.get("Log"))
+    trade_info = _as_dict(raw.get("Trade"))
+    buy = _as_dict(trade_info.get("Buy"))
+    dex = _as_dict(trade_info.get("Dex"))
+    return {
+        "tx_hash": transaction.get("Hash", ""),
+        "log_index": log.get("Index"),
+        "success": status.get("Success"),
+        "from": transaction.get("From"),
+        "to": transaction.get("To"),
+        "nonce": transaction.get("Nonce"),
+        "type": transaction.get("Type"),
+        "value_usd": safe_float(transaction.get("ValueInUSD")),
+        "gas": transaction.get("Gas"),
+        "gas_price": transaction.get("GasPrice"),
+        "effective_gas_price": fee.get("EffectiveGasPrice"),
+        "cost_usd": safe_float(transaction.get("CostInUSD")),
+        "miner_reward_usd": safe_float(fee.get("MinerRewardInUSD")),
+        "burnt_usd": safe_float(fee.get("BurntInUSD")),
+        "sender_fee_usd": safe_float(fee.get("SenderFeeInUSD")),
+        "savings_usd": safe_float(fee.get("SavingsInUSD")),
+        "call_from": call.get("From"),
+        "call_to": call.get("To"),
+        "call_signature": _as_dict(call.get("Signature")).get("Name"),
+        "internal_calls": call.get("InternalCalls"),
+        "event": _as_dict(log.get("Signature")).get("Name"),
+        "log_contract": log.get("SmartContract"),
+        "buyer": buy.get("Buyer"),
+        "seller": buy.get("Seller"),
+        "dex_contract": dex.get("SmartContract"),
+        "dex_owner": dex.get("OwnerAddress"),
+    }
@@ -0,0 +1,371 @@
+import bisect
+import threading
+import time
+from datetime import datetime, timezone
+import metrics
+from models import Trade
+from processing import StatsAccumulator, process_builder_trades
+from store import SnapshotBytes, encode_snapshot, open_snapshot_file, write_snapshot_file
+
+
+class Snapshot:
+    """
+    One fetched and filtered API payload, as served to the routes.
+
+    A snapshot is never mutated after it is published; refreshing the cache
+    builds a new Snapshot and swaps the reference in a single assignment, so a
+    request always sees a consistent data/timestamp/version triple.
+
+    A snapshot loaded with Snapshot.load(path, lazy=True) keeps the file mapped
+    and decodes the trades, the address index and per-builder trades only when
+    they are first used.
+    """
+
+    __slots__ = (
+        "_data",
+        "fetched_at",
+        "version",
+        "block_cursor",
+        "block_counts",
+        "block_keys",
+        "registry_version",
+        "_builder_index",
+        "stats",
+        "_accumulator",
+        "_builder_rows",
+        "_builder_order",
+        "_views",
+        "_file",
+        "_file_lock",
+    )
+
+    def __init__(
+        self, data, version, fetched_at=None, block_cursor=None, block_counts=None,
+        accumulator=None, stats=None, builder_index=None, source=None, registry_version=None,
+        block_keys=None,
+    ):
+        self._data = data
+        # Open SnapshotFile that data/builder_index are decoded from when data is None
+        self._file = source
+        self._file_lock = threading.Lock()
+        self.version = version
+        self.fetched_at = fetched_at if fetched_at is not None else time.time()
+        # Highest block ingested so far and unfiltered trade counts per block,
+        # used to fetch only newer blocks and to keep the window size stable
+        self.block_cursor = block_cursor
+        self.block_counts = block_counts or {}
+        # trade_key()s behind block_counts, per block, so trades delivered
+        # twice are counted once (see dataservice.merge_block_keys). Kept in
+        # memory only; a snapshot loaded from a file has none
+        self.block_keys = block_keys or {}
+        # Taken from the accumulator, which keeps it as trades are added and
+        # merged, or else built here before the snapshot is published, so a
+        # swap replaces the index together with the trades
+        if builder_index is None and source is None:
+            if accumulator is not None and accumulator.index is not None:
+                builder_index = accumulator.index
+            else:
+                builder_index = build_address_index(self.trades)
+        self._builder_index = builder_index
+        # Running aggregates for these trades. An incremental refresh folds its
+        # delta into them and hands them on to the next snapshot; the stats
+        # published here are a separate copy and never change.
+        self._accumulator = accumulator
+        self.stats = stats if stats is not None else self.accumulator.result()
+        # Version of the builder registry the trades were filtered and the
+        # stats computed with; None if unknown (a file from before the registry)
+        if registry_version is None and self._accumulator is not None:
+            registry_version = self._accumulator.registry.version
+        self.registry_version = registry_version
+        self._builder_rows = {}
+        self._builder_order = {}
+        self._views = {}
+
+    @property
+    def accumulator(self):
+        """
+        The StatsAccumulator for this snapshot's trades.
+
+        Snapshots loaded from disk come with their stats precomputed, so the
+        accumulator is only rebuilt when an incremental refresh needs it.
+        """
+        if self._accumulator is None:
+            self._accumulator = StatsAccumulator().update(self.trades)
+        return self._accumulator
+
+    @property
+    def data(self):
+        """The filtered API payload, decoded from the snapshot file on first use if loaded lazily."""
+        if self._data is None:
+            with self._file_lock:
+                if self._data is None:
+                    rows = self._file.section("trades", [])
+                    self._data = {"data": {"EVM": {"DEXTrades": [Trade.from_row(row) for row in rows]}}}
+                    self._close_file_if_done()
+        return self._data
+
+    @property
+    def builder_index(self):
+        """Map of lower-cased address to its trades, in the order of self.trades."""
+        if self._builder_index is None:
+            # The file stores positions in the trades, decoded first
+            trades = self.trades
+            with self._file_lock:
+                if self._builder_index is None:
+                    self._builder_index = _from_positions(self._file.section("builder_index", {}), trades)
+                    self._close_file_if_done()
+        return self._builder_index
+
+    def _close_file_if_done(self):
+        # Everything a lazy snapshot needs is decoded; stop holding the mapping
+        if self._file is not None and self._data is not None and self._builder_index is not None:
+            self._file.close()
+            self._file = None
+
+    @property
+    def trades(self):
+        """The snapshot's DEXTrades list."""
+        return self.data["data"]["EVM"]["DEXTrades"]
+
+    def has_trades_for(self, address):
+        """True if any trade in the snapshot has a balance change for address."""
+        address_lower = address.lower()
+        if self._data is None:
+            with self._file_lock:
+                if self._file is not None and address_lower in self._file.header.get("builders", ()):
+                    return True
+        return address_lower in self.builder_index
+
+    def builder_trades(self, address):
+        """Trades with a balance change for address, via the index instead of a scan."""
+        address_lower = address.lower()
+        if self._data is None:
+            # Lazily loaded: builders have their own section, so a drill-down
+            # decodes only that builder's trades
+            with self._file_lock:
+                if self._file is not None and address_lower in self._file.header.get("builders", ()):
+                    rows = self._file.section(f"builder:{address_lower}", [])
+                    return [Trade.from_row(row) for row in rows]
+        return list(self.builder_index.get(address_lower, ()))
+
+    def builder_rows(self, address):
+        """process_builder_trades() output for address, computed once per snapshot."""
+        address_lower = address.lower()
+        rows = self._builder_rows.get(address_lower)
+        if rows is None:
+            trades = self.builder_trades(address_lower)
+            with metrics.span("process_builder_trades"):
+                rows = process_builder_trades(trades, address_lower)
+            if self.has_trades_for(address_lower):
+                self._builder_rows[address_lower] = rows
+        return rows
+
+    def builder_page(self, address, cursor=None, limit=50):
+        """
+        One page of process_builder_trades() rows for address, newest trade first.
+
+        Only the trades on the page are processed. Pages are addressed by
+        cursor (see format_cursor()) rather than offset, so a page boundary
+        stays put while new trades arrive.
+
+        Args:
+            address: Builder address
+            cursor: next_cursor of the previous page, or None for the first page
+            limit: Trades per page
+
+        Returns:
+            A (rows, next_cursor, total) tuple; next_cursor is None on the last page
+
+        Raises:
+            ValueError: If cursor is malformed
+        """
+        address_lower = address.lower()
+        ordered = self._builder_order.get(address_lower)
+        if ordered is None:
+            trades = sorted(self.builder_trades(address_lower), key=_newest_first)
+            ordered = (trades, [_newest_first(trade) for trade in trades])
+            if self.has_trades_for(address_lower):
+                self._builder_order[address_lower] = ordered
+        trades, keys = ordered
+
+        start = 0
+        if cursor:
+            position = parse_cursor(cursor)
+            start = bisect.bisect_right(keys, tuple(-part for part in position))
+        page = trades[start:start + limit]
+        next_cursor = format_cursor(page[-1]) if page and start + limit < len(trades) else None
+        with metrics.span("process_builder_trades"):
+            rows = process_builder_trades(page, address_lower)
+        return rows, next_cursor, len(trades)
+
+    def view(self, key, render):
+        """Memoize a rendered view of this snapshot (e.g. the dashboard HTML) under key."""
+        body = self._views.get(key)
+        if body is None:
+            body = render()
+            self._views[key] = body
+        return body
+
+    @property
+    def etag(self):
+        """Validator for responses derived from this snapshot, unique across restarts."""
+        return f"{self.version}-{int(self.fetched_at * 1000)}"
+
+    @property
+    def last_modified(self):
+        return datetime.fromtimestamp(int(self.fetched_at), tz=timezone.utc)
+
+    def _encoded(self):
+        """The (meta, sections) pair save() and to_bytes() write."""
+        trades = self.trades
+        builder_index = self.builder_index
+        rows = [trade.to_row() for trade in trades]
+        positions = {id(trade): position for position, trade in enumerate(trades)}
+        builder_index = {
+            address_lower: [positions[id(trade)] for trade in entries]
+            for address_lower, entries in builder_index.items()
+        }
+        # The builders the stats were computed for: the registry may have been
+        # reloaded with other addresses since
+        summary = self.stats.get("builder_summary", ())
+        builders = [
+            address for address in dict.fromkeys(row["address"].lower() for row in summary)
+            if address in builder_index
+        ]
+        meta = {
+            "version": self.version,
+            "fetched_at": self.fetched_at,
+            "block_cursor": self.block_cursor,
+            "block_counts": self.block_counts,
+            "registry_version": self.registry_version,
+            "builders": builders,
+        }
+        sections = {
+            "trades": rows,
+            "stats": self.stats,
+            "builder_index": builder_index,
+        }
+        for address_lower in builders:
+            sections[f"builder:{address_lower}"] = [rows[i] for i in builder_index[address_lower]]
+        return meta, sections
+
+    def save(self, path):
+        """Persist the snapshot, with its stats, index and per-builder trades, to path."""
+        write_snapshot_file(path, *self._encoded())
+
+    def to_bytes(self):
+        """The snapshot in the same format save() writes, for cache servers."""
+        return encode_snapshot(*self._encoded())
+
+    @classmethod
+    def load(cls, path, lazy=False):
+        """
+        Load a snapshot written by save(), or return None if there is no usable file.
+
+        Args:
+            path: The snapshot file
+            lazy: If True, decode only the stats now and keep the file mapped
+                until the trades or the index are needed
+        """
+        snapshot_file = open_snapshot_file(path)
+        if snapshot_file is None:
+            return None
+        return cls._read(snapshot_file, lazy)
+
+    @classmethod
+    def from_bytes(cls, data, lazy=False):
+        """Load a snapshot encoded by to_bytes(); see load() for lazy."""
+        return cls._read(SnapshotBytes(data), lazy)
+
+    @classmethod
+    def _read(cls, snapshot_file, lazy):
+        header = snapshot_file.header
+        try:
+            stats = snapshot_file.section("stats")
+            if lazy:
+                return cls(
+                    None,
+                    header["version"],
+                    fetched_at=header["fetched_at"],
+                    block_cursor=header["block_cursor"],
+                    block_counts=header["block_counts"],
+                    stats=stats,
+                    source=snapshot_file,
+                    registry_version=header.get("registry_version"),
+                )
+            trades = [Trade.from_row(row) for row in snapshot_file.section("trades", [])]
+            positions = snapshot_file.section("builder_index")
+            builder_index = _from_positions(positions, trades) if positions is not None else None
+        except Exception:
+            snapshot_file.close()
+            raise
+        snapshot_file.close()
+        return cls(
+            {"data": {"EVM": {"DEXTrades": trades}}},
+            header["version"],
+            fetched_at=header["fetched_at"],
+            block_cursor=header["block_cursor"],
+            block_counts=header["block_counts"],
+            stats=stats,
+            builder_index=builder_index,
+            registry_version=header.get("registry_version"),
+        )
+
+    @property
+    def freshness(self):
+        """See freshness(); orders snapshots from any host or process, unlike version."""
+        return freshness(self.block_cursor, self.fetched_at)
+
+    @property
+    def age(self):
+        """Seconds elapsed since the payload was fetched."""
+        return time.time() - self.fetched_at
+
+    @property
+    def fetched_at_iso(self):
+        """UTC fetch time formatted for display."""
+        return time.strftime("%Y-%m-%d %H:%M:%S UTC", time.gmtime(self.fetched_at))
+
+
+def _newest_first(trade):
+    return tuple(-part for part in trade.position)
+
+
+def format_cursor(trade):
+    """Cursor pointing just past trade: its block, transaction index and log index."""
+    return ".".join(str(part) for part in trade.position)
+
+
+def parse_cursor(cursor):
+    """Inverse of format_cursor(); raises ValueError if cursor is malformed."""
+    parts = tuple(int(part) for part in cursor.split("."))
+    if len(parts) != 3:
+        raise ValueError(f"Invalid cursor: {cursor}")
+    return parts
+
+
+def freshness(block_cursor, fetched_at):
+    """
+    Sort key of a snapshot by how recent its data is: the newest block it
+    holds, then when it was fetched. Versions are counted per process, so
+    they can't tell which of two hosts' snapshots is newer.
+    """
+    return (block_cursor if block_cursor is not None else -1, fetched_at)
+
+
+def _from_positions(index, trades):
+    """An address index as stored in a snapshot file (positions in trades) with the trades themselves."""
+    return {address_lower: [trades[i] for i in positions] for address_lower, positions in index.items()}
+
+
+def build_address_index(trades):
+    """Map each lower-cased balance-change address to the trades it appears in, in order."""
+    index = {}
+    for trade in trades:
+        seen = set()
+        for balance in trade.balances:
+            address_lower = balance.address_lower
+            if address_lower and address_lower not in seen:
+                seen.add(address_lower)
+                index.setdefault(address_lower, []).append(trade)
+    return index
@@ -0,0 +1,153 @@
+"""
+Persistent on-disk copy of the cache snapshot.
+
+The file is a small header followed by independently encoded sections:
+
+    MAGIC | header length (8 bytes, little endian) | header | section | section ...
+
+The header is a marshalled dict with the snapshot metadata and the
+(offset, length) of every section. Sections are marshalled plain values
+(Trade.to_row() tuples, the address index, ...), which decode much faster than
+JSON. The file is memory-mapped on load and only the sections a caller asks
+for are decoded.
+"""
+import marshal
+import mmap
+import os
+import struct
+import tempfile
+from typing import Optional
+
+MAGIC = b"MEVSNAP1"
+FORMAT_VERSION = 2  # 2: Trade rows carry the transaction index
+# marshal's format can change between Python versions, so a file written by
+# another interpreter is treated as missing rather than misread
+MARSHAL_VERSION = marshal.version
+_HEADER_SIZE = struct.Struct("<Q")
+
+
+def encode_snapshot(meta: dict, sections: dict) -> bytes:
+    """Encode meta and sections in the snapshot file format, for storing somewhere other than a file."""
+    return b"".join(_encode(meta, sections))
+
+
+def _encode(meta: dict, sections: dict) -> list:
+    encoded = {name: marshal.dumps(value, MARSHAL_VERSION) for name, value in sections.items()}
+
+    offsets = {}
+    position = 0
+    for name, body in encoded.items():
+        offsets[name] = (position, len(body))
+        position += len(body)
+
+    header = dict(meta)
+    header["format"] = FORMAT_VERSION
+    header["python_marshal"] = MARSHAL_VERSION
+    header["sections"] = offsets
+    header_bytes = marshal.dumps(header, MARSHAL_VERSION)
+    return [MAGIC, _HEADER_SIZE.pack(len(header_bytes)), header_bytes, *encoded.values()]
+
+
+def write_snapshot_file(path: str, meta: dict, sections: dict) -> None:
+    """
+    Atomically write meta and sections to path.
+
+    The file is written next to path and renamed over it, so readers see
+    either the old file or the new one, never a partial write.
+    """
+    chunks = _encode(meta, sections)
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=".snapshot-", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.writelines(chunks)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+class SnapshotFile:
+    """
+    A read-only, memory-mapped snapshot file.
+
+    Use as a context manager; sections are decoded on demand with section().
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "rb")
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty file
+            self._file.close()
+            raise ValueError(f"{path} is not a snapshot file")
+
+        try:
+            self.header = self._read_header()
+        except Exception:
+            self.close()
+            raise
+
+    def _read_header(self) -> dict:
+        if self._map[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{self.path} is not a snapshot file")
+        start = len(MAGIC) + _HEADER_SIZE.size
+        (length,) = _HEADER_SIZE.unpack_from(self._map, len(MAGIC))
+        header = marshal.loads(self._map[start:start + length])
+        if header.get("format") != FORMAT_VERSION or header.get("python_marshal") != MARSHAL_VERSION:
+            raise ValueError(f"{self.path} was written in an incompatible format")
+        self._body_start = start + length
+        return header
+
+    def section(self, name: str, default=None):
+        """Decode one section, or return default if the file doesn't have it."""
+        location = self.header["sections"].get(name)
+        if location is None:
+            return default
+        offset, length = location
+        start = self._body_start + offset
+        view = memoryview(self._map)[start:start + length]
+        try:
+            return marshal.loads(view)
+        finally:
+            view.release()
+
+    def close(self) -> None:
+        self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class SnapshotBytes(SnapshotFile):
+    """A snapshot held in memory (e.g. fetched from a cache server), read like a SnapshotFile."""
+
+    def __init__(self, data: bytes, name: str = "<bytes>"):
+        self.path = name
+        self._file = None
+        self._map = data
+        self.header = self._read_header()
+
+    def close(self) -> None:
+        self._map = b""
+
+
+def open_snapshot_file(path: str) -> Optional[SnapshotFile]:
+    """Open path as a SnapshotFile, or return None if it is missing or unreadable."""
+    try:
+        return SnapshotFile(path)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError, EOFError, TypeError, struct.error) as e:
+        print(f"Ignoring unreadable snapshot file {path}: {e}")
+        return None
+
@@ -0,0 +1,266 @@
+"""
+Real-time ingestion over Bitquery's GraphQL subscription endpoint.
+
+Instead of re-pulling the latest trades every few minutes, a SubscriptionIngestor
+keeps a WebSocket open, receives DEXTrades as blocks are indexed and hands
+them to a callback in small batches. After a disconnect it reconnects with
+backoff and backfills the blocks it missed with a regular query.
+
+Requires the optional websockets package (pip install websockets).
+"""
+import asyncio
+import json
+import random
+import threading
+import time
+from typing import Callable, Iterable, Optional
+from urllib.parse import urlencode
+
+try:
+    import websockets
+except ImportError:  # optional dependency
+    websockets = None
+
+import config
+from dataservice import _build_subscription, block_number
+
+BITQUERY_WS_URL = "wss://streaming.bitquery.io/graphql"
+# The subscriptions-transport-ws protocol, which Bitquery's endpoint speaks
+SUBPROTOCOL = "graphql-ws"
+
+
+def available():
+    """True if websockets is installed and subscriptions can be used."""
+    return websockets is not None
+
+
+def _payload_trades(message: dict) -> list:
+    """The DEXTrades of a "data" message, or [] if it has none."""
+    payload = message.get("payload") or {}
+    data = payload.get("data") if isinstance(payload, dict) else None
+    if not isinstance(data, dict):
+        return []
+    evm = data.get("EVM")
+    if not isinstance(evm, dict):
+        return []
+    trades = evm.get("DEXTrades")
+    return trades if isinstance(trades, list) else []
+
+
+class SubscriptionIngestor:
+    """
+    Consume the DEXTrades subscription on a background thread.
+
+    Args:
+        on_trades: Called with each batch of raw DEXTrades, from the ingestor's thread
+        backfill: Called as backfill(since_block) after a reconnect; should return
+            the trades of blocks newer than since_block (e.g. a
+            stream_transaction_balances() query), which are passed to on_trades
+        url: WebSocket endpoint
+        token: API token, sent as the token query parameter (config.TOKEN if None)
+        addresses: Restrict the balance join to these addresses server-side
+        since_block: Highest block already ingested, so the first connection backfills too
+        flush_interval: Seconds to collect trades before handing them on as one batch
+        max_reconnect_delay: Upper bound of the exponential reconnect backoff
+    """
+
+    def __init__(
+        self,
+        on_trades: Callable[[list], None],
+        backfill: Optional[Callable[[int], Iterable[dict]]] = None,
+        url: str = BITQUERY_WS_URL,
+        token: Optional[str] = None,
+        addresses: Optional[Iterable[str]] = None,
+        since_block: Optional[int] = None,
+        flush_interval: float = 1.0,
+        max_reconnect_delay: float = 60.0,
+    ):
+        if websockets is None:
+            raise RuntimeError("Subscription ingestion requires websockets (pip install websockets)")
+        self.on_trades = on_trades
+        self.backfill = backfill
+        self.url = url
+        self.token = token if token is not None else getattr(config, "TOKEN", None)
+        self.query = _build_subscription(addresses)
+        self.last_block = since_block
+        self.flush_interval = flush_interval
+        self.max_reconnect_delay = max_reconnect_delay
+
+        self.connects = 0
+        self.trades_received = 0
+        self.last_message_at = None
+
+        self._thread = None
+        self._stopping = threading.Event()
+
+    @property
+    def connected_url(self):
+        if not self.token:
+            return self.url
+        separator = "&" if "?" in self.url else "?"
+        return f"{self.url}{separator}{urlencode({'token': self.token})}"
+
+    def start(self):
+        """Start consuming on a daemon thread; does nothing if already running."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run_thread, name="subscription", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = 5.0):
+        """Close the connection and wait for the thread to finish."""
+        # The receive loop checks the flag at least every half second
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run_thread(self):
+        asyncio.run(self._run())
+
+    async def _run(self):
+        delay = 1.0
+        while not self._stopping.is_set():
+            connects = self.connects
+            try:
+                await self._consume()
+            except Exception as e:
+                if self._stopping.is_set():
+                    break
+                print(f"Subscription disconnected: {e}")
+            if self.connects > connects:
+                # The connection worked for a while; start backing off afresh
+                delay = 1.0
+            if self._stopping.is_set():
+                break
+            # Exponential backoff with jitter so many clients don't reconnect in lockstep
+            sleep = delay * random.uniform(0.5, 1.0)
+            print(f"Reconnecting subscription in {sleep:.1f}s")
+            await self._sleep(sleep)
+            delay = min(delay * 2, self.max_reconnect_delay)
+
+    async def _sleep(self, seconds):
+        deadline = time.monotonic() + seconds
+        while not self._stopping.is_set() and time.monotonic() < deadline:
+            await asyncio.sleep(min(0.1, deadline - time.monotonic()))
+
+    async def _consume(self):
+        async with websockets.connect(self.connected_url, subprotocols=[SUBPROTOCOL]) as ws:
+            await ws.send(json.dumps({"type": "connection_init", "payload": {}}))
+            while True:
+                message = json.loads(await ws.recv())
+                if message.get("type") == "connection_ack":
+                    break
+                if message.get("type") == "connection_error":
+                    raise ConnectionError(f"Subscription rejected: {message.get('payload')}")
+
+            await ws.send(json.dumps({"id": "1", "type": "start", "payload": {"query": self.query}}))
+            self.connects += 1
+            print(f"Subscribed to DEXTrades at {self.url}")
+
+            # Subscribed first, so nothing indexed during the backfill query is
+            # missed; overlapping trades are deduplicated by the consumer. The
+            # last block ingested is fetched again, as it may have arrived in part
+            if self.backfill is not None and self.last_block is not None:
+                since_block = self.last_block - 1
+                trades = await asyncio.get_running_loop().run_in_executor(
+                    None, lambda: list(self.backfill(since_block))
+                )
+                print(f"Backfilled {len(trades)} trades newer than block {since_block}")
+                self._deliver(trades)
+
+            batch = []
+            flush_at = time.monotonic() + self.flush_interval
+            try:
+                while not self._stopping.is_set():
+                    timeout = max(0.0, min(flush_at - time.monotonic(), 0.5))
+                    try:
+                        raw = await asyncio.wait_for(ws.recv(), timeout)
+                    except asyncio.TimeoutError:
+                        raw = None
+
+                    if raw is not None:
+                        message = json.loads(raw)
+                        kind = message.get("type")
+                        if kind in ("data", "next"):
+                            errors = (message.get("payload") or {}).get("errors")
+                            if errors:
+                                print(f"Subscription errors: {errors}")
+                            batch.extend(_payload_trades(message))
+                            self.last_message_at = time.time()
+                        elif kind == "error":
+                            raise ConnectionError(f"Subscription error: {message.get('payload')}")
+                        elif kind == "complete":
+                            raise ConnectionError("Subscription completed by the server")
+                        # "ka" keep-alives need no answer
+
+                    if batch and time.monotonic() >= flush_at:
+                        self._deliver(batch)
+                        batch = []
+                    if time.monotonic() >= flush_at:
+                        flush_at = time.monotonic() + self.flush_interval
+            finally:
+                # Whatever arrived before a disconnect is still delivered
+                self._deliver(batch)
+
+    def _deliver(self, trades):
+        if not trades:
+            return
+        self.trades_received += len(trades)
+        try:
+            self.on_trades(trades)
+        except Exception as e:
+            # last_block only covers what the consumer took, so reconnecting
+            # backfills these blocks instead of losing them
+            raise RuntimeError(f"Error ingesting {len(trades)} subscription trades: {e}") from e
+        for trade in trades:
+            number = block_number(trade)
+            if number is not None and (self.last_block is None or number > self.last_block):
+                self.last_block = number
+
+    def stats(self):
+        """Counters for monitoring the subscription."""
+        return {
+            "connects": self.connects,
+            "trades_received": self.trades_received,
+            "last_block": self.last_block,
+            "last_message_at": self.last_message_at,
+            "running": self._thread is not None and self._thread.is_alive(),
+        }
+
+
+if __name__ == "__main__":
+    # Offline check against mock_subscription.py: connections are dropped every
+    # few messages, and every generated trade must still arrive via the stream
+    # or the backfill:  python subscription.py [seconds]
+    import sys
+    from dataservice import trade_key
+    from mock_subscription import MockSubscriptionServer
+
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 10
+    server = MockSubscriptionServer(port=0, rate=5, trades_per_block=20, drop_after=4).start()
+    received = {}
+
+    def collect(trades):
+        for trade in trades:
+            received[trade_key(trade)] = trade
+
+    ingestor = SubscriptionIngestor(
+        collect, backfill=server.trades_since, url=server.url, token="",
+        since_block=server.next_block - 1, flush_interval=0.5, max_reconnect_delay=1,
+    )
+    ingestor.start()
+    time.sleep(seconds)
+    ingestor.stop()
+    server.stop()
+
+    expected = {
+        trade_key(trade) for trade in server.history
+        if block_number(trade) <= ingestor.last_block
+    }
+    missing = expected - set(received)
+    print(
+        f"{len(server.history)} trades generated, {len(received)} received over "
+        f"{ingestor.connects} connections (last block {ingestor.last_block}) | "
+        f"{'ok' if not missing else f'MISSING {len(missing)}'}"
+    )
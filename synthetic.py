@@ -0,0 +1,198 @@
+import random
+import time
+from typing import Iterator, Optional
+
+from filter import DEFAULT_ADDRESSES
+
+_TOKENS = [
+    ("Ether", "ETH", "0x"),
+    ("Wrapped Ether", "WETH", "0xc02aaa39b223fe8d0a0e5c4f27ead9083c756cc2"),
+    ("USD Coin", "USDC", "0xa0b86991c6218b36c1d19d4a2e9eb0ce3606eb48"),
+    ("Tether USD", "USDT", "0xdac17f958d2ee523a2206206994597c13d831ec7"),
+    ("Dai Stablecoin", "DAI", "0x6b175474e89094c44da98b954eedeac495271d0f"),
+    ("Pepe", "PEPE", "0x6982508145454ce325ddbe47a25d4ec3d2311933"),
+]
+_PROTOCOLS = ["uniswap_v2", "uniswap_v3", "sushiswap", "curve", "balancer_v2"]
+_REASON_CODES = [0, 1, 2, 3, 5]
+
+
+def _address(rng: random.Random) -> str:
+    return "0x%040x" % rng.getrandbits(160)
+
+
+def _format_time(timestamp: int) -> str:
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(timestamp))
+
+
+def _side(rng: random.Random) -> dict:
+    name, symbol, contract = rng.choice(_TOKENS)
+    amount = rng.uniform(0.001, 100)
+    price_usd = rng.uniform(0.5, 4000)
+    return {
+        "Amount": f"{amount:.18f}",
+        "AmountInUSD": f"{amount * price_usd:.6f}",
+        "Buyer": _address(rng),
+        "Seller": _address(rng),
+        "Currency": {"Decimals": 18, "Name": name, "Symbol": symbol, "SmartContract": contract},
+        "Price": f"{rng.uniform(0.0001, 10):.12f}",
+        "PriceInUSD": f"{price_usd:.6f}",
+    }
+
+
+def _usd(rng: random.Random, high: float) -> str:
+    return f"{rng.uniform(0, high):.6f}"
+
+
+def _transaction_details(rng: random.Random, block_time: int) -> dict:
+    gas_price = rng.randrange(5 * 10 ** 9, 80 * 10 ** 9)
+    return {
+        "Gas": str(rng.randrange(100000, 600000)),
+        "Cost": f"{rng.uniform(0.001, 0.05):.18f}",
+        "CostInUSD": _usd(rng, 150),
+        "GasFeeCap": str(gas_price * 2),
+        "GasFeeCapInUSD": _usd(rng, 0.0005),
+        "GasPrice": str(gas_price),
+        "GasPriceInUSD": _usd(rng, 0.0003),
+        "GasTipCap": "0",
+        "GasTipCapInUSD": "0.000000",
+        "Nonce": str(rng.randrange(100000)),
+        "Protected": False,
+        "Time": _format_time(block_time),
+        "Type": str(rng.choice((0, 2, 2, 2))),
+        "Value": f"{rng.uniform(0, 2):.18f}",
+        "ValueInUSD": _usd(rng, 8000),
+    }
+
+
+def _trade_details(rng: random.Random) -> dict:
+    """The fields of a trade beyond Block, Transaction, Log, Trade and the balance join."""
+    return {
+        "Fee": {
+            "Burnt": f"{rng.uniform(0, 0.02):.18f}",
+            "BurntInUSD": _usd(rng, 80),
+            "EffectiveGasPrice": str(rng.randrange(5 * 10 ** 9, 80 * 10 ** 9)),
+            "EffectiveGasPriceInUSD": _usd(rng, 0.0003),
+            "GasRefund": str(rng.randrange(20000)),
+            "MinerReward": "0",
+            "MinerRewardInUSD": "0.000000",
+            "PriorityFeePerGas": "0",
+            "PriorityFeePerGasInUSD": "0.000000",
+            "Savings": f"{rng.uniform(0, 0.01):.18f}",
+            "SavingsInUSD": _usd(rng, 40),
+            "SenderFee": f"{rng.uniform(0, 0.05):.18f}",
+            "SenderFeeInUSD": _usd(rng, 150),
+        },
+        "Receipt": {"ContractAddress": "0x0000000000000000000000000000000000000000", "Status": "1"},
+        "TransactionStatus": {"Success": rng.random() > 0.02},
+        "Call": {
+            "From": _address(rng),
+            "InternalCalls": str(rng.randrange(1, 40)),
+            "Signature": {"Name": "swap", "Signature": "swap(uint256,uint256,address,bytes)"},
+            "To": _address(rng),
+            "Value": "0",
+        },
+    }
+
+
+def generate_trades(
+    trades: int = 20000,
+    rows_per_trade: int = 4,
+    builder_hit_rate: float = 0.3,
+    dict_join_rate: float = 0.05,
+    trades_per_block: int = 150,
+    start_block: int = 20000000,
+    builders: Optional[list] = None,
+    seed: int = 0,
+) -> Iterator[dict]:
+    """
+    Yield synthetic DEXTrades, newest block first, with every field the old
+    catch-all query selected; fields.project() narrows them to what a query
+    built from field sets would return.
+
+    Args:
+        trades: Number of trades to generate
+        rows_per_trade: Average number of joinTransactionBalances rows per trade
+        builder_hit_rate: Fraction of trades with a balance row for one of builders
+        dict_join_rate: Fraction of trades whose joinTransactionBalances uses the
+            dict forms (a single item, or items keyed by index) instead of a list
+        trades_per_block: Trades packed into each block
+        start_block: Number of the newest block
+        builders: Builder addresses to draw hits from (DEFAULT_ADDRESSES if None)
+        seed: Seed for the random generator, so runs are reproducible
+    """
+    rng = random.Random(seed)
+    # Fields outside the dashboard's field set come from their own generator,
+    # so adding them left the dashboard's data for a given seed unchanged
+    detail_rng = random.Random(seed + 1)
+    builders = builders or DEFAULT_ADDRESSES
+    base_time = 1700000000
+
+    for i in range(trades):
+        block_offset = i // trades_per_block
+        block_number = start_block - block_offset
+        block_time = base_time - block_offset * 12
+        tx_hash = "0x%064x" % rng.getrandbits(256)
+
+        row_count = 1 + int(rng.expovariate(1 / rows_per_trade)) if rows_per_trade else 0
+        builder_row = rng.randrange(row_count) if row_count and rng.random() < builder_hit_rate else None
+        rows = []
+        for row in range(row_count):
+            address = rng.choice(builders) if row == builder_row else _address(rng)
+            name, symbol, contract = rng.choice(_TOKENS)
+            pre = rng.uniform(0, 50)
+            post = max(0.0, pre + rng.gauss(0, 1))
+            price = rng.uniform(0.5, 4000)
+            rows.append({
+                "TokenBalance": {
+                    "Address": address,
+                    "BalanceChangeReasonCode": rng.choice(_REASON_CODES),
+                    "Currency": {"Name": name, "Symbol": symbol, "SmartContract": contract},
+                    "PostBalance": f"{post:.18f}",
+                    "PostBalanceInUSD": f"{post * price:.6f}",
+                    "PreBalance": f"{pre:.18f}",
+                    "PreBalanceInUSD": f"{pre * price:.6f}",
+                },
+                "Transaction": {"Hash": tx_hash},
+            })
+
+        join = rows
+        if rows and rng.random() < dict_join_rate:
+            join = rows[0] if len(rows) == 1 else {str(k): v for k, v in enumerate(rows)}
+
+        yield {
+            "Block": {
+                "Time": _format_time(block_time),
+                "Number": str(block_number),
+            },
+            "Transaction": dict(
+                {
+                    "Hash": tx_hash,
+                    "Index": str(i % trades_per_block),
+                    "From": _address(rng),
+                    "To": _address(rng),
+                },
+                **_transaction_details(detail_rng, block_time),
+            ),
+            "Log": {
+                "Index": str(rng.randrange(500)),
+                "SmartContract": _address(rng),
+                "Signature": {"Name": "Swap"},
+            },
+            "Trade": {
+                "Buy": _side(rng),
+                "Sell": _side(rng),
+                "Dex": {
+                    "ProtocolName": rng.choice(_PROTOCOLS),
+                    "SmartContract": _address(rng),
+                    "OwnerAddress": _address(rng),
+                },
+            },
+            "joinTransactionBalances": join,
+            **_trade_details(detail_rng),
+        }
+
+
+def generate_payload(trades: int = 20000, **kwargs) -> dict:
+    """A complete synthetic API response; see generate_trades() for the options."""
+    return {"data": {"EVM": {"DEXTrades": list(generate_trades(trades, **kwargs))}}}
+
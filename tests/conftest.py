@@ -0,0 +1,50 @@
+import os
+import sys
+import types
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# The tests never call Bitquery, so no token is needed; dataservice only
+# needs config.py (which is not committed) to import
+try:
+    import config  # noqa: F401
+except ImportError:
+    config = types.ModuleType("config")
+    config.TOKEN = ""
+    sys.modules["config"] = config
+
+# Keep app imports from reading or writing the working directory's files
+os.environ.setdefault("SNAPSHOT_PATH", "")
+os.environ.setdefault("ARCHIVE_PATH", "")
+os.environ.setdefault("BUILDERS_PATH", "")
+
+
+@pytest.fixture
+def app_module(monkeypatch):
+    """The app module with an empty cache, no persisted snapshot and no shared backend."""
+    import app
+
+    monkeypatch.setattr(app, "_snapshot", None)
+    monkeypatch.setattr(app, "_warm_start_done", True)
+    monkeypatch.setattr(app, "SNAPSHOT_PATH", "")
+    monkeypatch.setattr(app, "ARCHIVE_PATH", "")
+    monkeypatch.setattr(app, "CACHE_BACKEND", "")
+    monkeypatch.setattr(app, "_cache_backend", None)
+    return app
+
+
+@pytest.fixture
+def ingest_full(app_module):
+    """Publishes raw trades as the app's whole window, as a full fetch would; returns the Snapshot."""
+    from pipeline import IngestPass
+
+    def ingest(raw_trades):
+        ingest = IngestPass().feed(raw_trades)
+        return app_module._ingest(
+            ingest.trades, ingest.block_keys, False,
+            accumulator=ingest.accumulator, builder_index=ingest.builder_index,
+        )
+
+    return ingest
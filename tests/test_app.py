@@ -0,0 +1,269 @@
+import pytest
+
+from synthetic import generate_trades
+
+
+def test_builder_page_sizes_are_not_memoized(app_module, ingest_full):
+    snapshot = ingest_full(generate_trades(2000))
+    address = snapshot.stats["builder_summary"][0]["address"]
+    client = app_module.app.test_client()
+
+    assert client.get(f"/builder/{address}").status_code == 200
+    views = len(snapshot._views)
+    for limit in range(1, 30):
+        assert client.get(f"/builder/{address}?limit={limit}").status_code == 200
+    assert client.get(f"/builder/{address.upper().replace('0X', '0x')}").status_code == 200
+    assert len(snapshot._views) == views
+
+
+def test_failed_incremental_ingest_leaves_the_published_accumulator(app_module, ingest_full, monkeypatch):
+    from pipeline import IngestPass
+    from processing import StatsAccumulator
+
+    raw = sorted(generate_trades(3000), key=lambda trade: int(trade["Block"]["Number"]))
+    snapshot = ingest_full(raw[:2000])
+    stats = snapshot.accumulator.result()
+
+    def fail(*args, **kwargs):
+        raise RuntimeError("snapshot build failed")
+
+    monkeypatch.setattr(app_module, "Snapshot", fail)
+    delta = IngestPass(aggregate=False).feed(raw[2000:])
+    with pytest.raises(RuntimeError):
+        app_module._ingest(delta.trades, delta.block_keys, True, persist=False)
+    assert app_module._snapshot is snapshot
+    assert snapshot.accumulator.result() == stats == StatsAccumulator().update(snapshot.trades).result()
+
+
+@pytest.mark.parametrize("path", ["/", "/api/stats"])
+def test_only_configured_windows_are_accepted(app_module, ingest_full, path):
+    snapshot = ingest_full(generate_trades(500))
+    client = app_module.app.test_client()
+    views = len(snapshot._views)
+    for window in ("1m", "2m", "48h", "99999d"):
+        assert client.get(f"{path}?window={window}").status_code == 400
+    assert len(snapshot._views) == views
+
+
+def _by_block(trades):
+    return sorted(trades, key=lambda trade: -int(trade["Block"]["Number"]))
+
+
+def test_redelivered_subscription_batch_changes_nothing(app_module, ingest_full, monkeypatch):
+    monkeypatch.setattr(app_module, "FETCH_LIMIT", 500)
+    raw = _by_block(generate_trades(800, trades_per_block=40))
+    ingest_full(raw[300:])
+    batch = raw[:300]
+
+    app_module._ingest_subscription_trades(batch)
+    snapshot = app_module._snapshot
+    window = (dict(snapshot.block_counts), [trade.key for trade in snapshot.trades], snapshot.stats)
+    assert sum(snapshot.block_counts.values()) >= 500
+
+    for _ in range(4):
+        app_module._ingest_subscription_trades(batch)
+        snapshot = app_module._snapshot
+        assert (dict(snapshot.block_counts), [trade.key for trade in snapshot.trades], snapshot.stats) == window
+
+
+def test_merged_window_reuses_the_accumulators_index(app_module, ingest_full, monkeypatch):
+    import snapshot as snapshot_module
+    from snapshot import build_address_index
+
+    monkeypatch.setattr(app_module, "FETCH_LIMIT", 500)
+    raw = _by_block(generate_trades(800, trades_per_block=40))
+    ingest_full(raw[200:])
+
+    def rebuild(trades):
+        raise AssertionError("merged window was indexed from scratch")
+
+    monkeypatch.setattr(snapshot_module, "build_address_index", rebuild)
+    for start in range(200, 0, -50):
+        app_module._ingest_subscription_trades(raw[start - 50:start])
+    snapshot = app_module._snapshot
+    assert snapshot.builder_index == build_address_index(snapshot.trades)
+    for row in snapshot.stats["builder_summary"]:
+        assert snapshot.builder_trades(row["address"]) == [
+            trade for trade in snapshot.trades if trade.involves(row["address"].lower())
+        ]
+
+
+def test_subscription_batch_work_is_bounded_by_the_batch(app_module, ingest_full, monkeypatch):
+    from processing import StatsAccumulator
+
+    monkeypatch.setattr(app_module, "FETCH_LIMIT", 5000)
+    raw = _by_block(generate_trades(5300, trades_per_block=30))
+    ingest_full(raw[300:])
+
+    applied = []
+    apply = StatsAccumulator._apply
+    monkeypatch.setattr(StatsAccumulator, "_apply", lambda self, trade, *args: applied.append(trade) or apply(self, trade, *args))
+    evicted = 0
+    for start in range(300, 0, -30):
+        del applied[:]
+        previous = app_module._snapshot
+        app_module._ingest_subscription_trades(raw[start - 30:start])
+        snapshot = app_module._snapshot
+        # Only the batch's kept trades and the ones evicted for them are folded in
+        before, after = set(map(id, previous.trades)), set(map(id, snapshot.trades))
+        assert sorted(map(id, applied)) == sorted((before - after) | (after - before))
+        assert len(after - before) <= 30
+        evicted += len(before - after)
+    assert evicted
+
+
+def test_block_delivered_in_parts_is_counted_once(app_module, ingest_full, monkeypatch):
+    monkeypatch.setattr(app_module, "FETCH_LIMIT", 500)
+    raw = _by_block(generate_trades(800, trades_per_block=40))
+    newest = int(raw[0]["Block"]["Number"])
+    block = [trade for trade in raw if int(trade["Block"]["Number"]) == newest]
+    ingest_full(raw[len(block):])
+
+    # The first part of the block, then all of it again (e.g. a re-fetch of the cursor block)
+    app_module._ingest_subscription_trades(block[:15])
+    app_module._ingest_subscription_trades(block)
+    assert app_module._snapshot.block_counts[newest] == len(block)
+    assert app_module._snapshot.block_cursor == newest
+
+
+def test_subscription_trades_without_snapshot_are_not_dropped(app_module):
+    with pytest.raises(RuntimeError):
+        app_module._ingest_subscription_trades(list(generate_trades(10)))
+
+
+def test_builders_event_lists_the_builders_on_the_new_dashboard(app_module, ingest_full):
+    from builders import DEFAULT_ADDRESSES
+
+    everyone = ingest_full(generate_trades(2000))
+    fewer = ingest_full(generate_trades(2000, builders=DEFAULT_ADDRESSES[:2], seed=1))
+    before = {row["address"].lower() for row in everyone.stats["builder_summary"]}
+    after = [row["address"].lower() for row in fewer.stats["builder_summary"]]
+    assert set(after) < before
+
+    update = app_module._builders_event(everyone, fewer)
+    assert update["addresses"] == after
+    assert {builder["address"].lower() for builder in update["builders"]} <= set(after)
+
+    # The page keys its rows by the same addresses the event lists
+    page = app_module.app.test_client().get("/").get_data(as_text=True)
+    for address in after:
+        assert f'data-builder="{address}"' in page
+    assert page.count("<tr data-builder=") == len(after)
+
+
+def test_dumps_matches_the_json_module():
+    import json
+
+    import jsonapi
+    from processing import calculate_stats
+
+    stats = calculate_stats({"data": {"EVM": {"DEXTrades": list(generate_trades(500))}}})
+    reference = json.dumps(stats, default=jsonapi._default, separators=(",", ":"), ensure_ascii=False)
+    assert json.loads(jsonapi.dumps(stats)) == json.loads(reference)
+    # Sets are sent as sorted lists
+    assert json.loads(jsonapi.dumps({"a": {3, 1, 2}})) == {"a": [1, 2, 3]}
+
+
+def test_select_fields():
+    from jsonapi import parse_fields, select_fields
+
+    document = {
+        "total": 3,
+        "builders": [{"address": "0xa", "profit": 1.0, "tokens": {"ETH": 1}}, {"address": "0xb", "profit": 2.0}],
+        "nested": {"a": {"b": 1, "c": 2}, "d": 3},
+    }
+    assert select_fields(document, ["total", "builders.address"]) == {
+        "total": 3, "builders": [{"address": "0xa"}, {"address": "0xb"}],
+    }
+    assert select_fields(document, ["nested.a.c", "missing", "total.deeper"]) == {"nested": {"a": {"c": 2}}, "total": 3}
+    # A shorter path keeps everything below it, in either order
+    assert select_fields(document, ["nested", "nested.a.b"]) == {"nested": document["nested"]}
+    assert select_fields(document, ["nested.a.b", "nested"]) == {"nested": document["nested"]}
+    assert parse_fields(" b, a ,,a") == ("a", "b")
+    assert parse_fields("") is None and parse_fields(",") is None
+
+
+@pytest.mark.parametrize("header, brotli_expected, gzip_expected", [
+    (None, None, None),
+    ("", None, None),
+    ("identity", None, None),
+    ("gzip", "gzip", "gzip"),
+    ("gzip, deflate, br", "br", "gzip"),
+    ("br;q=0, gzip", "gzip", "gzip"),
+    ("gzip;q=0", None, None),
+    ("BR", "br", None),
+])
+def test_negotiate_encoding(monkeypatch, header, brotli_expected, gzip_expected):
+    import jsonapi
+
+    if jsonapi.brotli is not None:
+        assert jsonapi.negotiate_encoding(header) == brotli_expected
+    monkeypatch.setattr(jsonapi, "brotli", None)
+    assert jsonapi.negotiate_encoding(header) == gzip_expected
+
+
+def test_compress():
+    import gzip
+
+    import jsonapi
+
+    small = b"{}"
+    assert jsonapi.compress(small, "gzip") == (small, None)
+    body = b'{"a":"' + b"x" * 5000 + b'"}'
+    compressed, encoding = jsonapi.compress(body, "gzip")
+    assert encoding == "gzip" and gzip.decompress(compressed) == body and len(compressed) < len(body)
+    # Deterministic, so the memoized body and its ETag stay consistent
+    assert jsonapi.compress(body, "gzip")[0] == compressed
+    assert jsonapi.compress(body, None) == (body, None)
+
+
+def test_api_stats_encodings_and_conditional_requests(app_module, ingest_full):
+    import gzip
+    import json
+
+    snapshot = ingest_full(generate_trades(1000))
+    client = app_module.app.test_client()
+
+    plain = client.get("/api/stats", headers={"Accept-Encoding": "identity"})
+    assert plain.status_code == 200 and "Content-Encoding" not in plain.headers
+    assert "Accept-Encoding" in plain.headers["Vary"]
+    document = json.loads(plain.data)
+    assert document["version"] == snapshot.version
+    assert not set(app_module.API_STATS_EXCLUDED) & set(document)
+
+    zipped = client.get("/api/stats", headers={"Accept-Encoding": "gzip"})
+    assert zipped.headers["Content-Encoding"] == "gzip"
+    assert json.loads(gzip.decompress(zipped.data)) == document
+    # Each representation has its own ETag
+    assert zipped.headers["ETag"] != plain.headers["ETag"]
+
+    for response, encoding in ((plain, "identity"), (zipped, "gzip")):
+        again = client.get("/api/stats", headers={"Accept-Encoding": encoding, "If-None-Match": response.headers["ETag"]})
+        assert again.status_code == 304 and again.data == b""
+
+    selected = client.get("/api/stats?fields=total_transactions,builder_summary.address,unique_blocks")
+    assert set(json.loads(selected.data)) == {"total_transactions", "builder_summary", "unique_blocks"}
+    assert selected.headers["ETag"] not in (plain.headers["ETag"], zipped.headers["ETag"])
+    stale = client.get("/api/stats", headers={"Accept-Encoding": "identity", "If-None-Match": '"0-0"'})
+    assert stale.status_code == 200
+
+
+@pytest.mark.parametrize("cursor", ["x", "1.2", "1.2.x"])
+def test_malformed_builder_page_cursor_is_a_bad_request(app_module, ingest_full, cursor):
+    snapshot = ingest_full(generate_trades(1000))
+    address = snapshot.stats["builder_summary"][0]["address"]
+    client = app_module.app.test_client()
+
+    assert client.get(f"/builder/{address}?cursor={cursor}").status_code == 400
+    response = client.get(f"/api/builder/{address}/trades?cursor={cursor}")
+    assert response.status_code == 400 and response.get_json() == {"error": "Invalid page cursor"}
+    assert client.get(f"/api/builder/{address}/trades").status_code == 200
+
+
+def test_refresh_retries_back_off_up_to_the_refresh_interval(app_module):
+    interval = app_module.CACHE_TTL - app_module.REFRESH_AHEAD
+    for failures in range(1, 12):
+        expected = min(app_module.REFRESH_CHECK_INTERVAL * 2 ** (failures - 1), interval)
+        for _ in range(20):
+            assert expected / 2 <= app_module._refresh_retry_delay(failures) <= expected
+    assert app_module._refresh_retry_delay(30) <= interval
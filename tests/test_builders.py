@@ -0,0 +1,86 @@
+import json
+import os
+
+import pytest
+
+import builders as builder_registry
+from builders import DEFAULT_ADDRESSES, BuilderRegistry, address_key
+
+TITAN = "0x4838B106FCe9647Bdf1E7877BF73cE8B0BAD5f97"
+
+
+def test_address_key_accepts_any_spelling():
+    key = bytes.fromhex(TITAN[2:])
+    for spelling in (TITAN, TITAN.lower(), TITAN.upper().replace("0X", "0x"), TITAN[2:], f"  {TITAN}\n"):
+        assert address_key(spelling) == key, spelling
+    for invalid in (None, 42, "", "0x", TITAN[:-1], TITAN + "0", "0x" + "g" * 40):
+        assert address_key(invalid) is None, invalid
+
+
+def _write(path, config):
+    path.write_text(json.dumps(config))
+    return str(path)
+
+
+def test_load_labels_and_spellings(tmp_path):
+    path = _write(tmp_path / "builders.json", {"builders": [
+        {"label": "Titan", "addresses": [TITAN, TITAN.lower()]},
+        {"label": "Other", "address": DEFAULT_ADDRESSES[0], "addresses": [DEFAULT_ADDRESSES[1]]},
+        DEFAULT_ADDRESSES[2],
+    ]})
+    registry = BuilderRegistry.load(path)
+
+    assert len(registry.builders) == 3 and len(registry) == 4
+    assert registry.label(TITAN.lower()) == registry.label(TITAN[2:]) == "Titan"
+    assert registry.label(DEFAULT_ADDRESSES[1]) == "Other"
+    assert registry.label(DEFAULT_ADDRESSES[2]) is None
+    assert TITAN.upper().replace("0X", "0x") in registry and "0x" + "0" * 40 not in registry
+    assert set(registry.by_address) == {address.lower() for address in [TITAN] + DEFAULT_ADDRESSES[:3]}
+    # Shown as configured
+    assert registry.display_address(TITAN.lower()) == TITAN
+
+
+@pytest.mark.parametrize("config", [
+    {"builders": "nope"},
+    {"builders": [42]},
+    {"builders": [{"label": "Empty"}]},
+    {"builders": [{"addresses": ["0x1234"]}]},
+    {"builders": [{"label": "A", "addresses": [TITAN]}, {"label": "B", "addresses": [TITAN.lower()]}]},
+])
+def test_load_rejects_invalid_files(tmp_path, config):
+    with pytest.raises(ValueError):
+        BuilderRegistry.load(_write(tmp_path / "builders.json", config))
+
+
+def test_version_ignores_respelling():
+    lower = BuilderRegistry.from_addresses([address.lower() for address in DEFAULT_ADDRESSES])
+    assert BuilderRegistry.from_addresses(DEFAULT_ADDRESSES).version == lower.version
+    assert BuilderRegistry.from_addresses(DEFAULT_ADDRESSES[1:]).version != lower.version
+
+
+def test_reload_when_the_file_changes(tmp_path, monkeypatch):
+    path = tmp_path / "builders.json"
+    monkeypatch.setattr(builder_registry, "BUILDERS_PATH", str(path))
+    monkeypatch.setattr(builder_registry, "RELOAD_CHECK_INTERVAL", 0)
+    monkeypatch.setattr(builder_registry, "_registry", None)
+    monkeypatch.setattr(builder_registry, "_file_state", None)
+
+    # No file: the defaults
+    assert set(builder_registry.get_registry().by_address) == {address.lower() for address in DEFAULT_ADDRESSES}
+
+    _write(path, [{"label": "Titan", "addresses": [TITAN]}])
+    registry = builder_registry.get_registry()
+    assert registry.label(TITAN) == "Titan" and len(registry) == 1
+    assert builder_registry.get_registry() is registry
+
+    _write(path, [{"label": "Titan Builder", "addresses": [TITAN]}, DEFAULT_ADDRESSES[0]])
+    os.utime(path, ns=(1, 1))
+    reloaded = builder_registry.get_registry()
+    assert reloaded.label(TITAN) == "Titan Builder" and reloaded.version != registry.version
+
+    # A broken file keeps the previous registry
+    path.write_text("{not json")
+    assert builder_registry.get_registry() is reloaded
+
+    path.unlink()
+    assert len(builder_registry.get_registry()) == len(DEFAULT_ADDRESSES)
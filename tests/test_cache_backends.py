@@ -0,0 +1,57 @@
+import pytest
+
+from cache_backends import make_backend
+from pipeline import IngestPass
+from snapshot import Snapshot
+from synthetic import generate_trades
+
+
+def _snapshot(version, block_cursor, fetched_at):
+    ingest = IngestPass().feed(generate_trades(300, start_block=block_cursor))
+    return Snapshot(
+        {"data": {"EVM": {"DEXTrades": ingest.trades}}}, version,
+        fetched_at=fetched_at, block_cursor=block_cursor, block_counts=ingest.block_counts,
+        accumulator=ingest.accumulator, builder_index=ingest.builder_index,
+    )
+
+
+@pytest.fixture(params=["memory", "fakeredis", "file"])
+def backend(request, tmp_path):
+    spec = f"file:{tmp_path}" if request.param == "file" else request.param
+    return make_backend(spec)
+
+
+def test_backend_round_trip(backend):
+    assert backend.freshness() is None
+    assert backend.get_snapshot() is None
+
+    snapshot = _snapshot(7, 20000000, 1000.0)
+    backend.set_snapshot(snapshot)
+    assert backend.freshness() == snapshot.freshness == (20000000, 1000.0)
+    stored = backend.get_snapshot()
+    assert stored.freshness == snapshot.freshness
+    assert stored.stats == snapshot.stats
+
+
+def test_freshness_ignores_per_process_versions():
+    # Another host's counter is behind ours, but its data is newer
+    ours = _snapshot(50, 20000000, 1000.0)
+    theirs = _snapshot(3, 20000005, 990.0)
+    assert theirs.freshness > ours.freshness
+    # Same block: the later fetch wins
+    assert _snapshot(1, 20000000, 1001.0).freshness > ours.freshness
+
+
+def test_app_adopts_newer_snapshot_with_lower_version(app_module, monkeypatch):
+    backend = make_backend("memory")
+    monkeypatch.setattr(app_module, "_cache_backend", backend)
+    monkeypatch.setattr(app_module, "CACHE_BACKEND", "memory")
+    monkeypatch.setattr(app_module, "_snapshot", _snapshot(50, 20000000, 1000.0))
+
+    backend.set_snapshot(_snapshot(3, 20000000, 900.0))
+    assert app_module._adopt_backend_snapshot() is None
+
+    newer = _snapshot(3, 20000005, 990.0)
+    backend.set_snapshot(newer)
+    assert app_module._adopt_backend_snapshot() is newer
+    assert app_module._snapshot is newer
@@ -0,0 +1,44 @@
+import pytest
+
+pytest.importorskip("numpy")
+
+import columnar  # noqa: E402
+from builders import DEFAULT_ADDRESSES  # noqa: E402
+from models import normalize_trades  # noqa: E402
+from processing import StatsAccumulator, calculate_stats  # noqa: E402
+from synthetic import generate_trades  # noqa: E402
+
+
+def _assert_summaries_match(expected, actual):
+    assert [row["address"] for row in actual] == [row["address"] for row in expected]
+    assert columnar._summaries_match(expected, actual)
+
+
+@pytest.mark.parametrize("options", [
+    {},
+    {"rows_per_trade": 1},
+    {"rows_per_trade": 8, "dict_join_rate": 0.5},
+    {"builder_hit_rate": 1.0, "trades_per_block": 10},
+])
+def test_columnar_stats_match_the_accumulator(options):
+    trades = list(normalize_trades(generate_trades(3000, **options)))
+    expected = StatsAccumulator().update(trades).result()
+    actual = calculate_stats({"data": {"EVM": {"DEXTrades": trades}}}, columnar=True)
+
+    assert expected["builder_summary"]
+    _assert_summaries_match(expected["builder_summary"], actual["builder_summary"])
+    del expected["builder_summary"], actual["builder_summary"]
+    assert actual == expected
+
+
+def test_columnar_builder_subset():
+    addresses = DEFAULT_ADDRESSES[:3]
+    trades = list(normalize_trades(generate_trades(3000)))
+    expected = StatsAccumulator(addresses).update(trades).result()["builder_summary"]
+
+    assert 0 < len(expected) <= len(addresses)
+    _assert_summaries_match(expected, columnar.builder_summary(trades, addresses))
+
+
+def test_columnar_empty():
+    assert columnar.builder_summary([]) == StatsAccumulator().result()["builder_summary"] == []
@@ -0,0 +1,259 @@
+import json
+
+import pytest
+import requests
+
+import dataservice
+from dataservice import iter_dex_trades, merge_block_keys, splice_trades, trade_key, window_start_block
+from models import normalize_trades
+from processing import StatsAccumulator
+from synthetic import generate_trades
+
+
+def test_window_start_block_keeps_the_boundary_block():
+    counts = {100: 5, 101: 5, 102: 5}
+    assert window_start_block(counts, 10) == 101
+    # The limit falls inside block 100; it is kept whole
+    assert window_start_block(counts, 11) == 100
+    assert window_start_block(counts, 100) == 100
+    assert window_start_block({}, 10) is None
+
+
+def test_incremental_window_is_at_least_the_limit():
+    trades = sorted(generate_trades(3000), key=lambda trade: -int(trade["Block"]["Number"]))
+    counts = {}
+    for trade in trades:
+        number = int(trade["Block"]["Number"])
+        counts[number] = counts.get(number, 0) + 1
+    limit = 1000
+    start = window_start_block(counts, limit)
+    added, evicted = StatsAccumulator().merge(list(normalize_trades(trades)), start)
+    merged = splice_trades([], added, evicted)
+    assert len(merged) >= limit
+    # Only whole blocks past the boundary block are dropped
+    oldest_kept = min(trade.block_height for trade in merged)
+    assert oldest_kept == start
+    assert sum(count for number, count in counts.items() if number >= start) - counts[start] < limit
+
+
+def test_merge_block_keys_counts_each_trade_once():
+    counts, keys = merge_block_keys({10: 2}, {10: {("a", 1), ("a", 2)}}, {10: {("a", 2), ("b", 1)}, 11: {("c", 1)}})
+    assert counts == {10: 3, 11: 1}
+    assert keys[10] == {("a", 1), ("a", 2), ("b", 1)}
+
+
+def test_merge_block_keys_without_known_keys_keeps_the_larger_count():
+    # Blocks of a snapshot loaded from a file have counts but no keys
+    block_counts = {10: 5}
+    counts, keys = merge_block_keys(block_counts, {}, {10: {("a", 1), ("a", 2)}})
+    assert counts == {10: 5}
+    assert block_counts == {10: 5}
+    counts, _ = merge_block_keys(block_counts, {}, {10: {("a", index) for index in range(7)}})
+    assert counts == {10: 7}
+
+
+def _chunked(body, size):
+    return [body[start:start + size] for start in range(0, len(body), size)]
+
+
+def test_iter_dex_trades_across_chunk_boundaries():
+    trades = list(generate_trades(5))
+    trades[0]["Trade"]["Dex"]["ProtocolName"] = "ünïswap €😀"
+    body = json.dumps({"data": {"EVM": {"DEXTrades": trades}}}, ensure_ascii=False).encode()
+    # Every size from one byte on splits keys, numbers, escapes and multi-byte characters somewhere
+    for size in list(range(1, 17)) + [63, 64, 65, 1000, len(body)]:
+        assert list(iter_dex_trades(_chunked(body, size))) == trades, size
+
+
+def test_iter_dex_trades_empty_and_missing():
+    assert list(iter_dex_trades([b'{"data": {"EVM": {"DEXTrades": []}}}'])) == []
+    assert list(iter_dex_trades(_chunked(b'{"data": {"EVM": {"DEXTrades": [ ]}}}', 1))) == []
+    assert list(iter_dex_trades([b'{"data": {"EVM": {}}}'])) == []
+    assert list(iter_dex_trades([])) == []
+
+
+def test_iter_dex_trades_reports_graphql_errors(capsys):
+    body = b'{"data": {"EVM": {"DEXTrades": [{"a": 1}]}}, "errors": [{"message": "partial result"}]}'
+    for size in (1, 7, len(body)):
+        assert list(iter_dex_trades(_chunked(body, size))) == [{"a": 1}]
+        assert "partial result" in capsys.readouterr().out
+
+    body = b'{"errors": [{"message": "query too complex"}], "data": null}'
+    for size in (1, 7, len(body)):
+        with pytest.raises(RuntimeError, match="query too complex"):
+            list(iter_dex_trades(_chunked(body, size)))
+
+
+def test_iter_dex_trades_cut_off_body_raises():
+    for body in (b'{"data": {"EVM": {"DEXTrades": [{"a": 1}, {"b"', b'{"data": {"EVM": {"DEXTrades": [{"a": 1},'):
+        with pytest.raises(json.JSONDecodeError):
+            list(iter_dex_trades(_chunked(body, 5)))
+
+
+class _StubSession:
+    """Answers BitqueryClient.session.post() with the given status codes (or exceptions) in turn."""
+
+    def __init__(self, outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = 0
+
+    def post(self, url, **kwargs):
+        self.calls += 1
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        status, headers = outcome if isinstance(outcome, tuple) else (outcome, {})
+        response = requests.Response()
+        response.status_code = status
+        response.headers.update(headers)
+        response.url = url
+        response._content = b"{}"
+        response._content_consumed = True
+        return response
+
+    def close(self):
+        pass
+
+
+def _client(monkeypatch, outcomes, **kwargs):
+    sleeps = []
+    monkeypatch.setattr(dataservice.time, "sleep", sleeps.append)
+    client = dataservice.BitqueryClient(token="", backoff=1.0, max_delay=8.0, **kwargs)
+    client.session = _StubSession(outcomes)
+    return client, sleeps
+
+
+@pytest.mark.parametrize("status", [429, 500, 502, 503, 504])
+def test_client_retries_rate_limits_and_server_errors(monkeypatch, status):
+    client, sleeps = _client(monkeypatch, [status, requests.ConnectionError("reset"), 200], max_retries=3)
+
+    assert client.post("{}").status_code == 200
+    assert client.session.calls == 3
+    assert client.stats() == {"requests": 3, "retries": 2, "failures": 0}
+    # Jittered exponential backoff: half to all of 1s, then of 2s
+    assert 0.5 <= sleeps[0] <= 1.0 and 1.0 <= sleeps[1] <= 2.0
+
+
+def test_client_gives_up_after_max_retries(monkeypatch):
+    client, sleeps = _client(monkeypatch, [503] * 10, max_retries=3)
+
+    with pytest.raises(requests.HTTPError):
+        client.post("{}")
+    assert client.session.calls == 4
+    assert len(sleeps) == 3 and all(delay <= 8.0 for delay in sleeps)
+    assert client.stats() == {"requests": 4, "retries": 3, "failures": 1}
+
+
+@pytest.mark.parametrize("status", [400, 401, 403, 404])
+def test_client_does_not_retry_client_errors(monkeypatch, status):
+    client, sleeps = _client(monkeypatch, [status, 200], max_retries=3)
+
+    with pytest.raises(requests.HTTPError):
+        client.post("{}")
+    assert client.session.calls == 1 and sleeps == []
+    assert client.stats() == {"requests": 1, "retries": 0, "failures": 1}
+
+
+def test_client_honours_retry_after(monkeypatch):
+    client, sleeps = _client(monkeypatch, [(429, {"Retry-After": "3"}), (429, {"Retry-After": "60"}), 200])
+
+    assert client.post("{}").status_code == 200
+    # Capped at max_delay
+    assert sleeps == [3.0, 8.0]
+
+
+def test_client_deadline_stops_retries(monkeypatch):
+    client, sleeps = _client(monkeypatch, [(503, {"Retry-After": "5"}), 200], deadline=2.0)
+
+    with pytest.raises(requests.HTTPError):
+        client.post("{}")
+    assert client.session.calls == 1 and sleeps == []
+
+
+def _block_counts(trades):
+    counts = {}
+    for trade in trades:
+        number = int(trade["Block"]["Number"])
+        counts[number] = counts.get(number, 0) + 1
+    return counts
+
+
+@pytest.mark.parametrize("shards", [2, 3, 4, 7])
+@pytest.mark.parametrize("trades_per_block", [1, 10, 150])
+def test_block_shards_cover_the_window_without_overlap(shards, trades_per_block):
+    counts = _block_counts(generate_trades(3000, trades_per_block=trades_per_block))
+    limit = 2000
+    plan = dataservice.plan_shards(shards, block_counts=counts, limit=limit)
+
+    assert 2 <= len(plan) <= shards
+    # (since, until] ranges, each starting where the previous one ends; the top one is open
+    start = window_start_block(counts, limit)
+    assert plan[0].since_block == start - 1
+    for lower, upper in zip(plan, plan[1:]):
+        assert lower.since_block < lower.until_block == upper.since_block
+    assert plan[-1].until_block is None and plan[-2].until_block == max(counts)
+    # Every block of the window falls in exactly one shard
+    for number in counts:
+        owners = [
+            shard for shard in plan
+            if shard.since_block < number and (shard.until_block is None or number <= shard.until_block)
+        ]
+        assert len(owners) == (1 if number >= start else 0), number
+
+
+def test_single_shard_without_counts_or_for_a_delta():
+    assert dataservice.plan_shards(4) == [dataservice.Shard()]
+    assert dataservice.plan_shards(4, since_block=10, block_counts={11: 5}) == [dataservice.Shard(10)]
+
+
+def test_builder_shards_partition_the_addresses():
+    addresses = [f"0x{i:040x}" for i in range(10)]
+    plan = dataservice.plan_shards(3, by="builders", addresses=addresses, since_block=5)
+
+    assert len(plan) == 3 and all(shard.since_block == 5 for shard in plan)
+    assert sorted(address for shard in plan for address in shard.addresses) == addresses
+    with pytest.raises(ValueError):
+        dataservice.plan_shards(3, by="builders")
+
+
+def _newest_first_keys(trades):
+    return [trade_key(trade) for trade in sorted(trades, key=dataservice._trade_position, reverse=True)]
+
+
+def test_merge_shard_trades_dedupes_boundary_trades_and_unions_rows():
+    trades = list(generate_trades(300, trades_per_block=30))
+    boundary = int(trades[150]["Block"]["Number"])
+    newer = [trade for trade in trades if int(trade["Block"]["Number"]) >= boundary]
+    older = [trade for trade in trades if int(trade["Block"]["Number"]) <= boundary]
+
+    merged = dataservice.merge_shard_trades([older, newer])
+    assert [trade_key(trade) for trade in merged] == _newest_first_keys(trades)
+    assert dataservice.merge_shard_trades([older, newer], limit=100) == merged[:100]
+
+    # Builder shards: the same trade, each with its own balance rows
+    rows = [{"TokenBalance": {"Address": f"0x{i}", "PreBalance": "1", "PostBalance": "2"}} for i in range(3)]
+    first = {**trades[0], "joinTransactionBalances": rows[:2]}
+    second = {**trades[0], "joinTransactionBalances": rows[1:]}
+    (combined,) = dataservice.merge_shard_trades([[first], [second]])
+    assert combined["joinTransactionBalances"] == rows
+
+
+def test_fetch_sharded_matches_a_single_query(monkeypatch):
+    trades = list(generate_trades(3000, trades_per_block=25))
+    limit = 2000
+
+    def stream(limit, since_block=None, addresses=None, until_block=None):
+        # Both ends inclusive, as if the API also returned the boundary block twice
+        matching = [
+            trade for trade in trades
+            if (since_block is None or int(trade["Block"]["Number"]) >= since_block)
+            and (until_block is None or int(trade["Block"]["Number"]) <= until_block)
+        ]
+        return iter(matching[:limit])
+
+    monkeypatch.setattr(dataservice, "stream_transaction_balances", stream)
+    plan = dataservice.plan_shards(4, block_counts=_block_counts(trades), limit=limit)
+    fetched = dataservice.fetch_sharded(plan, limit=limit)["data"]["EVM"]["DEXTrades"]
+
+    # limit falls on a block boundary, so the newest limit trades are the same set
+    assert [trade_key(trade) for trade in fetched] == _newest_first_keys(trades[:limit])
@@ -0,0 +1,62 @@
+import pytest
+
+import fields
+from fields import parse_selection, project, selection, union
+from processing import calculate_stats, process_builder_trades, process_trade_details
+from synthetic import generate_trades
+
+
+def test_dashboard_projection_keeps_what_the_dashboard_reads():
+    full = list(generate_trades(2000, dict_join_rate=0.3))
+    lean = project(full, union(["dashboard"]))
+
+    full_stats = calculate_stats({"data": {"EVM": {"DEXTrades": full}}})
+    assert calculate_stats({"data": {"EVM": {"DEXTrades": lean}}}) == full_stats
+    assert full_stats["builder_summary"]
+    for row in full_stats["builder_summary"]:
+        assert process_builder_trades(lean, row["address"]) == process_builder_trades(full, row["address"])
+
+
+def test_drill_down_projection_keeps_the_details():
+    full = list(generate_trades(500))
+    details = project(full, union(["drill_down"]))
+    assert [process_trade_details(trade) for trade in details] == [process_trade_details(trade) for trade in full]
+
+
+@pytest.mark.parametrize("names", [["dashboard"], ["drill_down"], ["dashboard", "drill_down"]])
+def test_selection_round_trips_through_parse_selection(names):
+    paths = union(names)
+    query = (
+        '{ EVM { DEXTrades(limit: {count: 10}, where: {Block: {Number: {in: [1, 2]}}}) {\n'
+        + selection(paths, {"joinTransactionBalances": "join: inner, where: {TokenBalance: {Address: {in: [\"0x1\"]}}}"})
+        + "\n} } }"
+    )
+    assert set(parse_selection(query)) == set(paths)
+    assert parse_selection(query, "Missing") == ()
+
+
+def test_union_starts_with_the_identity_fields_once():
+    paths = union(["dashboard", "dashboard"])
+    assert paths[:len(fields.IDENTITY_FIELDS)] == fields.IDENTITY_FIELDS
+    assert len(paths) == len(set(paths))
+    with pytest.raises(KeyError):
+        union(["no such set"])
+
+
+@pytest.mark.parametrize("path", ["", "Block.", ".Number", "Block..Number"])
+def test_register_rejects_empty_path_parts(path):
+    with pytest.raises(ValueError):
+        fields.register("test_invalid", (path,))
+    assert "test_invalid" not in fields.FIELD_SETS
+
+
+def test_project_handles_lists_and_dicts_of_items():
+    trade = {
+        "Block": {"Number": "1", "Time": "t"},
+        "joinTransactionBalances": {"0": {"TokenBalance": {"Address": "a", "PreBalance": "1"}}},
+    }
+    assert project(trade, ["Block.Number", "joinTransactionBalances.TokenBalance.Address"]) == {
+        "Block": {"Number": "1"},
+        "joinTransactionBalances": {"0": {"TokenBalance": {"Address": "a"}}},
+    }
+    assert project([trade], ["Block.Time"]) == [{"Block": {"Time": "t"}}]
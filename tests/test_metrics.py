@@ -0,0 +1,55 @@
+import pytest
+
+from metrics import Registry
+
+
+def test_render_counters_and_gauges():
+    registry = Registry(prefix="test_")
+    requests = registry.counter("requests_total", "Requests served")
+    requests.inc(result="hit")
+    requests.inc(2, result="hit")
+    requests.inc(result='a "quoted"\nvalue')
+    registry.gauge("subscribers", "Open streams").set(2.5)
+    registry.counter("callback_total", callback=lambda: {(("kind", "x"),): 7, (("kind", "y"),): None})
+
+    assert registry.render() == (
+        "# TYPE test_callback_total counter\n"
+        'test_callback_total{kind="x"} 7\n'
+        "# HELP test_requests_total Requests served\n"
+        "# TYPE test_requests_total counter\n"
+        'test_requests_total{result="hit"} 3\n'
+        'test_requests_total{result="a \\"quoted\\"\\nvalue"} 1\n'
+        "# HELP test_subscribers Open streams\n"
+        "# TYPE test_subscribers gauge\n"
+        "test_subscribers 2.5\n"
+    )
+
+
+def test_render_histogram_buckets_are_cumulative():
+    registry = Registry(prefix="test_")
+    latency = registry.histogram("latency_seconds", "Latency", buckets=(0.1, 1))
+    for value in (0.05, 0.5, 0.5, 3.0):
+        latency.observe(value, route="/")
+
+    assert registry.render() == (
+        "# HELP test_latency_seconds Latency\n"
+        "# TYPE test_latency_seconds histogram\n"
+        'test_latency_seconds_bucket{route="/",le="0.1"} 1\n'
+        'test_latency_seconds_bucket{route="/",le="1"} 3\n'
+        'test_latency_seconds_bucket{route="/",le="+Inf"} 4\n'
+        'test_latency_seconds_sum{route="/"} 4.05\n'
+        'test_latency_seconds_count{route="/"} 4\n'
+    )
+
+
+def test_a_name_keeps_its_kind():
+    registry = Registry(prefix="test_")
+    assert registry.counter("events_total") is registry.counter("events_total")
+    with pytest.raises(ValueError):
+        registry.gauge("events_total")
+
+
+def test_failing_callback_is_skipped():
+    registry = Registry(prefix="test_")
+    registry.gauge("broken", callback=lambda: 1 / 0)
+    assert registry.render() == "# TYPE test_broken gauge\n"
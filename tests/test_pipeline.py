@@ -0,0 +1,111 @@
+import pytest
+
+import builders as builder_registry
+from builders import DEFAULT_ADDRESSES
+from dataservice import tally_blocks
+from filter import filter_trades_by_addresses
+from pipeline import IngestPass
+from processing import calculate_stats, process_builder_trades
+from snapshot import Snapshot, build_address_index
+from synthetic import generate_trades
+
+
+def _separate_stages(raw):
+    """The stages IngestPass replaces, one after another."""
+    block_counts = {}
+    data = {"data": {"EVM": {"DEXTrades": list(tally_blocks(raw, block_counts))}}}
+    trades = filter_trades_by_addresses(data)["data"]["EVM"]["DEXTrades"]
+    stats = calculate_stats({"data": {"EVM": {"DEXTrades": trades}}})
+    return trades, block_counts, stats, build_address_index(trades)
+
+
+def _keys(index):
+    return {address: [trade.key for trade in trades] for address, trades in index.items()}
+
+
+def _assert_matches_separate_stages(raw, registry=None):
+    trades, block_counts, stats, index = _separate_stages(raw)
+    ingest = IngestPass(registry).feed(raw)
+
+    assert [trade.to_row() for trade in ingest.trades] == [trade.to_row() for trade in trades]
+    assert ingest.block_counts == block_counts
+    assert ingest.accumulator.result() == stats
+    assert _keys(ingest.builder_index) == _keys(index)
+
+    snapshot = Snapshot(
+        {"data": {"EVM": {"DEXTrades": ingest.trades}}}, 1, block_counts=ingest.block_counts,
+        block_keys=ingest.block_keys, accumulator=ingest.accumulator, builder_index=ingest.builder_index,
+    )
+    assert snapshot.stats == stats
+    for row in stats["builder_summary"]:
+        address = row["address"]
+        expected = process_builder_trades(index[address.lower()], address)
+        assert snapshot.builder_rows(address) == expected, address
+    return ingest
+
+
+@pytest.mark.parametrize("options", [
+    {},
+    {"rows_per_trade": 1},
+    {"rows_per_trade": 8, "dict_join_rate": 0.5},
+    {"builder_hit_rate": 1.0, "trades_per_block": 10},
+])
+def test_single_pass_matches_the_separate_stages(options):
+    ingest = _assert_matches_separate_stages(list(generate_trades(3000, **options)))
+    assert ingest.trades and ingest.accumulator.result()["builder_summary"]
+
+
+def test_single_pass_accepts_trade_records():
+    from models import normalize_trades
+
+    _assert_matches_separate_stages(list(normalize_trades(generate_trades(2000))))
+
+
+def test_single_pass_with_a_builder_subset(monkeypatch):
+    registry = builder_registry.resolve(DEFAULT_ADDRESSES[:3])
+    # The separate stages read the current registry
+    monkeypatch.setattr(builder_registry, "get_registry", lambda: registry)
+
+    ingest = _assert_matches_separate_stages(list(generate_trades(3000)), registry)
+    summary = ingest.accumulator.result()["builder_summary"]
+    assert 0 < len(summary) <= 3
+    assert {row["address"].lower() for row in summary} <= {address.lower() for address in DEFAULT_ADDRESSES[:3]}
+    assert len(ingest.trades) < len(IngestPass(DEFAULT_ADDRESSES).feed(generate_trades(3000)).trades)
+
+
+def test_single_pass_empty():
+    ingest = _assert_matches_separate_stages([])
+    assert ingest.trades == [] and ingest.block_counts == {} and ingest.builder_index == {}
+
+
+def test_delta_pass_only_filters():
+    raw = list(generate_trades(2000))
+    delta = IngestPass(aggregate=False).feed(raw)
+
+    assert delta.accumulator is None and delta.builder_index is None
+    assert [trade.to_row() for trade in delta.trades] == [trade.to_row() for trade in _separate_stages(raw)[0]]
+
+
+def test_raw_trades_are_matched_like_trade_records():
+    from models import Trade, involves_any
+
+    by_address = builder_registry.get_registry().by_address
+    raw = list(generate_trades(2000, dict_join_rate=0.5))
+    raw += [{}, {"joinTransactionBalances": None}, {"joinTransactionBalances": [{"TokenBalance": None}, "x"]}]
+
+    assert [involves_any(trade, by_address) for trade in raw] == [
+        involves_any(Trade(trade), by_address) for trade in raw
+    ]
+
+
+def test_only_kept_trades_are_normalized(monkeypatch):
+    import pipeline
+
+    normalized = []
+    normalize_trade = pipeline.normalize_trade
+    monkeypatch.setattr(pipeline, "normalize_trade", lambda raw: normalized.append(raw) or normalize_trade(raw))
+
+    raw = list(generate_trades(2000))
+    ingest = IngestPass().feed(raw)
+    assert len(normalized) == len(ingest.trades) < len(raw)
+    assert sum(ingest.block_counts.values()) == len(raw)
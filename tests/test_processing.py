@@ -0,0 +1,107 @@
+import pytest
+
+from models import normalize_trades
+from processing import StatsAccumulator
+from synthetic import generate_trades
+
+
+def test_copy_is_independent():
+    trades = list(normalize_trades(generate_trades(1500)))
+    accumulator = StatsAccumulator().update(trades[:1000])
+    before = accumulator.result()
+
+    copied = accumulator.copy()
+    for trade in trades[:200]:
+        copied.remove(trade)
+    for trade in trades[1000:]:
+        copied.add(trade)
+
+    assert accumulator.result() == before
+    assert copied.result() != before
+
+
+def _assert_close(actual, expected):
+    # Running sums after add/remove cycles differ from a fresh sum in the last bits
+    if isinstance(expected, float):
+        assert actual == pytest.approx(expected, rel=1e-9, abs=1e-6)
+    elif isinstance(expected, dict):
+        assert set(actual) == set(expected)
+        for key in expected:
+            _assert_close(actual[key], expected[key])
+    elif isinstance(expected, list):
+        assert len(actual) == len(expected)
+        for item, expected_item in zip(actual, expected):
+            _assert_close(item, expected_item)
+    else:
+        assert actual == expected
+
+
+def _window(limit=2000, batch=100):
+    """A window of limit trades and the newer batches that follow it, newest first."""
+    from dataservice import window_start_block
+
+    trades = list(normalize_trades(generate_trades(limit + 5 * batch, trades_per_block=20)))
+    window, newer = trades[5 * batch:], trades[:5 * batch]
+    batches = [newer[start - batch:start] for start in range(len(newer), 0, -batch)]
+
+    def start_block(accumulator):
+        counts = {number: len(trades) for number, trades in accumulator.block_trades.items()}
+        return window_start_block(counts, limit)
+
+    return window, batches, start_block
+
+
+def test_merge_matches_a_fresh_window():
+    from dataservice import splice_trades
+    from snapshot import build_address_index
+
+    window, batches, start_block = _window()
+    accumulator = StatsAccumulator().update(window)
+    accumulator.result()
+    for batch in batches:
+        published = accumulator
+        accumulator = published.copy()
+        # Half the batch again, as an overlapping subscription batch would deliver it
+        added, _ = accumulator.merge(batch + batch[:50])
+        assert added == batch
+        redelivered, evicted = accumulator.merge(batch[50:], start_block(accumulator))
+        assert redelivered == [] and evicted
+        window = splice_trades(window, added, evicted)
+        before = published.result()
+
+        fresh = StatsAccumulator().update(window)
+        _assert_close(accumulator.result(), fresh.result())
+        assert accumulator.index == build_address_index(window)
+        # The copy it was made from is unchanged
+        assert published.result() == before
+
+    copied = accumulator.copy()
+    for trade in window[:100]:
+        copied.remove(trade)
+    assert copied.index == build_address_index(window[100:])
+    assert accumulator.index == build_address_index(window)
+
+
+def test_merge_work_is_bounded_by_the_delta(monkeypatch):
+    import heapq
+
+    window, batches, start_block = _window(limit=20000, batch=30)
+    accumulator = StatsAccumulator().update(window)
+    accumulator.result()
+
+    applied = []
+    apply = StatsAccumulator._apply
+    monkeypatch.setattr(StatsAccumulator, "_apply", lambda self, trade, *args: applied.append(trade) or apply(self, trade, *args))
+    heapified = []
+    monkeypatch.setattr(heapq, "heapify", heapified.append)
+    for batch in batches:
+        accumulator = accumulator.copy()
+        del applied[:]
+        added, evicted = accumulator.merge(batch, start_block(accumulator))
+        accumulator.result()
+        # Each trade added or evicted is folded in once, and result() reads
+        # the top 10s from the heaps instead of rebuilding them
+        assert len(applied) == len(added) + len(evicted) <= 2 * len(batch) + 20
+        assert not heapified
+        # Containers copied on write: only the ones the delta touched
+        assert len(accumulator._owned) <= 20 * (len(added) + len(evicted))
@@ -0,0 +1,80 @@
+import threading
+import time
+
+import pytest
+
+from singleflight import SingleFlight
+
+
+def _run_concurrently(count, target):
+    results = [None] * count
+    errors = [None] * count
+
+    def run(i):
+        try:
+            results[i] = target()
+        except Exception as e:
+            errors[i] = e
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+    return results, errors
+
+
+def _blocking(flight, callers, calls, outcome):
+    """A function that records its calls and returns (or raises) once every other caller waits on it."""
+    def fn():
+        calls.append(threading.current_thread().name)
+        deadline = time.monotonic() + 5
+        while flight.stats()["waiting"] < callers - 1 and time.monotonic() < deadline:
+            time.sleep(0.001)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+    return fn
+
+
+def test_concurrent_callers_share_one_execution():
+    flight = SingleFlight()
+    calls = []
+    fn = _blocking(flight, 16, calls, "snapshot")
+
+    results, errors = _run_concurrently(16, lambda: flight.do("key", fn))
+
+    assert len(calls) == 1 and errors == [None] * 16
+    assert sorted(results) == [("snapshot", False)] + [("snapshot", True)] * 15
+    assert flight.stats() == {"executions": 1, "coalesced": 15, "in_flight": 0, "waiting": 0}
+
+
+def test_concurrent_callers_share_the_exception():
+    flight = SingleFlight()
+    calls = []
+    error = RuntimeError("fetch failed")
+
+    results, errors = _run_concurrently(8, lambda: flight.do("key", _blocking(flight, 8, calls, error)))
+
+    assert len(calls) == 1 and errors == [error] * 8
+
+
+def test_key_is_released_after_each_call():
+    flight = SingleFlight()
+    assert flight.do("key", lambda: 1) == (1, False)
+    assert flight.do("key", lambda: 2) == (2, False)
+    with pytest.raises(ValueError):
+        flight.do("key", lambda: int("x"))
+    assert flight.do("key", lambda: 3) == (3, False)
+    assert flight.stats()["executions"] == 4 and flight.stats()["in_flight"] == 0
+
+
+def test_concurrent_refreshes_fetch_once(app_module, monkeypatch):
+    monkeypatch.setattr(app_module, "_fetch_flight", SingleFlight())
+    calls = []
+    fetch = _blocking(app_module._fetch_flight, 12, calls, "snapshot")
+    monkeypatch.setattr(app_module, "_do_fetch_and_store", lambda full, fresh_after: fetch())
+
+    results, errors = _run_concurrently(12, app_module._fetch_and_store)
+
+    assert len(calls) == 1 and results == ["snapshot"] * 12 and errors == [None] * 12
@@ -0,0 +1,111 @@
+import pytest
+
+from models import normalize_trades
+from pipeline import IngestPass
+from snapshot import Snapshot, format_cursor, parse_cursor
+from synthetic import generate_trades
+
+
+def _snapshot(raw):
+    ingest = IngestPass().feed(raw)
+    return Snapshot(
+        {"data": {"EVM": {"DEXTrades": ingest.trades}}}, 1, block_counts=ingest.block_counts,
+        accumulator=ingest.accumulator,
+    )
+
+
+def _pages(snapshot, address, limit, cursor=None):
+    """Every page from cursor on, as lists of (tx_hash, log_index)."""
+    pages = []
+    while True:
+        rows, cursor, total = snapshot.builder_page(address, cursor, limit)
+        pages.append([(row["tx_hash"], row["log_index"]) for row in rows])
+        if cursor is None:
+            return pages, total
+
+
+def _busiest_builder(snapshot):
+    return max(snapshot.stats["builder_summary"], key=lambda row: row["total_transactions"])["address"]
+
+
+@pytest.mark.parametrize("limit", [1, 7, 50, 1000])
+def test_builder_pages_cover_every_trade_once(limit):
+    snapshot = _snapshot(generate_trades(3000))
+    address = _busiest_builder(snapshot)
+    trades = sorted(snapshot.builder_trades(address), key=lambda trade: trade.position, reverse=True)
+
+    pages, total = _pages(snapshot, address, limit)
+    assert total == len(trades) > limit or limit == 1000
+    assert all(len(page) == limit for page in pages[:-1]) and 0 < len(pages[-1]) <= limit
+    assert [key for page in pages for key in page] == [trade.key for trade in trades]
+
+
+def test_builder_pages_stay_put_when_new_trades_arrive():
+    raw = list(generate_trades(3000))
+    before = _snapshot(raw[1000:])
+    address = _busiest_builder(before)
+    first, cursor, _ = before.builder_page(address, None, 20)
+    assert cursor is not None
+
+    # Newer blocks arrive; the next page continues where the first one ended
+    after = _snapshot(raw)
+    assert after.builder_page(address, None, 20)[2] > before.builder_page(address, None, 20)[2]
+    assert _pages(after, address, 20, cursor)[0] == _pages(before, address, 20, cursor)[0]
+
+
+def test_cursor_round_trip():
+    trade = next(iter(normalize_trades(generate_trades(1))))
+    assert parse_cursor(format_cursor(trade)) == trade.position
+
+
+@pytest.mark.parametrize("cursor", ["x", "1.2", "1.2.3.4", "1..2", "1.2.x", "."])
+def test_malformed_cursor_is_rejected(cursor):
+    with pytest.raises(ValueError):
+        parse_cursor(cursor)
+    snapshot = _snapshot(generate_trades(500))
+    with pytest.raises(ValueError):
+        snapshot.builder_page(_busiest_builder(snapshot), cursor)
+
+
+def _round_trips(snapshot, tmp_path):
+    path = str(tmp_path / "snapshot.bin")
+    snapshot.save(path)
+    for lazy in (False, True):
+        yield Snapshot.load(path, lazy=lazy)
+        yield Snapshot.from_bytes(snapshot.to_bytes(), lazy=lazy)
+
+
+def test_save_load_round_trip(tmp_path):
+    snapshot = _snapshot(generate_trades(2000))
+    address = _busiest_builder(snapshot)
+    for loaded in _round_trips(snapshot, tmp_path):
+        assert loaded.stats == snapshot.stats
+        assert (loaded.version, loaded.fetched_at, loaded.block_cursor) == (
+            snapshot.version, snapshot.fetched_at, snapshot.block_cursor
+        )
+        assert loaded.registry_version == snapshot.registry_version
+        assert {int(block): count for block, count in loaded.block_counts.items()} == snapshot.block_counts
+        # Per-builder sections first (lazy), then the decoded trades and index
+        assert [trade.key for trade in loaded.builder_trades(address)] == [
+            trade.key for trade in snapshot.builder_trades(address)
+        ]
+        assert loaded.builder_page(address, None, 25) == snapshot.builder_page(address, None, 25)
+        assert [trade.key for trade in loaded.trades] == [trade.key for trade in snapshot.trades]
+        assert {key: [trade.key for trade in trades] for key, trades in loaded.builder_index.items()} == {
+            key: [trade.key for trade in trades] for key, trades in snapshot.builder_index.items()
+        }
+
+
+def test_saved_builders_are_the_snapshots_own(monkeypatch, tmp_path):
+    import builders as builder_registry
+    import store
+
+    snapshot = _snapshot(generate_trades(2000))
+    summary = [row["address"].lower() for row in snapshot.stats["builder_summary"]]
+    # A registry reloaded since the snapshot was built doesn't change what it saves
+    other = builder_registry.BuilderRegistry.from_addresses(["0x" + "11" * 20])
+    monkeypatch.setattr(builder_registry, "get_registry", lambda: other)
+    path = str(tmp_path / "snapshot.bin")
+    snapshot.save(path)
+    with store.open_snapshot_file(path) as snapshot_file:
+        assert snapshot_file.header["builders"] == summary
@@ -0,0 +1,56 @@
+import time
+
+import pytest
+
+pytest.importorskip("websockets")
+
+from dataservice import block_number, trade_key  # noqa: E402
+from mock_subscription import MockSubscriptionServer  # noqa: E402
+from subscription import SubscriptionIngestor  # noqa: E402
+from synthetic import generate_trades  # noqa: E402
+
+
+def test_last_block_advances_only_once_a_batch_is_ingested():
+    trades = list(generate_trades(20, start_block=105))
+
+    def fail(batch):
+        raise ValueError("ingest failed")
+
+    ingestor = SubscriptionIngestor(fail, url="ws://127.0.0.1:1/graphql", token="", since_block=100)
+    with pytest.raises(RuntimeError):
+        ingestor._deliver(trades)
+    assert ingestor.last_block == 100
+
+    ingestor.on_trades = lambda batch: None
+    ingestor._deliver(trades)
+    assert ingestor.last_block == 105
+
+
+def test_batches_the_consumer_rejected_are_backfilled():
+    server = MockSubscriptionServer(port=0, rate=10, trades_per_block=10).start()
+    received = {}
+    calls = []
+
+    def collect(trades):
+        calls.append(len(trades))
+        if len(calls) in (2, 3):
+            raise RuntimeError("ingest failed")
+        for trade in trades:
+            received[trade_key(trade)] = trade
+
+    ingestor = SubscriptionIngestor(
+        collect, backfill=server.trades_since, url=server.url, token="",
+        since_block=server.next_block - 1, flush_interval=0.2, max_reconnect_delay=0.5,
+    )
+    ingestor.start()
+    try:
+        deadline = time.monotonic() + 10
+        while time.monotonic() < deadline and (len(calls) < 6 or ingestor.connects < 2):
+            time.sleep(0.1)
+    finally:
+        ingestor.stop()
+        server.stop()
+
+    assert ingestor.connects >= 2
+    expected = {trade_key(trade) for trade in server.history if block_number(trade) <= ingestor.last_block}
+    assert expected and expected <= set(received)